@@ -1,16 +1,40 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 import numpy as np
 from PIL import Image
-import tensorflow as tf
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import os
 import requests
 import json
+import functools
+import hashlib
+import threading
+import queue
+import random
+import time
+import uuid
+import re
+import sqlite3
+import tempfile
+from collections import OrderedDict, defaultdict, deque
+from email.utils import parsedate_to_datetime
 import pandas as pd
 
+# Scan validation, preprocessing and the model backends live in neuroscan.py (no Streamlit)
+from neuroscan import (
+    LABEL_MAP, STAGE_DATA, MODEL_BACKEND, MODEL_PATH, MODEL_SOCKET, DECODE_WORKERS,
+    DecodePool, RemoteModel, load_backend, score_images,
+    model_fingerprint as weights_fingerprint,
+)
+# Symptom log columns and trend facts live in symptoms.py (so SymptomColumns survives reruns)
+from symptoms import (
+    SYMPTOM_COLUMNS, SYMPTOM_TEXT_COLUMNS, SYMPTOM_SCORES, TREND_RECENT,
+    SymptomColumns, symptom_trends,
+)
+
 # ── Page config ────────────────────────────────────────────────
 st.set_page_config(
     page_title="NeuroScan AI",
@@ -105,192 +129,155 @@ footer { display: none !important; }
 """, unsafe_allow_html=True)
 
 # ── Constants ──────────────────────────────────────────────────
-LABEL_MAP = {
-    0: "NonDemented",
-    1: "VeryMildDemented",
-    2: "MildDemented",
-    3: "ModerateDemented",
-}
+# (model, batch size, validation settings and STAGE_DATA: see neuroscan.py)
+
+# Outgoing mail server (point at a local test server with NEUROSCAN_SMTP_SSL=0)
+SMTP_HOST     = os.environ.get("NEUROSCAN_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT     = int(os.environ.get("NEUROSCAN_SMTP_PORT", "465"))
+SMTP_USE_SSL  = os.environ.get("NEUROSCAN_SMTP_SSL", "1") == "1"
+EMAIL_WORKERS = int(os.environ.get("NEUROSCAN_EMAIL_WORKERS", "2"))
+EMAIL_RATE    = float(os.environ.get("NEUROSCAN_EMAIL_RATE", "5"))    # max emails/second, 0 = unlimited
+
+# Groq (OpenAI-compatible) chat API — point NEUROSCAN_GROQ_URL at a local mock for testing
+GROQ_URL     = os.environ.get("NEUROSCAN_GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_MODEL   = "llama-3.3-70b-versatile"
+GROQ_TIMEOUT = float(os.environ.get("NEUROSCAN_GROQ_TIMEOUT", "30"))
+GROQ_RETRIES = int(os.environ.get("NEUROSCAN_GROQ_RETRIES", "3"))    # extra attempts on 429/5xx/connection errors
+GROQ_STREAM  = os.environ.get("NEUROSCAN_GROQ_STREAM", "1") == "1"    # stream chatbot replies token by token
+
+# Answers to first-turn chatbot questions, per stage, kept on disk (size 0 = off)
+CHAT_CACHE_PATH = os.environ.get("NEUROSCAN_CHAT_CACHE",
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_cache.sqlite3"))
+CHAT_CACHE_SIZE = int(os.environ.get("NEUROSCAN_CHAT_CACHE_SIZE", "500"))
+CHAT_CACHE_TTL  = float(os.environ.get("NEUROSCAN_CHAT_CACHE_TTL", str(7 * 24 * 3600)))    # seconds
+
+# Symptom Tracker logs. Unset: each browser session keeps its own, in memory, so visitors of a
+# public deployment never see each other's patients. Set it to a SQLite file to share the logs
+# between every session (and app replica) — only for deployments restricted to one clinic.
+SYMPTOM_DB_PATH = os.environ.get("NEUROSCAN_SYMPTOM_DB", "")
+# Rows per chunk for bulk CSV/Parquet import and export (one chunk in memory at a time)
+SYMPTOM_CHUNK_ROWS = int(os.environ.get("NEUROSCAN_SYMPTOM_CHUNK", "20000"))
+
+# Conversation history sent per chatbot turn (estimated tokens); older turns are summarized
+CHAT_TOKEN_BUDGET = int(os.environ.get("NEUROSCAN_CHAT_BUDGET", "3000"))
+
+# Max scans whose validation + probabilities are remembered (~1 KB each)
+PREDICTION_CACHE_SIZE = int(os.environ.get("NEUROSCAN_CACHE_SIZE", "2048"))
 
-STAGE_DATA = {
-    "NonDemented": {
-        "label": "Non-Demented", "emoji": "🟢", "color": "#4ade80", "bg": "#052e16",
-        "description": "No signs of Alzheimer's detected. Brain function appears normal. Preventive supplementation is recommended to maintain cognitive health.",
-        "urgency": "Preventive Care",
-        "supplements": [
-            {"name": "Omega-3 (Fish Oil)",  "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Supports brain cell membrane integrity and cognitive longevity",            "type": "nutrient"},
-            {"name": "Beta-Carotene",       "dose": "2 mg",    "times": ["8:00 AM"],  "purpose": "Antioxidant precursor to Vitamin A; protects neurons",          "type": "nutrient"},
-            {"name": "Vitamin E",           "dose": "100 IU",  "times": ["1:00 PM"],  "purpose": "Neuroprotective antioxidant; protects cell membranes",     "type": "nutrient"},
-            {"name": "Choline",             "dose": "200 mg",  "times": ["8:00 AM"],  "purpose": "Precursor to acetylcholine; supports memory and learning",          "type": "nutrient"},
-            {"name": "Vitamin B12",         "dose": "250 mcg", "times": ["8:00 AM"],  "purpose": "Reduces homocysteine; supports myelin sheath and nerve conduction",            "type": "nutrient"},
-            {"name": "Curcumin (Turmeric)", "dose": "250 mg",  "times": ["8:00 PM"],  "purpose": "Mild anti-inflammatory; early amyloid plaque prevention", "type": "nutrient"},
-        ],
-    },
-    "VeryMildDemented": {
-        "label": "Very Mild Demented", "emoji": "🟡", "color": "#facc15", "bg": "#1c1400",
-        "description": "Very early-stage cognitive changes detected. Lifestyle modifications and increased nutritional support can significantly slow progression.",
-        "urgency": "Early Intervention Recommended",
-        "supplements": [
-            {"name": "Omega-3 (Fish Oil)",  "dose": "500 mg",  "times": ["8:00 AM"],  "purpose": "Reduces neuroinflammation; supports synaptic plasticity",           "type": "nutrient"},
-            {"name": "Vitamin E",           "dose": "200 IU",  "times": ["1:00 PM"],  "purpose": "Slows oxidative damage to neurons in early-stage decline",    "type": "nutrient"},
-            {"name": "Choline",             "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Boosts acetylcholine production for memory preservation",           "type": "nutrient"},
-            {"name": "Vitamin B12",         "dose": "500 mcg", "times": ["8:00 AM"],  "purpose": "Slows brain atrophy linked to B12 deficiency in early decline",          "type": "nutrient"},
-            {"name": "Curcumin (Turmeric)", "dose": "500 mg",  "times": ["8:00 PM"],  "purpose": "Anti-inflammatory; begins inhibiting amyloid-beta aggregation", "type": "nutrient"},
-        ],
-    },
-    "MildDemented": {
-        "label": "Mild Demented", "emoji": "🟠", "color": "#fb923c", "bg": "#1c0800",
-        "description": "Mild cognitive decline detected. Intensified nutritional protocol recommended alongside neurologist consultation.",
-        "urgency": "Medical Attention Required",
-        "supplements": [
-            {"name": "Omega-3 (Fish Oil)",  "dose": "500 mg",  "times": ["8:00 AM"],  "purpose": "DHA and EPA support for slowing grey matter loss and inflammation",      "type": "nutrient"},
-            {"name": "Vitamin E",           "dose": "200 IU",  "times": ["1:00 PM"],  "purpose": "Neuroprotection against free radical damage", "type": "nutrient"},
-            {"name": "Choline",             "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Supports declining cholinergic neurons; aids recall",       "type": "nutrient"},
-            {"name": "Vitamin B12",         "dose": "500 mcg", "times": ["8:00 AM"],  "purpose": "Repairs myelin damage; counters neurodegeneration",          "type": "nutrient"},
-            {"name": "Curcumin (Turmeric)", "dose": "500 mg",  "times": ["8:00 PM"],  "purpose": "Actively reduces amyloid plaques and tau tangles",           "type": "nutrient"},
-        ],
-    },
-    "ModerateDemented": {
-        "label": "Moderate Demented", "emoji": "🔴", "color": "#f87171", "bg": "#1c0000",
-        "description": "Significant cognitive impairment detected. Maximum nutritional support protocol initiated. Immediate specialist consultation required.",
-        "urgency": "URGENT — See Neurologist Immediately",
-        "supplements": [
-            {"name": "Omega-3 (Fish Oil)",  "dose": "500 mg",  "times": ["8:00 AM"],  "purpose": "DHA and EPA to slow advanced neuronal loss and inflammation",             "type": "nutrient"},
-            {"name": "Beta-Carotene",       "dose": "3 mg",    "times": ["8:00 AM"],  "purpose": "Antioxidant coverage for severe oxidative brain damage",            "type": "nutrient"},
-            {"name": "Vitamin E",           "dose": "200 IU",  "times": ["1:00 PM"],  "purpose": "Neuroprotective dose; slows advanced neurodegeneration",    "type": "nutrient"},
-            {"name": "Choline",             "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Critical support for severely depleted cholinergic pathways",               "type": "nutrient"},
-            {"name": "Vitamin B12",         "dose": "500 mcg", "times": ["8:00 AM"],  "purpose": "B12 support for severely depleted neurological pathways",            "type": "nutrient"},
-            {"name": "Curcumin (Turmeric)", "dose": "500 mg",  "times": ["8:00 PM"],  "purpose": "Plaque and tangle inhibition in advanced Alzheimer's", "type": "nutrient"},
-        ],
-    },
-}
 
-# ── MRI Validation ─────────────────────────────────────────────
-def is_likely_mri(img: Image.Image) -> tuple:
+# ── Model loader ───────────────────────────────────────────────
+@st.cache_resource(show_spinner=False)    # also runs on the warm-up thread — keep it UI-free
+def load_model():
+    if MODEL_SOCKET:    # a shared model_server.py owns the model — no TensorFlow in this process
+        try:
+            return RemoteModel(MODEL_SOCKET)
+        except OSError as e:
+            st.error(f"❌ Can't reach the model server at {MODEL_SOCKET} ({e}). Start it with `python model_server.py`")
+            st.stop()
+    if not os.path.exists(MODEL_PATH):
+        if MODEL_BACKEND == "keras":
+            st.error("❌ Model file 'alzheimer_model.keras' not found. Place it in the same folder as app.py")
+        else:
+            st.error(f"❌ Model file '{os.path.basename(MODEL_PATH)}' not found. Run `python export_tflite.py` first")
+        st.stop()
+    return load_backend(MODEL_BACKEND)
+
+@st.cache_resource
+def start_model_warmup():
+    """Import TensorFlow and load the model on a background thread, once per process."""
+    def warm_up():
+        if not MODEL_SOCKET and os.path.exists(MODEL_PATH):    # nothing to warm up in a remote model
+            load_model()
+    thread = threading.Thread(target=warm_up, name="neuroscan-model-warmup", daemon=True)
+    add_script_run_ctx(thread)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def get_decode_pool():
+    """Decode/validation worker processes shared by every session (None when NEUROSCAN_DECODE_WORKERS=0)."""
+    return DecodePool(DECODE_WORKERS) if DECODE_WORKERS > 0 else None
+
+def model_fingerprint() -> str:
+    """Cheap model version id — changes whenever the weights file (or the model server's) is replaced."""
+    if MODEL_SOCKET:
+        return load_model().fingerprint
+    return weights_fingerprint(MODEL_BACKEND)
+
+# ── Prediction cache ───────────────────────────────────────────
+class PredictionCache:
     """
-    Multi-heuristic check to determine if an image is likely a brain MRI scan.
-    Returns (is_valid: bool, reason: str, details: dict)
+    Content-addressed LRU of scan results, keyed on hash(image bytes) + model fingerprint.
+    Each entry holds {"validation": (is_valid, reason, details), "all_probs": dict | None},
+    so a Streamlit rerun or repeat upload skips validation and the CNN forward pass.
     """
-    issues = []
-    details = {}
-
-    # Convert to numpy arrays for analysis
-    img_rgb  = img.convert("RGB")
-    img_gray = img.convert("L")
-    arr_rgb  = np.array(img_rgb, dtype=np.float32)
-    arr_gray = np.array(img_gray, dtype=np.float32)
-
-    total_pixels = arr_gray.size
-
-    # ── Check 1: Dark background ratio ──────────────────────────
-    # Brain MRIs have a large black/near-black background
-    dark_pixels = np.sum(arr_gray < 25)
-    dark_ratio  = dark_pixels / total_pixels
-    details["dark_ratio"] = dark_ratio
-    if dark_ratio < 0.20:
-        issues.append(f"insufficient dark background ({dark_ratio:.1%} < 20% expected for MRI)")
-
-    # ── Check 2: Colorfulness ────────────────────────────────────
-    # MRIs are grayscale; very colorful images are not MRIs
-    r = arr_rgb[:, :, 0]
-    g = arr_rgb[:, :, 1]
-    b = arr_rgb[:, :, 2]
-    rg_diff = np.std(r.astype(float) - g.astype(float))
-    gb_diff = np.std(g.astype(float) - b.astype(float))
-    color_score = rg_diff + gb_diff
-    details["color_score"] = color_score
-    if color_score > 25:
-        issues.append(f"image appears too colorful (score {color_score:.1f} > 25 expected for grayscale MRI)")
-
-    # ── Check 3: Grayscale channel similarity ────────────────────
-    # In a true grayscale image R ≈ G ≈ B
-    channel_diff = np.mean(np.abs(r - g)) + np.mean(np.abs(g - b))
-    details["channel_diff"] = channel_diff
-    if channel_diff > 15:
-        issues.append(f"channels differ too much ({channel_diff:.1f} > 15) — likely a color photo, not an MRI")
-
-    # ── Check 4: Brightness variance (texture check) ─────────────
-    # MRIs have a distinct bright oval (brain) on a dark field
-    # A paper/document would be mostly uniform bright
-    mean_brightness = np.mean(arr_gray)
-    std_brightness  = np.std(arr_gray)
-    details["mean_brightness"] = mean_brightness
-    details["std_brightness"]  = std_brightness
-
-    if mean_brightness > 200:
-        issues.append(f"image is too bright (mean {mean_brightness:.0f} > 200) — looks like a document or photo, not an MRI")
-
-    if std_brightness < 20:
-        issues.append(f"image has too little contrast (std {std_brightness:.1f} < 20) — MRIs have strong contrast between brain and background")
-
-    # ── Check 5: Bright region (brain) must exist ────────────────
-    # At least some pixels should be bright (the brain tissue)
-    bright_pixels = np.sum(arr_gray > 100)
-    bright_ratio  = bright_pixels / total_pixels
-    details["bright_ratio"] = bright_ratio
-    if bright_ratio < 0.05:
-        issues.append(f"too few bright pixels ({bright_ratio:.1%} < 5%) — no visible brain structure detected")
-    if bright_ratio > 0.80:
-        issues.append(f"too many bright pixels ({bright_ratio:.1%} > 80%) — likely a document or overexposed photo")
-
-    is_valid = len(issues) == 0
-    reason   = "; ".join(issues) if issues else "Image passed all MRI validation checks."
-    return is_valid, reason, details
 
+    def __init__(self, max_entries: int = PREDICTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits   = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+
+    @staticmethod
+    def key(data: bytes, fingerprint: str) -> str:
+        return hashlib.blake2b(data, digest_size=20).hexdigest() + ":" + fingerprint
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits":     self.hits,
+            "misses":   self.misses,
+            "entries":  len(self._entries),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
 
-# ── Model loader ───────────────────────────────────────────────
 @st.cache_resource
-def load_model():
-    model_path = os.path.join(os.path.dirname(__file__), "alzheimer_model.keras")
-    if not os.path.exists(model_path):
-        st.error("❌ Model file 'alzheimer_model.keras' not found. Place it in the same folder as app.py")
-        st.stop()
-    return tf.keras.models.load_model(model_path)
+def get_prediction_cache() -> PredictionCache:
+    return PredictionCache()
 
-def preprocess(img: Image.Image) -> np.ndarray:
-    img    = img.convert("RGB")
-    tensor = tf.convert_to_tensor(np.array(img), dtype=tf.float32)
-    tensor = tf.image.resize_with_pad(tensor, 224, 224)
-    return np.expand_dims(tensor.numpy(), axis=0)
+# ── Email templates ────────────────────────────────────────────
+# Everything in the prescription email except name/age, confidences and date is fixed
+# per stage, so it's rendered once at import. build_email_html() only fills the gaps.
+_FIELD = "\x00"    # split marker; never appears in the template text
 
-# ── Email helpers ──────────────────────────────────────────────
-def build_email_html(name, age, stage_key, conf, all_probs):
-    data     = STAGE_DATA[stage_key]
-    c        = data["color"]
-    date_str = datetime.now().strftime("%d %B %Y")
+def _compile_email_shell(data) -> tuple:
+    """Static HTML for one stage, as the 6 pieces around conf, patient line, date, bars, date."""
+    c = data["color"]
 
-    rows = ""
+    rows = []
     for item in data["supplements"]:
         tc   = c if item["type"] == "medication" else "#a78bfa"
         icon = ""
         sched = "<br>".join([f"{t}" for t in item["times"]])
-        rows += f"""<tr>
+        rows.append(f"""<tr>
           <td style="padding:10px 14px;border-bottom:1px solid #1e293b;">
             <strong style="color:{tc};font-size:13px;">{icon} {item['name']}</strong>
             <div style="font-size:11px;color:#cbd5e1;margin-top:2px;">{item['purpose']}</div>
           </td>
           <td style="padding:10px 14px;border-bottom:1px solid #1e293b;color:#e2e8f0;font-weight:600;">{item['dose']}</td>
           <td style="padding:10px 14px;border-bottom:1px solid #1e293b;color:{c};font-size:12px;line-height:1.8;">{sched}</td>
-        </tr>"""
-
-    bars = ""
-    for cls, prob in sorted(all_probs.items(), key=lambda x: -x[1]):
-        bc = STAGE_DATA[cls]["color"]
-        bars += f"""<div style="margin-bottom:8px;">
-          <div style="display:flex;justify-content:space-between;font-size:12px;">
-            <span style="color:#cbd5e1;">{STAGE_DATA[cls]['label']}</span>
-            <span style="color:{bc};font-weight:600;">{prob:.1f}%</span>
-          </div>
-          <div style="background:#1e293b;border-radius:4px;height:6px;">
-            <div style="width:{min(prob,100):.1f}%;background:{bc};height:6px;border-radius:4px;"></div>
-          </div>
-        </div>"""
-
-    patient_line = f"""<p style="margin:6px 0 0;color:{c};font-size:13px;">
-        <strong>Patient:</strong> {name}{f" &nbsp;·&nbsp; Age: {age}" if age else ""}
-    </p>""" if name else ""
+        </tr>""")
+    rows = "".join(rows)
 
-    return f"""<!DOCTYPE html><html>
+    html = f"""<!DOCTYPE html><html>
 <body style="background:#08090f;font-family:'Segoe UI',Arial,sans-serif;margin:0;padding:0;">
 <div style="max-width:640px;margin:0 auto;padding:24px 16px;">
   <div style="background:linear-gradient(135deg,#0f0f1f,#1a1a2e);border:1px solid #1e293b;
@@ -308,18 +295,18 @@ def build_email_html(name, age, stage_key, conf, all_probs):
       <div>
         <div style="color:{c};font-size:18px;font-weight:700;">{data['label']}</div>
         <div style="color:#cbd5e1;font-size:12px;">
-          Confidence: <strong style="color:{c};">{conf:.1f}%</strong> &nbsp;·&nbsp; {data['urgency']}
+          Confidence: <strong style="color:{c};">{_FIELD}%</strong> &nbsp;·&nbsp; {data['urgency']}
         </div>
       </div>
     </div>
     <p style="color:#cbd5e1;font-size:13px;margin:0;">{data['description']}</p>
-    {patient_line}
-    <p style="color:#cbd5e1;font-size:11px;margin:6px 0 0;">Report Date: {date_str}</p>
+    {_FIELD}
+    <p style="color:#cbd5e1;font-size:11px;margin:6px 0 0;">Report Date: {_FIELD}</p>
   </div>
   <div style="background:#0f172a;border:1px solid #1e293b;border-radius:14px;padding:16px;margin-bottom:16px;">
     <h3 style="margin:0 0 12px;color:#e2e8f0;font-size:12px;text-transform:uppercase;letter-spacing:.1em;">
       Model Confidence Breakdown
-    </h3>{bars}
+    </h3>{_FIELD}
   </div>
   <div style="background:#0f172a;border:1px solid #1e293b;border-radius:14px;overflow:hidden;margin-bottom:16px;">
     <div style="padding:10px 14px;background:#0a0f1e;color:{c};font-size:12px;font-weight:600;
@@ -353,33 +340,318 @@ def build_email_html(name, age, stage_key, conf, all_probs):
     </p>
   </div>
   <p style="text-align:center;color:#e2e8f0;font-size:10px;margin-top:16px;">
-    NeuroScan AI · EfficientNetB0 · 96.3% Accuracy · {date_str}
+    NeuroScan AI · EfficientNetB0 · 96.3% Accuracy · {_FIELD}
   </p>
 </div></body></html>"""
+    return tuple(html.split(_FIELD))
 
+def _compile_confidence_bar(data) -> tuple:
+    """Static HTML for one stage's confidence bar, as the 3 pieces around prob and bar width."""
+    bc = data["color"]
+    html = f"""<div style="margin-bottom:8px;">
+          <div style="display:flex;justify-content:space-between;font-size:12px;">
+            <span style="color:#cbd5e1;">{data['label']}</span>
+            <span style="color:{bc};font-weight:600;">{_FIELD}%</span>
+          </div>
+          <div style="background:#1e293b;border-radius:4px;height:6px;">
+            <div style="width:{_FIELD}%;background:{bc};height:6px;border-radius:4px;"></div>
+          </div>
+        </div>"""
+    return tuple(html.split(_FIELD))
 
-def send_email(sender, password, recipient, subject, html):
-    try:
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"]    = sender
-        msg["To"]      = recipient
-        msg.attach(MIMEText(html, "html"))
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as s:
-            s.login(sender, password)
-            s.sendmail(sender, recipient, msg.as_string())
-        return True, "✅ Prescription email sent successfully!"
-    except smtplib.SMTPAuthenticationError:
-        return False, "❌ Auth failed. Please use a Gmail App Password."
-    except Exception as e:
-        return False, f"❌ Error: {str(e)}"
+EMAIL_SHELLS   = {k: _compile_email_shell(v) for k, v in STAGE_DATA.items()}
+CONFIDENCE_BAR = {k: _compile_confidence_bar(v) for k, v in STAGE_DATA.items()}
 
+@functools.lru_cache(maxsize=4)
+def _report_date(day) -> str:
+    return day.strftime("%d %B %Y")
 
+# ── Email helpers ──────────────────────────────────────────────
+def build_email_html(name, age, stage_key, conf, all_probs):
+    c        = STAGE_DATA[stage_key]["color"]
+    date_str = _report_date(datetime.now().date())
 
-# ── Chatbot helper ─────────────────────────────────────────────
-def ask_neuroscan_ai(messages: list, stage_context: str = "", api_key: str = "") -> str:
-    """Call Groq API for the NeuroScan chatbot."""
-    # Try Streamlit secrets first, then env variable
+    bars = []
+    for cls, prob in sorted(all_probs.items(), key=lambda x: -x[1]):
+        pre, mid, post = CONFIDENCE_BAR[cls]
+        bars += (pre, f"{prob:.1f}", mid, f"{min(prob,100):.1f}", post)
+
+    patient_line = f"""<p style="margin:6px 0 0;color:{c};font-size:13px;">
+        <strong>Patient:</strong> {name}{f" &nbsp;·&nbsp; Age: {age}" if age else ""}
+    </p>""" if name else ""
+
+    s0, s1, s2, s3, s4, s5 = EMAIL_SHELLS[stage_key]
+    return "".join((s0, f"{conf:.1f}", s1, patient_line, s2, date_str, s3, "".join(bars), s4, date_str, s5))
+
+
+def build_message(sender, recipient, subject, html) -> str:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"]    = sender
+    msg["To"]      = recipient
+    msg.attach(MIMEText(html, "html"))
+    return msg.as_string()
+
+
+# ── Email delivery queue ───────────────────────────────────────
+def _is_transient_smtp_error(exc: Exception) -> bool:
+    """Dropped/refused connections, timeouts and 4xx "try again later" replies are worth retrying."""
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPException):
+        return False
+    return isinstance(exc, OSError)     # socket errors, timeouts, connection refused
+
+
+class RateLimiter:
+    """Token bucket shared by all delivery workers: at most `rate` sends per second (0 = unlimited)."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate    = rate
+        self.burst   = burst
+        self._tokens = float(burst)
+        self._last   = time.monotonic()
+        self._lock   = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last   = now
+            self._tokens -= 1      # reserve a slot now, wait for it outside the lock
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class EmailQueue:
+    """
+    Background email delivery: a job queue drained by a small pool of worker threads.
+    Logged-in SMTP connections are kept open per sender and reused across jobs, and
+    transient failures are retried with jittered exponential backoff. submit() returns
+    a job id immediately; status() / wait() report how the delivery went.
+    """
+
+    MAX_JOBS     = 1000    # finished job records kept for status polling
+    IDLE_TIMEOUT = 60      # seconds an unused connection stays open (servers drop idle ones anyway)
+
+    def __init__(self, workers: int = EMAIL_WORKERS, host: str = SMTP_HOST, port: int = SMTP_PORT,
+                 use_ssl: bool = SMTP_USE_SSL, max_attempts: int = 4, backoff: float = 1.0,
+                 rate: float = EMAIL_RATE):
+        self.host, self.port, self.use_ssl = host, port, use_ssl
+        self.max_attempts = max_attempts
+        self.backoff      = backoff
+        self.limiter      = RateLimiter(rate)
+        self._queue = queue.Queue()
+        self._jobs  = OrderedDict()
+        self._idle  = defaultdict(list)     # (sender, password) → [(logged-in connection, idle since)]
+        self._max_idle = workers            # per sender: more than one per worker is never reused
+        self._lock  = threading.Lock()
+        self._done  = threading.Condition(self._lock)
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"neuroscan-email-{i}", daemon=True).start()
+
+    # ── Public API ──
+    def submit(self, sender, password, recipient, subject, html) -> str:
+        job_id = uuid.uuid4().hex[:8]
+        with self._lock:
+            self._jobs[job_id] = {"state": "queued", "message": "⏳ Queued for delivery", "attempts": 0,
+                                  "recipient": recipient}
+            while len(self._jobs) > self.MAX_JOBS:
+                self._jobs.popitem(last=False)
+        self._queue.put((job_id, sender, password, recipient, build_message(sender, recipient, subject, html)))
+        return job_id
+
+    def status(self, job_id: str) -> dict:
+        with self._lock:
+            return dict(self._jobs.get(job_id, {"state": "unknown", "message": "❓ Unknown job", "attempts": 0,
+                                                "recipient": ""}))
+
+    def wait(self, job_id: str, timeout: float = None) -> dict:
+        """Block until the job is sent or has failed (or `timeout` seconds pass)."""
+        with self._done:
+            self._done.wait_for(lambda: self._jobs.get(job_id, {}).get("state") in ("sent", "failed", None),
+                                timeout)
+        return self.status(job_id)
+
+    # ── Workers ──
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+            self._done.notify_all()
+
+    def _connect(self, sender, password):
+        smtp_cls = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        conn = smtp_cls(self.host, self.port, timeout=30)
+        try:
+            conn.login(sender, password)
+        except Exception:
+            self._close(conn)
+            raise
+        return conn
+
+    def _acquire(self, key):
+        self._expire_idle()
+        with self._lock:
+            conn = self._idle[key].pop()[0] if self._idle.get(key) else None
+        if conn is not None:
+            try:
+                if conn.noop()[0] == 250:
+                    return conn
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close(conn)
+        return self._connect(*key)
+
+    def _release(self, key, conn):
+        with self._lock:
+            keep = len(self._idle[key]) < self._max_idle
+            if keep:
+                self._idle[key].append((conn, time.monotonic()))
+        if not keep:
+            self._close(conn)
+
+    def _expire_idle(self):
+        """Close connections idle for longer than IDLE_TIMEOUT, and forget senders with none left."""
+        cutoff, expired = time.monotonic() - self.IDLE_TIMEOUT, []
+        with self._lock:
+            for key in list(self._idle):
+                expired += [conn for conn, since in self._idle[key] if since < cutoff]
+                self._idle[key] = [(conn, since) for conn, since in self._idle[key] if since >= cutoff]
+                if not self._idle[key]:
+                    del self._idle[key]
+        for conn in expired:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+    def _worker(self):
+        while True:
+            try:
+                job_id, sender, password, recipient, message = self._queue.get(timeout=self.IDLE_TIMEOUT)
+            except queue.Empty:
+                self._expire_idle()
+                continue
+            key = (sender, password)
+            for attempt in range(1, self.max_attempts + 1):
+                self._update(job_id, state="sending", attempts=attempt, message="📨 Sending...")
+                conn = None
+                try:
+                    conn = self._acquire(key)
+                    self.limiter.acquire()
+                    conn.sendmail(sender, recipient, message)
+                    self._release(key, conn)
+                    self._update(job_id, state="sent", message="✅ Prescription email sent successfully!")
+                    break
+                except Exception as e:
+                    if conn is not None:
+                        self._close(conn)
+                    if isinstance(e, smtplib.SMTPAuthenticationError):
+                        self._update(job_id, state="failed", message="❌ Auth failed. Please use a Gmail App Password.")
+                        break
+                    if attempt == self.max_attempts or not _is_transient_smtp_error(e):
+                        self._update(job_id, state="failed", message=f"❌ Error: {str(e)}")
+                        break
+                    self._update(job_id, state="retrying", message=f"🔁 Retrying ({attempt}/{self.max_attempts - 1}): {e}")
+                    time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            self._queue.task_done()
+
+
+@st.cache_resource
+def get_email_queue() -> EmailQueue:
+    return EmailQueue()
+
+
+@st.fragment(run_every=2)
+def show_email_jobs():
+    """Live status of this session's recent email jobs (re-rendered every 2s on its own)."""
+    email_queue = get_email_queue()
+    for job_id in reversed(st.session_state.email_jobs[-5:]):
+        job  = email_queue.status(job_id)
+        text = f"{job['message']} · {job['recipient']} · job {job_id}"
+        if job["state"] == "sent":
+            st.success(text)
+        elif job["state"] in ("failed", "unknown"):
+            st.error(text)
+        else:
+            st.info(text)
+
+
+# ── Bulk (cohort) email ────────────────────────────────────────
+def submit_bulk_emails(sender, password, records: list, email_queue: EmailQueue = None) -> list:
+    """
+    Render and queue one prescription email per record. Records are dicts with
+    "recipient", "stage" (a LABEL_MAP value), "probs" (all_probs) and optional "name" / "age".
+    Returns [(record, job_id), ...] for bulk_delivery_report().
+    """
+    email_queue = email_queue or get_email_queue()
+    today = datetime.now().strftime('%d %b %Y')
+    jobs  = []
+    for rec in records:
+        stage   = rec["stage"]
+        html    = build_email_html(rec.get("name", ""), rec.get("age", ""), stage, rec["probs"][stage], rec["probs"])
+        subject = f"NeuroScan AI — {STAGE_DATA[stage]['label']} Prescription | {today}"
+        jobs.append((rec, email_queue.submit(sender, password, rec["recipient"], subject, html)))
+    return jobs
+
+
+def bulk_delivery_report(jobs: list, email_queue: EmailQueue = None) -> list:
+    """One row per recipient with the current delivery state of its job."""
+    email_queue = email_queue or get_email_queue()
+    report = []
+    for rec, job_id in jobs:
+        job = email_queue.status(job_id)
+        report.append({
+            "Patient":   rec.get("name", ""),
+            "Recipient": rec["recipient"],
+            "Stage":     STAGE_DATA[rec["stage"]]["label"],
+            "Status":    job["state"],
+            "Attempts":  job["attempts"],
+            "Detail":    job["message"],
+            "Job":       job_id,
+        })
+    return report
+
+
+def send_bulk_emails(sender, password, records: list, email_queue: EmailQueue = None,
+                     timeout: float = 600) -> list:
+    """Blocking bulk send: queue every record, wait for all of them, return the delivery report."""
+    email_queue = email_queue or get_email_queue()
+    jobs     = submit_bulk_emails(sender, password, records, email_queue)
+    deadline = time.monotonic() + timeout
+    for _, job_id in jobs:
+        email_queue.wait(job_id, max(0.0, deadline - time.monotonic()))
+    return bulk_delivery_report(jobs, email_queue)
+
+
+@st.fragment(run_every=2)
+def show_bulk_report():
+    """Live per-recipient delivery report for the session's last bulk send."""
+    report = bulk_delivery_report(st.session_state.bulk_jobs)
+    done   = sum(r["Status"] == "sent" for r in report)
+    failed = sum(r["Status"] == "failed" for r in report)
+    st.caption(f"{done}/{len(report)} delivered" + (f" · {failed} failed" if failed else ""))
+    st.dataframe(pd.DataFrame(report), use_container_width=True, hide_index=True)
+
+
+
+# ── Groq API client ────────────────────────────────────────────
+def groq_api_key(api_key: str = "") -> str:
+    """Explicit key, else Streamlit secrets, else the GROQ_API_KEY env variable."""
     if not api_key:
         try:
             api_key = st.secrets.get("GROQ_API_KEY", "")
@@ -387,10 +659,257 @@ def ask_neuroscan_ai(messages: list, stage_context: str = "", api_key: str = "")
             pass
     if not api_key:
         api_key = os.environ.get("GROQ_API_KEY", "")
-    if not api_key:
-        return "⚠️ GROQ_API_KEY not found. Please add it to Streamlit Secrets."
+    return api_key
 
-    system_prompt = f"""You are NeuroScan AI Assistant, a compassionate and knowledgeable medical support chatbot embedded in a brain MRI analysis app for Alzheimer's disease detection.
+
+class GroqClient:
+    """
+    One keep-alive requests.Session shared by every chat/trend call, so only the
+    first message pays for the TLS handshake. 429/5xx replies and dropped
+    connections are retried with jittered backoff (or the server's Retry-After),
+    and each call's latency (plus time-to-first-token when streaming) is
+    recorded for stats().
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    MAX_RETRY_AFTER = 30.0    # seconds; never sleep longer than this on a server hint
+
+    def __init__(self, url: str = GROQ_URL, timeout: float = GROQ_TIMEOUT, max_retries: int = GROQ_RETRIES,
+                 backoff: float = 0.5, pool_size: int = 8):
+        self.url         = url
+        self.timeout     = timeout
+        self.max_retries = max_retries
+        self.backoff     = backoff
+        self.session     = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.latencies   = deque(maxlen=1000)    # seconds per call, including retries
+        self.first_token = deque(maxlen=1000)    # seconds to the first streamed token
+        self.calls = self.retries = self.errors = 0
+        self._lock = threading.Lock()
+
+    def _retry_delay(self, attempt: int, resp=None) -> float:
+        hint = resp.headers.get("Retry-After") if resp is not None else None
+        if hint:
+            try:
+                delay = float(hint)                                    # "Retry-After: 2"
+            except ValueError:
+                try:                                                   # "Retry-After: <HTTP date>"
+                    delay = (parsedate_to_datetime(hint) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0.0), self.MAX_RETRY_AFTER)
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    def _post(self, api_key: str, payload: dict, stream: bool = False):
+        """POST with retries. Returns the final response; raises the last connection error."""
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                resp = self.session.post(self.url, headers=headers, json=payload, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                delay = self._retry_delay(attempt)
+            else:
+                if resp.status_code not in self.RETRY_STATUS or last:
+                    return resp
+                delay = self._retry_delay(attempt, resp)
+                resp.close()    # hand the connection back to the pool before retrying
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def chat(self, api_key: str, messages: list, max_tokens: int = 1000, temperature: float = 0.7,
+             model: str = GROQ_MODEL) -> str:
+        """One chat completion. Returns the reply text, or a ⚠️ message on failure."""
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            resp = self._post(api_key, payload)
+            data = resp.json()
+            if resp.status_code == 200:
+                ok = True
+                return data["choices"][0]["message"]["content"]
+            else:
+                return f"⚠️ API error {resp.status_code}: {data.get('error', {}).get('message', 'Unknown error')}"
+        except Exception as e:
+            return f"⚠️ Connection error: {str(e)}"
+        finally:
+            self._record(t0, ok)
+
+    def stream_chat(self, api_key: str, messages: list, max_tokens: int = 1000, temperature: float = 0.7,
+                    model: str = GROQ_MODEL):
+        """
+        Streaming chat completion (OpenAI-style `stream: true` server-sent events).
+        Yields text pieces as they arrive; a failure is yielded as a ⚠️ message.
+        """
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature,
+                   "stream": True}
+        t0 = time.perf_counter()
+        ok = False
+        first_token = None
+        try:
+            with self._post(api_key, payload, stream=True) as resp:
+                if resp.status_code != 200:
+                    try:
+                        data = resp.json()
+                    except ValueError:
+                        data = {}
+                    yield f"⚠️ API error {resp.status_code}: {data.get('error', {}).get('message', 'Unknown error')}"
+                    return
+                for line in resp.iter_lines(chunk_size=None):    # None: hand over each chunk as it arrives
+                    if not line.startswith(b"data:"):
+                        continue                                 # blank separators, ": keep-alive" comments
+                    event = line[5:].strip()
+                    if event == b"[DONE]":
+                        break
+                    choices = json.loads(event).get("choices") or [{}]
+                    piece = (choices[0].get("delta") or {}).get("content")
+                    if piece:
+                        if first_token is None:
+                            first_token = time.perf_counter() - t0
+                        yield piece
+            ok = True
+        except Exception as e:
+            yield ("\n\n" if first_token else "") + f"⚠️ Connection error: {str(e)}"
+        finally:
+            self._record(t0, ok, first_token)
+
+    def _record(self, t0: float, ok: bool, first_token: float = None):
+        with self._lock:
+            self.calls += 1
+            self.errors += not ok
+            self.latencies.append(time.perf_counter() - t0)
+            if first_token is not None:
+                self.first_token.append(first_token)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(self.latencies)
+            ttft = sorted(self.first_token)
+            calls, retries, errors = self.calls, self.retries, self.errors
+        pct = lambda xs, q: xs[min(int(q * len(xs)), len(xs) - 1)] * 1e3 if xs else 0.0
+        return {
+            "calls":        calls,
+            "retries":      retries,
+            "errors":       errors,
+            "p50_ms":       pct(lat, 0.50),
+            "p95_ms":       pct(lat, 0.95),
+            "mean_ms":      sum(lat) / len(lat) * 1e3 if lat else 0.0,
+            "ttft_p50_ms":  pct(ttft, 0.50),    # streamed calls only: time to first token
+        }
+
+@st.cache_resource
+def get_groq_client() -> GroqClient:
+    return GroqClient()
+
+
+# ── Chatbot response cache ─────────────────────────────────────
+# Words that don't change what's being asked — "What do these nutrients do?" and
+# "what do the nutrients do" should land on the same cached answer. Only articles and
+# who's being talked about: modals and question words stay, since "Can he take ...?"
+# (allowed) and "Should he take ...?" (recommended) need different answers, and the
+# rest keeps its order ("Is X worse than Y?" is not "Is Y worse than X?").
+_QUESTION_STOPWORDS = frozenset("""
+    a an the this these that those
+    i me my we our you your he him his she her it its they them their patient patients
+""".split())
+
+class ResponseCache:
+    """
+    SQLite-backed cache of chatbot answers keyed on (stage, question bucket).
+    The bucket is the question lowercased, without punctuation or stopwords, words
+    in their original order — a cheap lexical stand-in for an embedding-similarity bucket. Entries expire after `ttl` seconds and the
+    least recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, path: str = CHAT_CACHE_PATH, max_entries: int = CHAT_CACHE_SIZE, ttl: float = CHAT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")      # cheap commits; readers don't block the writer
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, stage TEXT, question TEXT, reply TEXT, created REAL, used REAL)""")
+        self._db.commit()
+
+    @staticmethod
+    def bucket(question: str) -> str:
+        words = re.findall(r"[a-z0-9]+", question.lower().replace("'", ""))
+        return " ".join(w for w in words if w not in _QUESTION_STOPWORDS) or " ".join(words)
+
+    def key(self, stage: str, question: str) -> str:
+        return f"{stage}|{self.bucket(question)}"
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT reply, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key: str, stage: str, question: str, reply: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, stage, question, reply, now, now))
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db.execute("""DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits":     self.hits,
+            "misses":   self.misses,
+            "entries":  entries,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+@st.cache_resource
+def get_response_cache():
+    """Process-wide ResponseCache, or None when NEUROSCAN_CHAT_CACHE_SIZE=0."""
+    return ResponseCache() if CHAT_CACHE_SIZE > 0 else None
+
+def _cache_when_complete(pieces, response_cache, key, stage, question):
+    """Pass a reply stream through, then cache the whole reply if it finished cleanly."""
+    reply = []
+    for piece in pieces:
+        reply.append(piece)
+        yield piece
+    reply = "".join(reply)
+    if reply and "⚠️" not in reply:
+        response_cache.put(key, stage, question, reply)
+
+
+# ── Chatbot helper ─────────────────────────────────────────────
+def stage_context_line(label: str, confidence: float = None) -> str:
+    """Chatbot context for a stage (a LABEL_MAP name). Without `confidence` it fits every scan of that stage."""
+    data = STAGE_DATA[label]
+    conf = f" (Confidence: {confidence:.1f}%)" if confidence is not None else ""
+    return f"Patient stage: {data['label']}{conf}. Urgency: {data['urgency']}."
+
+@functools.lru_cache(maxsize=64)
+def neuroscan_system_prompt(stage_context: str = "") -> str:
+    return f"""You are NeuroScan AI Assistant, a compassionate and knowledgeable medical support chatbot embedded in a brain MRI analysis app for Alzheimer's disease detection.
 
 Your role is to:
 - Answer questions about Alzheimer's disease, dementia stages, symptoms, and caregiving
@@ -408,58 +927,425 @@ Guidelines:
 - Keep responses concise (3-5 sentences) unless a detailed explanation is requested
 - If asked something outside your scope, gently redirect to a healthcare professional"""
 
-    # Build messages with system prompt
-    groq_messages = [{"role": "system", "content": system_prompt}]
-    for msg in messages:
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token, plus per-message overhead) — no tokenizer needed."""
+    return len(text) // 4 + 4
+
+
+class ChatMemory:
+    """
+    Token-budgeted view of one conversation. The newest messages that fit in `budget`
+    tokens are sent verbatim; anything older is folded, once, into a running summary
+    (one short line per message) that is itself capped at a quarter of the budget.
+    """
+
+    def __init__(self, budget: int = CHAT_TOKEN_BUDGET):
+        self.budget = budget
+        self.clear()
+
+    def clear(self):
+        self.summary = deque()    # one line per folded message, oldest first
+        self.folded  = 0          # history[:folded] already lives in the summary
+        self._folded_msgs = []    # those message dicts themselves, to spot a history swapped underneath us
+        self._summary_tokens = 0
+
+    @staticmethod
+    def _summarize(msg: dict) -> str:
+        first = re.split(r"(?<=[.!?])\s", msg["content"].strip(), maxsplit=1)[0]
+        if len(first) > 200:
+            first = first[:197] + "..."
+        return f"{'Caregiver' if msg['role'] == 'user' else 'Assistant'}: {first}"
+
+    def _fold(self, msg: dict):
+        line = self._summarize(msg)
+        self.summary.append(line)
+        self._summary_tokens += estimate_tokens(line)
+        while self._summary_tokens > self.budget // 4 and len(self.summary) > 1:
+            self._summary_tokens -= estimate_tokens(self.summary.popleft())
+
+    def window(self, history: list) -> list:
+        """Messages to send: [summary of older turns] + the newest turns that fit the budget."""
+        if len(history) < self.folded or any(a is not b for a, b in zip(history, self._folded_msgs)):
+            self.clear()    # history was cleared or replaced — the summary is of another conversation
+        used, start = 0, len(history)
+        while start > self.folded:
+            cost = estimate_tokens(history[start - 1]["content"])
+            if used + cost > self.budget and start < len(history):    # always keep the newest message
+                break
+            used  += cost
+            start -= 1
+        for msg in history[self.folded:start]:
+            self._fold(msg)
+        self._folded_msgs += history[self.folded:start]
+        self.folded = start
+
+        if not self.summary:
+            return history[start:]
+        summary = "Summary of the earlier conversation:\n" + "\n".join(f"- {line}" for line in self.summary)
+        return [{"role": "system", "content": summary}] + history[start:]
+
+
+def ask_neuroscan_ai(messages: list, stage_context: str = "", api_key: str = "", stream: bool = False,
+                     stage: str = "", memory: "ChatMemory" = None):
+    """
+    Call Groq API for the NeuroScan chatbot. With stream=True, returns an iterator of reply pieces.
+    Pass `stage` (a LABEL_MAP name) to answer an opening question from (and save it to) the response
+    cache; leave it empty when the context is patient-specific. Cached answers are generated from
+    the stage alone, not `stage_context`, since they're served for every scan of that stage. Pass the session's `memory` to send a
+    token-budgeted window of `messages` instead of all of them.
+    """
+    response_cache = get_response_cache() if stage and len(messages) == 1 else None
+    if response_cache:
+        question = messages[0]["content"]
+        key      = response_cache.key(stage, question)
+        reply    = response_cache.get(key)
+        if reply is not None:
+            return iter([reply]) if stream else reply
+
+    api_key = groq_api_key(api_key)
+    if not api_key:
+        warning = "⚠️ GROQ_API_KEY not found. Please add it to Streamlit Secrets."
+        return iter([warning]) if stream else warning
+
+    if response_cache:
+        stage_context = stage_context_line(stage)    # no one scan's confidence in a shared answer
+    # System prompt first and byte-stable turn to turn, so the provider can reuse its cached prefix
+    groq_messages = [{"role": "system", "content": neuroscan_system_prompt(stage_context)}]
+    for msg in (memory.window(messages) if memory else messages):
         groq_messages.append({"role": msg["role"], "content": msg["content"]})
 
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": groq_messages,
-        "max_tokens": 1000,
-        "temperature": 0.7,
-    }
+    if stream:
+        pieces = get_groq_client().stream_chat(api_key, groq_messages, max_tokens=1000, temperature=0.7)
+        return _cache_when_complete(pieces, response_cache, key, stage, question) if response_cache else pieces
+    reply = get_groq_client().chat(api_key, groq_messages, max_tokens=1000, temperature=0.7)
+    if response_cache and "⚠️" not in reply:
+        response_cache.put(key, stage, question, reply)
+    return reply
 
-    try:
-        resp = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
-            timeout=30,
-        )
-        data = resp.json()
-        if resp.status_code == 200:
-            return data["choices"][0]["message"]["content"]
-        else:
-            return f"⚠️ API error {resp.status_code}: {data.get('error', {}).get('message', 'Unknown error')}"
-    except Exception as e:
-        return f"⚠️ Connection error: {str(e)}"
+
+def chat_bubble_html(role: str, content: str) -> str:
+    """One chat message, styled as a user (right) or assistant (left) bubble."""
+    if role == "user":
+        return f"""
+                        <div style="display:flex;justify-content:flex-end;margin:6px 0;">
+                          <div style="background:linear-gradient(135deg,#6366f1,#8b5cf6);color:white;
+                                      padding:10px 14px;border-radius:16px 16px 4px 16px;
+                                      max-width:75%;font-size:13px;line-height:1.6;">
+                            {content}
+                          </div>
+                        </div>
+                        """
+    return f"""
+                        <div style="display:flex;justify-content:flex-start;margin:6px 0;">
+                          <div style="background:#0f1f3d;border:1px solid #1e3a5f;color:#e2e8f0;
+                                      padding:10px 14px;border-radius:16px 16px 16px 4px;
+                                      max-width:80%;font-size:13px;line-height:1.6;">
+                            <span style="font-size:10px;color:#6366f1;font-weight:600;
+                                         display:block;margin-bottom:4px;">NeuroScan AI</span>
+                            {content}
+                          </div>
+                        </div>
+                        """
+
+
+
+# ── Symptom log store ──────────────────────────────────────────
+class SymptomStore:
+    """
+    SQLite table of symptom logs, one row per (patient_id, date) — the primary key
+    doubles as the index behind upserts and per-patient date-range queries.
+    """
+
+    MAX_WINDOWS = 16    # SymptomColumns kept for recently viewed (patient, start) windows
+
+    def __init__(self, path: str = SYMPTOM_DB_PATH or ":memory:"):
+        self._lock    = threading.Lock()
+        self._windows = OrderedDict()
+        self._db      = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS symptom_logs (
+            patient_id TEXT NOT NULL DEFAULT '', date TEXT NOT NULL, patient_name TEXT NOT NULL DEFAULT '',
+            memory INTEGER, confusion INTEGER, mood INTEGER, tasks INTEGER, sleep INTEGER, overall INTEGER,
+            notes TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (patient_id, date)) WITHOUT ROWID""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS symptom_logs_date ON symptom_logs (date)")
+        # One summary row per patient, refreshed for the patients each write touches
+        self._db.execute("""CREATE TABLE IF NOT EXISTS symptom_patients (
+            patient_id TEXT PRIMARY KEY, patient_name TEXT, entries INTEGER, last_date TEXT) WITHOUT ROWID""")
+        if not self._db.execute("SELECT 1 FROM symptom_patients LIMIT 1").fetchone():
+            self._refresh_patients()
+        self._db.commit()
+        self._version = self._data_version()
+
+    def _data_version(self) -> int:
+        """Bumped when another connection — e.g. a second app replica — commits; our own writes don't move it."""
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh_patients(self, patient_ids=None):
+        """Recompute summary rows for `patient_ids` (all patients when None). Caller commits."""
+        summary = "SELECT patient_id, MAX(patient_name), COUNT(*), MAX(date) FROM symptom_logs"
+        if patient_ids is None:
+            self._db.execute("DELETE FROM symptom_patients")
+            self._db.execute(f"INSERT INTO symptom_patients {summary} GROUP BY patient_id")
+            return
+        ids = [(pid,) for pid in patient_ids]
+        self._db.executemany("DELETE FROM symptom_patients WHERE patient_id = ?", ids)
+        self._db.executemany(f"INSERT INTO symptom_patients {summary} WHERE patient_id = ? GROUP BY patient_id", ids)
+
+    def upsert(self, logs: list) -> int:
+        """Insert or replace logs in one transaction. Returns how many already existed."""
+        return self.upsert_rows([tuple(log.get(c) or "" if c in SYMPTOM_TEXT_COLUMNS else log[c] for c in SYMPTOM_COLUMNS)
+                                 for log in logs])
+
+    def upsert_rows(self, rows: list) -> int:
+        """upsert() for tuples already in SYMPTOM_COLUMNS order — the bulk import path."""
+        values = f"VALUES ({', '.join('?' * len(SYMPTOM_COLUMNS))})"
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany(f"INSERT OR IGNORE INTO symptom_logs {values}", rows)
+            inserted = self._db.total_changes - before
+            if inserted < len(rows):    # some keys existed — second pass overwrites them
+                updates = ", ".join(f"{c} = excluded.{c}" for c in SYMPTOM_COLUMNS[2:])
+                self._db.executemany(f"INSERT INTO symptom_logs {values} ON CONFLICT (patient_id, date) DO UPDATE SET {updates}", rows)
+            self._refresh_patients({row[0] for row in rows})
+            # Cached windows: brand-new keys are appended in place; anything else drops the window
+            for (patient_id, start), cols in list(self._windows.items()):
+                hits = [row for row in rows if (patient_id is None or row[0] == patient_id) and (not start or row[1] >= start)]
+                if hits and inserted == len(rows):
+                    cols.append(hits)
+                elif hits:
+                    del self._windows[patient_id, start]
+        return len(rows) - inserted
+
+    def _select(self, patient_id: str = None, start: str = None, end: str = None,
+                after: tuple = None, limit: int = None) -> list:
+        where, args = [], []
+        if patient_id is not None:
+            where.append("patient_id = ?")
+            args.append(patient_id)
+        if start:
+            where.append("date >= ?")
+            args.append(start)
+        if end:
+            where.append("date <= ?")
+            args.append(end)
+        if after:    # keyset paging: rows after this (date, patient_id)
+            where.append("(date, patient_id) > (?, ?)")
+            args.extend(after)
+        sql = f"SELECT {', '.join(SYMPTOM_COLUMNS)} FROM symptom_logs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date, patient_id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._db.execute(sql, args).fetchall()
+
+    def query(self, patient_id: str = None, start: str = None, end: str = None) -> list:
+        """Logs sorted by date (then patient), optionally for one patient and an inclusive date range."""
+        with self._lock:
+            rows = self._select(patient_id, start, end)
+        return [dict(zip(SYMPTOM_COLUMNS, row)) for row in rows]
+
+    def iter_rows(self, patient_id: str = None, start: str = None, end: str = None, chunk: int = 10_000):
+        """
+        query() in pages of `chunk` row tuples, for exports. Each page is its own short
+        read, so the lock isn't held while the caller writes and saves keep working.
+        """
+        after = None
+        while True:
+            with self._lock:
+                rows = self._select(patient_id, start, end, after=after, limit=chunk)
+            if not rows:
+                return
+            yield rows
+            after = (rows[-1][1], rows[-1][0])
+
+    def window(self, patient_id: str = None, start: str = None) -> SymptomColumns:
+        """
+        Columnar logs for one patient (or all) from `start` on — loaded once, then kept up to
+        date by this store's writes, and reloaded after another process writes the file.
+        """
+        key = (patient_id, start)
+        with self._lock:
+            version = self._data_version()
+            if version != self._version:    # written elsewhere since — our appends can't cover that
+                self._windows.clear()
+                self._version = version
+            cols = self._windows.get(key)
+            if cols is None:
+                cols = self._windows[key] = SymptomColumns(self._select(patient_id, start))
+                while len(self._windows) > self.MAX_WINDOWS:
+                    self._windows.popitem(last=False)
+            self._windows.move_to_end(key)
+            return cols
+
+    def patients(self) -> list:
+        """(patient_id, patient_name, entries, last date) for every patient, by ID."""
+        with self._lock:
+            return self._db.execute("SELECT * FROM symptom_patients ORDER BY patient_id").fetchall()
+
+    def last_date(self, patient_id: str = None):
+        with self._lock:
+            if patient_id is None:
+                row = self._db.execute("SELECT MAX(last_date) FROM symptom_patients").fetchone()
+            else:
+                row = self._db.execute("SELECT last_date FROM symptom_patients WHERE patient_id = ?", (patient_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, patient_id: str = None) -> int:
+        """Delete one patient's logs, or every log when patient_id is None."""
+        with self._lock, self._db:
+            self._windows.clear()
+            if patient_id is None:
+                self._db.execute("DELETE FROM symptom_patients")
+                return self._db.execute("DELETE FROM symptom_logs").rowcount
+            self._db.execute("DELETE FROM symptom_patients WHERE patient_id = ?", (patient_id,))
+            return self._db.execute("DELETE FROM symptom_logs WHERE patient_id = ?", (patient_id,)).rowcount
+
+
+@st.cache_resource
+def _shared_symptom_store() -> SymptomStore:
+    return SymptomStore(SYMPTOM_DB_PATH)
+
+def get_symptom_store() -> SymptomStore:
+    """The NEUROSCAN_SYMPTOM_DB store when that's set, otherwise this session's private in-memory one."""
+    if SYMPTOM_DB_PATH:
+        return _shared_symptom_store()
+    if "symptom_store" not in st.session_state:
+        st.session_state.symptom_store = SymptomStore(":memory:")
+    return st.session_state.symptom_store
+
+
+# ── Symptom log import / export ────────────────────────────────
+def symptom_file_format(name: str) -> str:
+    return "parquet" if name.lower().endswith((".parquet", ".pq")) else "csv"
+
+
+def read_symptom_chunks(source, fmt: str = "csv", chunk_rows: int = SYMPTOM_CHUNK_ROWS):
+    """Yield DataFrames of at most chunk_rows rows from a CSV or Parquet path / file object."""
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_rows, dtype=str, keep_default_na=False, skipinitialspace=True)
 
 
+def validate_symptom_chunk(df: pd.DataFrame, first: int = 1) -> tuple:
+    """
+    Check one chunk against the log schema. Headers are matched loosely ("Patient ID" →
+    patient_id); date (YYYY-MM-DD) and the six scores are required, scores must be whole numbers 0–10.
+    Returns (rows, errors): tuples in SYMPTOM_COLUMNS order for the valid rows, and
+    (row number, reason) for the rejected ones, numbering data rows from `first`.
+    """
+    df = df.rename(columns=lambda c: str(c).strip().lower().replace(" ", "_"))
+    missing = [c for c in ("date",) + SYMPTOM_SCORES if c not in df.columns]
+    if missing:
+        raise ValueError("Missing column(s): " + ", ".join(missing))
+
+    # Exactly YYYY-MM-DD: no day/month guessing, and no "2024-01" or timestamps read as some day
+    raw    = df["date"].astype(str).str.strip()
+    dates  = pd.to_datetime(raw.where(raw.str.fullmatch(r"\d{4}-\d{2}-\d{2}")), errors="coerce", format="%Y-%m-%d")
+    checks = [(dates.isna().to_numpy(), "date must be YYYY-MM-DD")]
+    scores = np.zeros((len(df), len(SYMPTOM_SCORES)), np.int8)
+    for j, field in enumerate(SYMPTOM_SCORES):
+        raw = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        ok  = (raw >= 0) & (raw <= 10) & (raw == np.round(raw))    # NaN fails all three
+        checks.append((~ok, f"{field} must be a whole number from 0 to 10"))
+        scores[ok, j] = raw[ok]
+    reason = np.select([mask for mask, _ in checks], [why for _, why in checks], default="")    # first failure wins
+    keep   = reason == ""
+
+    def text(col):
+        if col not in df.columns:
+            return [""] * int(keep.sum())
+        return df[col].fillna("").astype(str).str.strip().to_numpy()[keep].tolist()
+
+    rows = list(zip(text("patient_id"), dates.dt.strftime("%Y-%m-%d").to_numpy()[keep].tolist(),
+                    text("patient_name"), *scores[keep].T.tolist(), text("notes")))
+    errors = [(first + int(i), str(reason[i])) for i in np.flatnonzero(~keep)]
+    return rows, errors
+
+
+def import_symptom_logs(store: SymptomStore, source, fmt: str = "csv",
+                        chunk_rows: int = SYMPTOM_CHUNK_ROWS, max_errors: int = 100) -> dict:
+    """
+    Stream a CSV/Parquet symptom diary into the store, one chunk and one transaction
+    at a time, upserting on (patient_id, date). Invalid rows are skipped and reported.
+    Raises ValueError when required columns are missing (nothing is imported).
+    """
+    report = {"rows": 0, "added": 0, "updated": 0, "rejected": 0, "errors": []}
+    for chunk in read_symptom_chunks(source, fmt, chunk_rows):
+        rows, errors = validate_symptom_chunk(chunk, first=report["rows"] + 1)
+        existed = store.upsert_rows(rows) if rows else 0
+        report["rows"]     += len(chunk)
+        report["added"]    += len(rows) - existed
+        report["updated"]  += existed
+        report["rejected"] += len(errors)
+        report["errors"]   += errors[:max_errors - len(report["errors"])]
+    return report
+
+
+def export_symptom_logs(store: SymptomStore, out, fmt: str = "csv", patient_id: str = None,
+                        start: str = None, end: str = None, chunk_rows: int = SYMPTOM_CHUNK_ROWS) -> int:
+    """
+    Write the filtered history to `out` (a path or binary file object) chunk by chunk,
+    with SYMPTOM_COLUMNS as headers so the file imports straight back. Returns rows written.
+    """
+    if isinstance(out, (str, os.PathLike)):
+        with open(out, "wb") as f:
+            return export_symptom_logs(store, f, fmt, patient_id, start, end, chunk_rows)
+
+    written, writer = 0, None
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(c, pa.int8() if c in SYMPTOM_SCORES else pa.string()) for c in SYMPTOM_COLUMNS])
+        writer = pq.ParquetWriter(out, schema)
+    try:
+        for rows in store.iter_rows(patient_id, start, end, chunk=chunk_rows):
+            df = pd.DataFrame.from_records(rows, columns=SYMPTOM_COLUMNS)
+            if writer:
+                writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            else:
+                df.to_csv(out, header=not written, index=False)
+            written += len(rows)
+        if not written and not writer:
+            pd.DataFrame(columns=SYMPTOM_COLUMNS).to_csv(out, index=False)    # header only
+    finally:
+        if writer:
+            writer.close()
+    return written
+
 
 # ── Symptom Trend Analysis ─────────────────────────────────────
-def analyze_symptom_trends(logs: list, api_key: str = "") -> str:
-    """Send symptom logs to Groq for AI trend analysis."""
-    if not api_key:
-        try:
-            api_key = st.secrets.get("GROQ_API_KEY", "")
-        except:
-            pass
-    if not api_key:
-        api_key = os.environ.get("GROQ_API_KEY", "")
-    if not api_key:
-        return "⚠️ GROQ_API_KEY not found. Please add it to Streamlit Secrets."
+RISK_COLORS  = {"Low": ("#4ade80", "#052e16"), "Moderate": ("#facc15", "#1c1400"),
+                "High": ("#fb923c", "#1c0800"), "Critical": ("#f87171", "#1c0000")}
+
+TREND_SYSTEM_PROMPT = """You are a neurological symptom trend analyst AI embedded in the NeuroScan Alzheimer's detection app.
+You analyze daily symptom logs from patients or caregivers to detect cognitive decline patterns.
+
+Your analysis should include:
+1. TREND SUMMARY — Is the patient improving, stable, or declining?
+2. CONCERNING PATTERNS — Which symptoms are worsening fastest?
+3. RISK FLAG — Low / Moderate / High / Critical based on trend
+4. RECOMMENDED NEXT STEPS — Specific actionable advice
+5. CAREGIVER ALERT — Any urgent flags for the caregiver
+
+When a computed risk level is given, use it as the RISK FLAG and explain what drives it.
+Be concise, empathetic, and clear. Use plain language. Format with clear sections."""
+
 
+def format_log_entries(logs: list, first: int = 1) -> str:
     log_text = ""
-    for i, log in enumerate(logs):
+    for i, log in enumerate(logs, first):
         pid = log.get("patient_id", "")
         pname = log.get("patient_name", "")
         patient_line = f"  Patient: {pname} (ID: {pid})" if pid or pname else ""
         log_text += f"""
-Entry {i+1} — Date: {log['date']}{patient_line}
+Entry {i} — Date: {log['date']}{patient_line}
   Memory Loss: {log['memory']}/10
   Confusion: {log['confusion']}/10
   Mood Changes: {log['mood']}/10
@@ -468,48 +1354,77 @@ Entry {i+1} — Date: {log['date']}{patient_line}
   Overall Score: {log['overall']}/10
   Notes: {log.get('notes', 'None')}
 """
+    return log_text
 
-    system_prompt = """You are a neurological symptom trend analyst AI embedded in the NeuroScan Alzheimer's detection app.
-You analyze daily symptom logs from patients or caregivers to detect cognitive decline patterns.
 
-Your analysis should include:
-1. TREND SUMMARY — Is the patient improving, stable, or declining?
-2. CONCERNING PATTERNS — Which symptoms are worsening fastest?
-3. RISK FLAG — Low / Moderate / High / Critical based on trend
-4. RECOMMENDED NEXT STEPS — Specific actionable advice
-5. CAREGIVER ALERT — Any urgent flags for the caregiver
+def trend_summary(logs: list, trends: dict = None) -> str:
+    """symptom_trends() facts as prompt text."""
+    trends = trends or symptom_trends(logs)
+    lines = [f"{trends['entries']} entries, {trends['first']} → {trends['last']}. "
+             f"Computed risk: {trends['risk_level']} ({trends['risk_score']:.0f}/100)."]
+    for s in trends["symptoms"].values():
+        line = (f"  {s['name']}: latest {s['latest']:.0f}/10, 7-entry avg {s['rolling']:.1f}, overall avg {s['mean']:.1f}, "
+                f"trend {s['slope']:+.2f}/week overall, {s['recent_slope']:+.2f}/week recently ({s['direction']})")
+        if s["change_point"]:
+            cp = s["change_point"]
+            line += f"; shifted {cp['before']:.1f} → {cp['after']:.1f} around {cp['date']}"
+        lines.append(line)
+    return "\n".join(lines)
 
-Be concise, empathetic, and clear. Use plain language. Format with clear sections."""
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Please analyze these symptom logs and provide a full trend report:\n{log_text}"}
-    ]
+def _logs_digest(logs: list) -> str:
+    return hashlib.blake2b(json.dumps(logs, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
 
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": messages,
-        "max_tokens": 1200,
-        "temperature": 0.4,
-    }
 
-    try:
-        resp = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
-            timeout=30,
-        )
-        data = resp.json()
-        if resp.status_code == 200:
-            return data["choices"][0]["message"]["content"]
+def analyze_symptom_trends(logs: list, api_key: str = "", state: dict = None) -> str:
+    """
+    Send symptom logs (sorted by date) to Groq for AI trend analysis.
+
+    With `state` — a dict kept between calls, e.g. in st.session_state — it's incremental:
+    unchanged logs return the stored report, new days are sent as just those entries plus
+    the previous report and a numeric summary, and a first report sends the summary plus
+    the last TREND_RECENT entries. state[patients]["mode"] records which one happened.
+    """
+    api_key = groq_api_key(api_key)
+    if not api_key:
+        return "⚠️ GROQ_API_KEY not found. Please add it to Streamlit Secrets."
+
+    if state is None:
+        prompt = f"Please analyze these symptom logs and provide a full trend report:\n{format_log_entries(logs)}"
+    else:
+        patients = ",".join(sorted({log.get("patient_id", "") for log in logs}))
+        record   = state.get(patients)
+        digest   = _logs_digest(logs)
+        if record and record["through"] == logs[-1]["date"] and record["digest"] == digest:
+            record["mode"], record["sent"] = "cached", 0
+            return record["analysis"]
+
+        summary = trend_summary(logs)
+        seen    = [log for log in logs if record and log["date"] <= record["through"]]
+        if record and _logs_digest(seen) == record["digest"]:
+            new    = logs[len(seen):]
+            prompt = (f"Your previous trend report, covering {len(seen)} entries up to {record['through']}:\n"
+                      f"{record['analysis']}\n\nNumeric summary of all entries:\n{summary}\n\n"
+                      f"New entries since then:\n{format_log_entries(new, len(seen) + 1)}\n"
+                      f"Please update the full trend report to include the new entries.")
+            mode = "incremental"
         else:
-            return f"⚠️ API error {resp.status_code}: {data.get('error', {}).get('message', 'Unknown error')}"
-    except Exception as e:
-        return f"⚠️ Connection error: {str(e)}"
+            new    = logs[-TREND_RECENT:]
+            prompt = (f"Numeric summary of all symptom logs:\n{summary}\n\n"
+                      f"Most recent entries:\n{format_log_entries(new, len(logs) - len(new) + 1)}\n"
+                      f"Please analyze these symptom logs and provide a full trend report.")
+            mode = "full"
+
+    messages = [
+        {"role": "system", "content": TREND_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+    analysis = get_groq_client().chat(api_key, messages, max_tokens=1200, temperature=0.4)
+    if state is not None and not analysis.startswith("⚠️"):
+        state[patients] = {"analysis": analysis, "through": logs[-1]["date"], "digest": digest,
+                           "mode": mode, "sent": len(new)}
+    return analysis
 
 # ══════════════════════════════════════════════════════════════
 #  SIDEBAR
@@ -566,6 +1481,19 @@ with st.sidebar:
     st.markdown("""
     <p style="font-size:14px;color:#4ade80 !important;margin-top:6px;font-weight:600;">Active</p>
     """, unsafe_allow_html=True)
+    groq_stats = get_groq_client().stats()
+    if groq_stats["calls"]:
+        st.caption(
+            f"{groq_stats['calls']} call(s) · p50 {groq_stats['p50_ms']:.0f} ms · p95 {groq_stats['p95_ms']:.0f} ms"
+            f" · {groq_stats['retries']} retries · {groq_stats['errors']} errors"
+        )
+    response_cache = get_response_cache()
+    if response_cache and response_cache.hits + response_cache.misses:
+        cache_stats = response_cache.stats()
+        st.caption(
+            f"Answer cache: {cache_stats['hit_rate']:.0%} hit rate · {cache_stats['hits']} hits"
+            f" · {cache_stats['misses']} misses · {cache_stats['entries']} stored"
+        )
     gemini_api_key = ""
 
 
@@ -597,27 +1525,117 @@ with tab1:
     st.markdown("<br>", unsafe_allow_html=True)
 
     # ── Upload ───────────────────────────────────────────────
-    uploaded = st.file_uploader(
+    uploaded_files = st.file_uploader(
         "Upload Brain MRI Scan",
         type=["jpg", "jpeg", "png"],
-        help="Upload an axial T1-weighted MRI scan. JPG or PNG format.",
+        accept_multiple_files=True,
+        help="Upload one or more axial T1-weighted MRI scans. JPG or PNG format.",
     )
 
     # ══════════════════════════════════════════════════════════
     #  PREDICTION + RESULTS
     # ══════════════════════════════════════════════════════════
-    if uploaded:
-        image = Image.open(uploaded)
+    if uploaded_files:
+        # ── Cache lookup (same bytes + same model → same result) ───
+        cache   = get_prediction_cache()
+        fp      = model_fingerprint()
+        keys    = [PredictionCache.key(f.getvalue(), fp) for f in uploaded_files]
+        entries = [cache.get(k) for k in keys]
+        misses  = [i for i, e in enumerate(entries) if e is None]
+
+        if misses:
+            # ── Validate + run model (one forward pass per micro-batch) ───
+            # Several uploads are decoded and validated in worker processes while the
+            # model classifies the previous batch; the model loads at the first valid scan.
+            pool = get_decode_pool() if len(misses) > 1 else None
+            with st.spinner("Analyzing MRI scan..." if len(misses) == 1 else f"Analyzing {len(misses)} MRI scans..."):
+                scored = score_images([uploaded_files[i].getvalue() for i in misses], load_model, pool=pool)
+                for i, (validation, probs, error) in zip(misses, scored):
+                    entries[i] = {"validation": validation or (False, f"could not read image ({error})", {}),
+                                  "all_probs": probs}
+
+            for i in misses:
+                cache.put(keys[i], entries[i])
+
+        validations = [e["validation"] for e in entries]
+        results     = {i: e["all_probs"] for i, e in enumerate(entries) if e["all_probs"] is not None}
+
+        # ── Batch summary + scan picker ────────────────────────────
+        selected = 0
+        if len(uploaded_files) > 1:
+            st.markdown("""
+            <div style="display:flex;align-items:center;gap:8px;margin-bottom:12px;">
+                  <h3 style="margin:0;color:#e2e8f0 !important;-webkit-text-fill-color:#e2e8f0 !important;font-size:15px;">Batch Results</h3>
+            </div>
+            """, unsafe_allow_html=True)
+            summary = []
+            for i, f in enumerate(uploaded_files):
+                if i in results:
+                    top = max(results[i], key=results[i].get)
+                    summary.append({"File": f.name, "Stage": STAGE_DATA[top]["label"],
+                                    "Confidence": f"{results[i][top]:.1f}%", "Urgency": STAGE_DATA[top]["urgency"]})
+                else:
+                    summary.append({"File": f.name, "Stage": "Invalid image", "Confidence": "—", "Urgency": "—"})
+            st.dataframe(pd.DataFrame(summary), use_container_width=True, hide_index=True)
+
+            # ── Bulk email: one protocol per classified scan ──────
+            if len(results) > 1:
+                cohort_idx = sorted(results)
+                with st.expander(f"Email protocols for all {len(cohort_idx)} classified scans"):
+                    cohort = st.data_editor(
+                        pd.DataFrame([{
+                            "File":            uploaded_files[i].name,
+                            "Stage":           STAGE_DATA[max(results[i], key=results[i].get)]["label"],
+                            "Patient Name":    "",
+                            "Age":             "",
+                            "Recipient Email": "",
+                        } for i in cohort_idx]),
+                        disabled=["File", "Stage"], hide_index=True, use_container_width=True, key="bulk_cohort",
+                    )
+                    bc1, bc2 = st.columns(2)
+                    with bc1:
+                        bulk_sender = st.text_input("Your Gmail Address", placeholder="youremail@gmail.com", key="bulk_sender")
+                    with bc2:
+                        bulk_pw = st.text_input("Gmail App Password", placeholder="xxxx xxxx xxxx xxxx", type="password", key="bulk_pw")
+
+                    if st.button("Send All Protocols", use_container_width=True, key="bulk_send"):
+                        records = [
+                            {"name": row["Patient Name"], "age": row["Age"], "recipient": row["Recipient Email"].strip(),
+                             "stage": max(results[i], key=results[i].get), "probs": results[i]}
+                            for i, (_, row) in zip(cohort_idx, cohort.iterrows())
+                            if "@" in (row["Recipient Email"] or "")
+                        ]
+                        if not records:
+                            st.error("⚠️ Please enter at least one valid recipient email address.")
+                        elif not bulk_sender or not bulk_pw:
+                            st.error("⚠️ Please enter your Gmail address and App Password.")
+                        else:
+                            st.session_state.bulk_jobs = submit_bulk_emails(bulk_sender, bulk_pw, records)
+
+                    if st.session_state.get("bulk_jobs"):
+                        show_bulk_report()
+
+            selected = st.selectbox(
+                "View scan", range(len(uploaded_files)),
+                format_func=lambda i: uploaded_files[i].name, key="scan_select",
+            )
 
-        # ── MRI Validation ─────────────────────────────────────────
-        with st.spinner("Validating image..."):
-            is_valid, reason, details = is_likely_mri(image)
+        stats = cache.stats()
+        st.caption(
+            f"Prediction cache: {len(uploaded_files) - len(misses)}/{len(uploaded_files)} scan(s) served from cache "
+            f"· {stats['hits']} hits · {stats['misses']} misses · {stats['hit_rate']:.0%} hit rate"
+        )
+
+        is_valid, reason, details = validations[selected]
 
         if not is_valid:
-            # Show the uploaded image so user can see what was rejected
+            # Show the uploaded image so user can see what was rejected (when Pillow can read it at all)
             col_img, col_msg = st.columns([1, 2])
             with col_img:
-                st.image(image, caption="Uploaded Image", use_container_width=True)
+                try:
+                    st.image(Image.open(uploaded_files[selected]), caption="Uploaded Image", use_container_width=True)
+                except Exception:
+                    st.caption(f"⚠️ {uploaded_files[selected].name} could not be displayed")
             with col_msg:
                 st.markdown(f"""
                 <div style="background:rgba(239,68,68,.08);border:1.5px solid #ef4444;border-radius:14px;
@@ -650,18 +1668,10 @@ with tab1:
                 """, unsafe_allow_html=True)
             st.stop()
 
-        # ── Run model ──────────────────────────────────────────────
-        model  = load_model()
-        arr    = preprocess(image)
-
-        with st.spinner("Analyzing MRI scan..."):
-            probs = model.predict(arr, verbose=0)[0]
-
-        idx       = int(np.argmax(probs))
-        label     = LABEL_MAP[idx]
-        conf      = float(probs[idx]) * 100
+        all_probs = results[selected]
+        label     = max(all_probs, key=all_probs.get)
+        conf      = all_probs[label]
         data      = STAGE_DATA[label]
-        all_probs = {LABEL_MAP[i]: float(probs[i]) * 100 for i in range(4)}
 
         # ── Low-confidence warning ─────────────────────────────────
         LOW_CONF_THRESHOLD = 55.0
@@ -687,7 +1697,7 @@ with tab1:
 
         # ── Left: image + confidence chart ────────────────────────
         with left:
-            st.image(image, caption="Uploaded MRI Scan", use_container_width=True)
+            st.image(Image.open(uploaded_files[selected]), caption="Uploaded MRI Scan", use_container_width=True)
 
             st.markdown("**Confidence Breakdown**")
             for k in LABEL_MAP.values():
@@ -811,14 +1821,13 @@ with tab1:
             elif not sender_em or not sender_pw:
                 st.error("⚠️ Please enter your Gmail address and App Password.")
             else:
-                with st.spinner("Sending email..."):
-                    html    = build_email_html(patient_name, patient_age, label, conf, all_probs)
-                    subject = f"NeuroScan AI — {data['label']} Prescription | {datetime.now().strftime('%d %b %Y')}"
-                    ok, msg = send_email(sender_em, sender_pw, recipient, subject, html)
-                if ok:
-                    st.success(msg)
-                else:
-                    st.error(msg)
+                html    = build_email_html(patient_name, patient_age, label, conf, all_probs)
+                subject = f"NeuroScan AI — {data['label']} Prescription | {datetime.now().strftime('%d %b %Y')}"
+                job_id  = get_email_queue().submit(sender_em, sender_pw, recipient, subject, html)
+                st.session_state.setdefault("email_jobs", []).append(job_id)
+
+        if st.session_state.get("email_jobs"):
+            show_email_jobs()
 
         st.markdown("""
         <div style="background:#0d1526;border:1px solid #1e3a5f;border-radius:12px;
@@ -840,11 +1849,13 @@ with tab1:
         st.markdown("""<hr style="border-color:#1e293b;margin:8px 0 24px;">""", unsafe_allow_html=True)
 
         # Build context string from current scan result
-        stage_context = f"Patient stage: {data['label']} (Confidence: {conf:.1f}%). Urgency: {data['urgency']}."
+        stage_context = stage_context_line(label, conf)
         if patient_name:
             stage_context += f" Patient name: {patient_name}."
         if patient_age:
             stage_context += f" Age: {patient_age}."
+        # Opening questions are answered from the shared cache unless the context names the patient
+        cache_stage = "" if patient_name or patient_age else label
 
         st.markdown(f"""
         <div style="margin-bottom:18px;">
@@ -882,12 +1893,15 @@ with tab1:
         # Init chat history in session state
         if "chat_history" not in st.session_state:
             st.session_state.chat_history = []
+        if "chat_memory" not in st.session_state:
+            st.session_state.chat_memory = ChatMemory()
 
         # Chat display container
         chat_container = st.container()
         with chat_container:
+            intro = st.empty()
             if not st.session_state.chat_history:
-                st.markdown(f"""
+                intro.markdown(f"""
                 <div style="background:#0d1526;border:1px solid #1e3a5f;border-radius:14px;
                             padding:18px;text-align:center;color:#cbd5e1;">
                   
@@ -900,28 +1914,7 @@ with tab1:
                 """, unsafe_allow_html=True)
             else:
                 for msg in st.session_state.chat_history:
-                    if msg["role"] == "user":
-                        st.markdown(f"""
-                        <div style="display:flex;justify-content:flex-end;margin:6px 0;">
-                          <div style="background:linear-gradient(135deg,#6366f1,#8b5cf6);color:white;
-                                      padding:10px 14px;border-radius:16px 16px 4px 16px;
-                                      max-width:75%;font-size:13px;line-height:1.6;">
-                            {msg["content"]}
-                          </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown(f"""
-                        <div style="display:flex;justify-content:flex-start;margin:6px 0;">
-                          <div style="background:#0f1f3d;border:1px solid #1e3a5f;color:#e2e8f0;
-                                      padding:10px 14px;border-radius:16px 16px 16px 4px;
-                                      max-width:80%;font-size:13px;line-height:1.6;">
-                            <span style="font-size:10px;color:#6366f1;font-weight:600;
-                                         display:block;margin-bottom:4px;">NeuroScan AI</span>
-                            {msg["content"]}
-                          </div>
-                        </div>
-                        """, unsafe_allow_html=True)
+                    st.markdown(chat_bubble_html(msg["role"], msg["content"]), unsafe_allow_html=True)
 
         # Input row
         col_input, col_send, col_clear = st.columns([6, 1, 1])
@@ -936,14 +1929,33 @@ with tab1:
         with col_clear:
             if st.button("Clear", use_container_width=True, key="chat_clear"):
                 st.session_state.chat_history = []
+                st.session_state.chat_memory.clear()
                 st.rerun()
 
         if send_clicked and user_input.strip():
             st.session_state.chat_history.append({"role": "user", "content": user_input.strip()})
-            with st.spinner("Analysing..."):
-                reply = ask_neuroscan_ai(st.session_state.chat_history, stage_context, gemini_api_key)
-            st.session_state.chat_history.append({"role": "assistant", "content": reply})
-            st.rerun()
+            if GROQ_STREAM:
+                # Draw the exchange in place and grow the reply as tokens arrive — no spinner, no rerun
+                with chat_container:
+                    intro.empty()
+                    st.markdown(chat_bubble_html("user", user_input.strip()), unsafe_allow_html=True)
+                    bubble = st.empty()
+                    reply, drawn = "", 0.0
+                    for piece in ask_neuroscan_ai(st.session_state.chat_history, stage_context, gemini_api_key,
+                                                  stream=True, stage=cache_stage,
+                                                  memory=st.session_state.chat_memory):
+                        reply += piece
+                        if time.monotonic() - drawn > 0.05:    # ≤ 20 redraws/s, however fast tokens come
+                            bubble.markdown(chat_bubble_html("assistant", reply + "▌"), unsafe_allow_html=True)
+                            drawn = time.monotonic()
+                    bubble.markdown(chat_bubble_html("assistant", reply), unsafe_allow_html=True)
+                st.session_state.chat_history.append({"role": "assistant", "content": reply})
+            else:
+                with st.spinner("Analysing..."):
+                    reply = ask_neuroscan_ai(st.session_state.chat_history, stage_context, gemini_api_key,
+                                             stage=cache_stage, memory=st.session_state.chat_memory)
+                st.session_state.chat_history.append({"role": "assistant", "content": reply})
+                st.rerun()
 
 
     else:
@@ -977,9 +1989,8 @@ with tab2:
     </div>
     """, unsafe_allow_html=True)
 
-    # Init session state for logs
-    if "symptom_logs" not in st.session_state:
-        st.session_state.symptom_logs = []
+    # Logs live in the shared SQLite store, not in this session
+    store = get_symptom_store()
 
     # ── Log Entry Form ─────────────────────────────────────────
     st.markdown("""
@@ -1034,24 +2045,88 @@ with tab2:
                 "overall":      log_overall,
                 "notes":        log_notes,
             }
-            # Check if entry for this date + patient already exists — update it
-            existing = [i for i, l in enumerate(st.session_state.symptom_logs)
-                        if l["date"] == str(log_date) and l.get("patient_id","") == log_patient_id]
-            if existing:
-                st.session_state.symptom_logs[existing[0]] = new_log
+            st.session_state.log_view_pid = log_patient_id    # show the patient just logged
+            # An entry for this date + patient already exists — the upsert replaces it
+            if store.upsert([new_log]):
                 st.success("✅ Log updated for " + str(log_date) + (" — " + log_patient_id if log_patient_id else ""))
             else:
-                st.session_state.symptom_logs.append(new_log)
                 st.success("✅ Log saved for " + str(log_date) + (" — " + log_patient_id if log_patient_id else ""))
             st.rerun()
     with clear_col:
-        if st.button("Clear All", use_container_width=True, key="clear_logs"):
-            st.session_state.symptom_logs = []
-            st.rerun()
+        # Only ever one patient at a time: the store is shared and persistent
+        clear_pid = st.session_state.get("log_view_pid")
+        if st.button("Clear All", use_container_width=True, key="clear_logs", disabled=clear_pid is None,
+                     help="Deletes every log of the patient shown below — pick one patient first"):
+            st.session_state.confirm_clear = clear_pid
+
+    if st.session_state.get("confirm_clear") is not None:
+        clear_pid = st.session_state.confirm_clear
+        shown_pid = clear_pid or "(no ID)"
+        st.warning(f"⚠️ This permanently deletes every log for **{shown_pid}** from the shared database. "
+                   f"Type `{shown_pid}` to confirm.")
+        typed = st.text_input("Patient ID to delete", key="confirm_clear_pid")
+        cc1, cc2 = st.columns(2)
+        with cc1:
+            if st.button("Delete logs", use_container_width=True, key="confirm_clear_btn",
+                         disabled=typed.strip() != shown_pid):
+                store.delete(clear_pid)
+                st.session_state.setdefault("trend_state", {}).pop(clear_pid, None)
+                st.session_state.setdefault("trend_analysis", {}).pop(clear_pid, None)
+                del st.session_state.confirm_clear
+                st.rerun()
+        with cc2:
+            if st.button("Cancel", use_container_width=True, key="cancel_clear"):
+                del st.session_state.confirm_clear
+                st.rerun()
+
+    # ── Bulk import from a spreadsheet diary ───────────────────
+    with st.expander("Import symptom diary (CSV / Parquet)"):
+        st.caption("Columns: date (YYYY-MM-DD), memory, confusion, mood, tasks, sleep, overall (0–10), "
+                   "and optionally patient_id, patient_name, notes. Rows for an existing patient + date replace it.")
+        diary = st.file_uploader("Diary file", type=["csv", "parquet"], key="log_import_file")
+        if diary is not None and st.button("Import", use_container_width=True, key="import_logs"):
+            try:
+                with st.spinner(f"Importing {diary.name}…"):
+                    st.session_state.import_report = import_symptom_logs(store, diary, symptom_file_format(diary.name))
+                st.session_state.trend_state = {}
+            except (ValueError, pd.errors.ParserError) as e:
+                st.session_state.import_report = {"error": str(e)}
+            except ImportError:
+                st.session_state.import_report = {"error": "Parquet import needs pyarrow — `pip install pyarrow`, "
+                                                           "or save the diary as CSV."}
+        report = st.session_state.get("import_report")
+        if report and "error" in report:
+            st.error(f"⚠️ Nothing imported — {report['error']}")
+        elif report:
+            st.success(f"✅ {report['added']:,} logs added, {report['updated']:,} updated "
+                       f"({report['rows']:,} rows read)")
+            if report["rejected"]:
+                st.warning(f"⚠️ {report['rejected']:,} rows skipped" +
+                           (f" — first {len(report['errors'])} below" if report["rejected"] > len(report["errors"]) else ""))
+                st.dataframe(pd.DataFrame(report["errors"], columns=["Row", "Problem"]),
+                             use_container_width=True, hide_index=True)
 
     # ── Logs Table + Chart ─────────────────────────────────────
-    if st.session_state.symptom_logs:
-        logs = sorted(st.session_state.symptom_logs, key=lambda x: x["date"])
+    patients = {pid: (name, count) for pid, name, count, _ in store.patients()}
+    if patients:
+        view_col1, view_col2 = st.columns(2)
+        with view_col1:
+            view_pid = st.selectbox(
+                "Patient", list(patients) + [None], key="log_view_pid",
+                format_func=lambda pid: "All patients" if pid is None else
+                    f"{pid or '(no ID)'}{' — ' + patients[pid][0] if patients[pid][0] else ''} · {patients[pid][1]} logs",
+            )
+        with view_col2:
+            window_days = st.selectbox(
+                "Show", [30, 90, 365, None], index=1, key="log_window",
+                format_func=lambda d: f"Last {d} days of logs" if d else "All logs",
+            )
+        # Only the displayed window is read from the store
+        start = None
+        if window_days:
+            start = str(datetime.fromisoformat(store.last_date(view_pid)).date() - timedelta(days=window_days - 1))
+        cols = store.window(view_pid, start=start)
+        logs = cols.records()
 
         st.markdown("<br>", unsafe_allow_html=True)
         st.markdown("""
@@ -1060,93 +2135,147 @@ with tab2:
         </div>
         """, unsafe_allow_html=True)
 
-        # Build DataFrame
-        df = pd.DataFrame(logs)
-        # Add missing columns if older logs don't have patient_id
-        for col in ["patient_id","patient_name"]:
-            if col not in df.columns:
-                df[col] = ""
-        df_display = df[["date","patient_id","patient_name","memory","confusion","mood","tasks","sleep","overall","notes"]].copy()
-        df_display.columns = ["Date","Patient ID","Patient Name","Memory","Confusion","Mood","Tasks","Sleep","Overall","Notes"]
-
+        # Table + chart frames are built once per change to this window, not on every rerun
         st.dataframe(
-            df_display,
+            cols.table(),
             use_container_width=True,
             hide_index=True,
         )
 
-        # Line chart
-        st.markdown("<br>", unsafe_allow_html=True)
-        st.markdown("""
-        <div style="display:flex;align-items:center;gap:8px;margin-bottom:12px;">
-              <h3 style="margin:0;color:#e2e8f0 !important;-webkit-text-fill-color:#e2e8f0 !important;font-size:15px;">Trend Chart</h3>
-        </div>
-        """, unsafe_allow_html=True)
+        # Export what's shown, written in chunks straight from the store
+        exp_col1, exp_col2 = st.columns([1, 3])
+        with exp_col1:
+            export_fmt = st.selectbox("Export as", ["csv", "parquet"], key="log_export_fmt", label_visibility="collapsed")
+        with exp_col2:
+            if st.button(f"Export {len(logs):,} logs as {export_fmt.upper()}", use_container_width=True, key="export_logs"):
+                # Chunks go to disk, then are read back once; the bytes are what download_button serves on every rerun
+                try:
+                    with tempfile.TemporaryFile() as export_file:
+                        export_symptom_logs(store, export_file, export_fmt, patient_id=view_pid, start=start)
+                        export_file.seek(0)
+                        st.session_state.log_export = (view_pid, start, export_fmt, export_file.read())
+                except ImportError:
+                    st.error("⚠️ Parquet export needs pyarrow — `pip install pyarrow`, or export as CSV.")
+        export = st.session_state.get("log_export")
+        if export and export[:3] == (view_pid, start, export_fmt):
+            st.download_button(
+                "⬇️ Download", export[3], use_container_width=True, key="download_logs",
+                file_name=f"symptom_logs_{view_pid or 'all'}_{datetime.now():%Y%m%d}.{export_fmt}",
+                mime="text/csv" if export_fmt == "csv" else "application/vnd.apache.parquet",
+            )
 
-        chart_df = df[["date","memory","confusion","mood","tasks","overall"]].set_index("date")
-        chart_df.columns = ["Memory Loss","Confusion","Mood Changes","Task Difficulty","Overall"]
-        st.line_chart(chart_df, use_container_width=True)
+        if len(cols.categories) > 1:
+            # Clinic overview: one row per patient instead of a chart that mixes everyone
+            st.markdown("<br>", unsafe_allow_html=True)
+            st.dataframe(
+                pd.DataFrame(store.patients(), columns=["Patient ID", "Patient Name", "Logs", "Last Log"]),
+                use_container_width=True, hide_index=True,
+            )
+            st.caption("Pick a patient above for their trend chart and AI trend analysis.")
+        else:
+            # One patient's partition — trends and AI reports are cached per patient
+            partition = cols.categories[0] if cols.categories else view_pid
 
-        # ── AI Analysis ────────────────────────────────────────
-        st.markdown("<br>", unsafe_allow_html=True)
-        st.markdown("""
-        <div style="display:flex;align-items:center;gap:10px;margin-bottom:12px;">
-              <div>
-            <h3 style="margin:0;background:linear-gradient(135deg,#6366f1,#818cf8);-webkit-background-clip:text;
-                       -webkit-text-fill-color:transparent;background-clip:text;font-size:16px;">
-              AI Trend Analysis
-            </h3>
-            <p style="margin:3px 0 0;color:#cbd5e1;font-size:12px;">
-              AI reviews all logs and flags patterns, risks, and next steps
-            </p>
-          </div>
-        </div>
-        """, unsafe_allow_html=True)
+            # Line chart
+            st.markdown("<br>", unsafe_allow_html=True)
+            st.markdown("""
+            <div style="display:flex;align-items:center;gap:8px;margin-bottom:12px;">
+                  <h3 style="margin:0;color:#e2e8f0 !important;-webkit-text-fill-color:#e2e8f0 !important;font-size:15px;">Trend Chart</h3>
+            </div>
+            """, unsafe_allow_html=True)
 
-        if len(logs) < 2:
+            chart_df = cols.chart()
+            if len(logs) >= 2:
+                # Colour each line by its computed direction: reds worsening, greens improving, blues stable
+                trends  = cols.trends()
+                shades  = {"worsening": ["#f87171", "#fb923c", "#f43f5e", "#fca5a5", "#ea580c"],
+                           "improving": ["#4ade80", "#22c55e", "#86efac", "#16a34a", "#bbf7d0"],
+                           "stable":    ["#60a5fa", "#a78bfa", "#38bdf8", "#94a3b8", "#818cf8"]}
+                arrows  = {"worsening": "↗", "improving": "↘", "stable": "→"}
+                colors, names, used = [], [], defaultdict(int)
+                for field, name in zip(["memory","confusion","mood","tasks","overall"], chart_df.columns):
+                    direction = trends["symptoms"][field]["direction"]
+                    colors.append(shades[direction][used[direction] % 5])
+                    names.append(f"{name} {arrows[direction]} {direction}")
+                    used[direction] += 1
+                st.line_chart(chart_df.set_axis(names, axis=1), use_container_width=True, color=colors)
+            else:
+                st.line_chart(chart_df, use_container_width=True)
+
+            # ── AI Analysis ────────────────────────────────────────
+            st.markdown("<br>", unsafe_allow_html=True)
             st.markdown("""
-            <div style="background:#0d1526;border:1px solid #1e3a5f;border-radius:12px;
-                        padding:16px;text-align:center;color:#cbd5e1;font-size:13px;">
-              Log at least <strong>2 days</strong> of symptoms to get AI trend analysis.
+            <div style="display:flex;align-items:center;gap:10px;margin-bottom:12px;">
+                  <div>
+                <h3 style="margin:0;background:linear-gradient(135deg,#6366f1,#818cf8);-webkit-background-clip:text;
+                           -webkit-text-fill-color:transparent;background-clip:text;font-size:16px;">
+                  AI Trend Analysis
+                </h3>
+                <p style="margin:3px 0 0;color:#cbd5e1;font-size:12px;">
+                  AI reviews all logs and flags patterns, risks, and next steps
+                </p>
+              </div>
             </div>
             """, unsafe_allow_html=True)
-        else:
-            if st.button("Analyse Trends with AI", use_container_width=True, key="analyse_trends"):
-                with st.spinner("Analysing symptom patterns..."):
-                    analysis = analyze_symptom_trends(logs)
-                st.session_state.trend_analysis = analysis
-
-            if "trend_analysis" in st.session_state and st.session_state.trend_analysis:
-                analysis_text = st.session_state.trend_analysis
-
-                # Determine risk level from analysis text for color
-                risk_color = "#4ade80"
-                risk_bg    = "#052e16"
-                if "critical" in analysis_text.lower():
-                    risk_color, risk_bg = "#f87171", "#1c0000"
-                elif "high" in analysis_text.lower():
-                    risk_color, risk_bg = "#fb923c", "#1c0800"
-                elif "moderate" in analysis_text.lower():
-                    risk_color, risk_bg = "#facc15", "#1c1400"
-
-                # Format the analysis nicely
-                formatted = analysis_text.replace("\n\n", "<br><br>").replace("\n", "<br>")
 
+            if len(logs) < 2:
+                st.markdown("""
+                <div style="background:#0d1526;border:1px solid #1e3a5f;border-radius:12px;
+                            padding:16px;text-align:center;color:#cbd5e1;font-size:13px;">
+                  Log at least <strong>2 days</strong> of symptoms to get AI trend analysis.
+                </div>
+                """, unsafe_allow_html=True)
+            else:
+                risk_color, risk_bg = RISK_COLORS[trends["risk_level"]]
+                shifted = [sym["name"] for sym in trends["symptoms"].values() if sym["change_point"]]
                 st.markdown(f"""
-                <div style="background:linear-gradient(135deg,{risk_color}0a,{risk_bg});
-                            border:1.5px solid {risk_color}55;border-radius:14px;padding:20px;margin-top:8px;">
-                  <div style="display:flex;align-items:center;gap:8px;margin-bottom:14px;">
-                                  <div>
-                      <div style="color:{risk_color};font-size:15px;font-weight:700;">AI Trend Report</div>
-                      <div style="color:#cbd5e1;font-size:11px;margin-top:2px;">
-                        Based on {len(logs)} logged entries · {logs[0]["date"]} → {logs[-1]["date"]}
-                      </div>
-                    </div>
+                <div style="background:linear-gradient(135deg,{risk_color}0a,{risk_bg});border:1px solid {risk_color}55;
+                            border-radius:12px;padding:12px 16px;margin-bottom:12px;">
+                  <span style="color:{risk_color};font-size:14px;font-weight:700;">
+                    Computed risk: {trends["risk_level"]} · {trends["risk_score"]:.0f}/100
+                  </span>
+                  <div style="color:#cbd5e1;font-size:12px;margin-top:4px;">
+                    {sum(sym["direction"] == "worsening" for sym in trends["symptoms"].values())} of 6 symptoms worsening recently
+                    {" · shift detected in " + ", ".join(shifted) if shifted else ""}
                   </div>
-                  <div style="color:#e2e8f0;font-size:13px;line-height:1.9;">{formatted}</div>
                 </div>
                 """, unsafe_allow_html=True)
 
+                trend_state = st.session_state.setdefault("trend_state", {})
+                reports     = st.session_state.setdefault("trend_analysis", {})
+                # The report covers the patient's whole record, not the "Show" window: a window that
+                # slides forward with each new day would never match the logs the last report saw
+                history = store.window(partition).records()
+                if st.button("Analyse Trends with AI", use_container_width=True, key="analyse_trends"):
+                    with st.spinner("Analysing symptom patterns..."):
+                        reports[partition] = analyze_symptom_trends(history, state=trend_state)
+                    record = trend_state.get(partition)
+                    if record and record["mode"] == "cached":
+                        st.caption("No new entries since the last report — showing it again.")
+                    elif record and record["mode"] == "incremental":
+                        st.caption(f"Updated the last report with {record['sent']} new entr{'y' if record['sent'] == 1 else 'ies'}.")
+
+                if reports.get(partition):
+                    analysis_text = reports[partition]
+
+                    # Format the analysis nicely
+                    formatted = analysis_text.replace("\n\n", "<br><br>").replace("\n", "<br>")
+
+                    st.markdown(f"""
+                    <div style="background:linear-gradient(135deg,{risk_color}0a,{risk_bg});
+                                border:1.5px solid {risk_color}55;border-radius:14px;padding:20px;margin-top:8px;">
+                      <div style="display:flex;align-items:center;gap:8px;margin-bottom:14px;">
+                                      <div>
+                          <div style="color:{risk_color};font-size:15px;font-weight:700;">AI Trend Report</div>
+                          <div style="color:#cbd5e1;font-size:11px;margin-top:2px;">
+                            Based on {len(history)} logged entries · {history[0]["date"]} → {history[-1]["date"]}
+                          </div>
+                        </div>
+                      </div>
+                      <div style="color:#e2e8f0;font-size:13px;line-height:1.9;">{formatted}</div>
+                    </div>
+                    """, unsafe_allow_html=True)
+
     else:
         st.markdown("""
         <div style="background:#0d1526;border:2px dashed #1e3a5f;border-radius:16px;
@@ -1373,3 +2502,9 @@ with tab3:
       </p>
     </div>
     """, unsafe_allow_html=True)
+
+# ── Background model warm-up ───────────────────────────────────
+# Runs after the page has been sent, so TensorFlow loads while the user is
+# still choosing a scan instead of delaying the first render.
+if os.environ.get("NEUROSCAN_WARMUP", "1") == "1":
+    start_model_warmup()
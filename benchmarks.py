@@ -0,0 +1,1292 @@
+"""
+NeuroScan AI — performance benchmarks.
+
+Run from the project folder (needs alzheimer_model.keras next to app.py):
+
+    python benchmarks.py batch            # batched vs one-at-a-time inference
+    python benchmarks.py preprocess       # NumPy vs TensorFlow letterboxing (+ parity)
+    python benchmarks.py validate         # histogram vs full-array is_likely_mri() (+ parity)
+    python benchmarks.py backends         # Keras vs TFLite latency, RSS (+ parity); run export_tflite.py first
+    python benchmarks.py warmup           # first-call vs steady-state latency, with and without warm-up
+    python benchmarks.py email            # precompiled vs f-string build_email_html() (+ parity)
+    python benchmarks.py groq             # pooled GroqClient vs requests.post per message, against a local TLS mock
+    python benchmarks.py stream           # time to first token, streamed vs non-streamed chat replies
+    python benchmarks.py chatcache        # chatbot answer cache: API vs cached opening questions (+ TTL, eviction)
+    python benchmarks.py chatwindow       # payload size + latency over a 50-turn chat, full history vs ChatMemory
+    python benchmarks.py trends           # symptom trend prompts: full history vs incremental, one click a day
+    python benchmarks.py trendengine      # local trend engine speed + parity, change points, risk scores
+    python benchmarks.py store            # SQLite symptom-log store vs the session-state list, ~370k logs
+    python benchmarks.py columns          # columnar logs + memoized table/chart frames vs list of dicts, 10k/100k
+    python benchmarks.py import           # streamed CSV/Parquet import + chunked export vs whole-file, ~320k rows
+    python benchmarks.py partition        # one patient's view vs clinic size (10–1000 patients), mixed vs per-patient
+    python benchmarks.py score            # headless score_scans() throughput + memory vs loading a folder up front
+    python benchmarks.py decodepool       # multi-file upload scoring with 0/1/2/4/8 decode worker processes
+    python benchmarks.py serve            # serve.py load test: p50/p99 latency + req/s at 1–32 clients, batching on/off
+    python benchmarks.py replicas         # RAM for 1–8 app replicas, each with its own model vs one model_server.py
+    python benchmarks.py shm              # DecodePool pixels via shared-memory ring vs pickling: bytes copied, img/s
+    python benchmarks.py bulk             # bulk email throughput against a local SMTP sink (needs aiosmtpd)
+"""
+import argparse
+import functools
+import io
+import json
+import logging
+import multiprocessing as mp
+import os
+import pickle
+import smtplib
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import requests
+from PIL import Image
+
+import neuroscan    # scan pipeline library — no Streamlit
+import symptoms     # symptom log columns + trend facts — no Streamlit
+
+
+def load_app():
+    """Import app.py in Streamlit bare mode (UI calls become no-ops)."""
+    os.environ.setdefault("NEUROSCAN_WARMUP", "0")    # keep the background loader out of timings
+    logging.disable(logging.WARNING)
+    import app
+    logging.disable(logging.NOTSET)
+    return app
+
+
+def synthetic_mri(size: int = 256, seed: int = 0) -> Image.Image:
+    """Dark field with a bright textured oval — passes is_likely_mri()."""
+    rng    = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size]
+    mask   = ((yy - size / 2) / (size * 0.38)) ** 2 + ((xx - size / 2) / (size * 0.30)) ** 2 <= 1
+    arr    = rng.normal(8, 4, (size, size))
+    arr[mask] = rng.normal(140, 35, int(mask.sum()))
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8), "L")
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def reset_peak_rss():
+    """Restart the kernel's peak-RSS counter (VmHWM) at the current RSS (Linux)."""
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size since start or the last reset_peak_rss(), in MB (Linux)."""
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1e3
+
+
+def memory_mb(pid: int) -> tuple:
+    """(RSS, PSS) of a process in MB (Linux). PSS splits shared pages between the processes
+    mapping them, so summing it over processes gives the RAM they really use together."""
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.endswith("kB\n")}
+    return fields["Rss"] / 1e3, fields["Pss"] / 1e3
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    """Best wall-clock time of `repeat` runs, in seconds."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+# ── Benchmarks ─────────────────────────────────────────────────
+def bench_batch(args):
+    app    = load_app()
+    model  = app.load_model()
+    images = [synthetic_mri(256, seed=i) for i in range(args.n)]
+    neuroscan.predict_batch(model, images[:2])    # warm-up / graph tracing
+
+    def one_at_a_time():
+        for img in images:
+            model.predict(neuroscan.preprocess(img), verbose=0)[0]
+
+    base = best_of(one_at_a_time, args.repeat)
+    print(f"{'mode':<22}{'total s':>10}{'img/s':>10}{'speedup':>10}")
+    print(f"{'one-at-a-time':<22}{base:>10.2f}{args.n / base:>10.1f}{1.0:>9.2f}x")
+    for bs in (4, 8, 16, 32):
+        t = best_of(lambda: neuroscan.predict_batch(model, images, batch_size=bs), args.repeat)
+        print(f"{f'predict_batch({bs})':<22}{t:>10.2f}{args.n / t:>10.1f}{base / t:>9.2f}x")
+
+
+def bench_preprocess(args):
+    rng = np.random.default_rng(0)
+
+    # Parity: odd sizes, portrait/landscape, up- and down-scaling
+    sizes = [(176, 208), (208, 176), (224, 224), (223, 225), (37, 1000), (2048, 1536)]
+    sizes += [tuple(int(v) for v in rng.integers(8, 1500, 2)) for _ in range(args.n)]
+    worst = 0.0
+    for h, w in sizes:
+        img = Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+        worst = max(worst, float(np.abs(neuroscan.preprocess(img) - neuroscan.preprocess_tf(img)).max()))
+    print(f"parity: {len(sizes)} sizes, max |numpy - tf| = {worst:.2e}")
+    assert worst <= 1e-3, "preprocess() diverges from preprocess_tf()"
+
+    print(f"{'input':<16}{'tf ms':>10}{'numpy ms':>10}{'saved ms':>10}")
+    for size in (208, 512, 1024, 2048):
+        for mode in ("L", "RGB"):
+            img = synthetic_mri(size).convert(mode)
+            neuroscan.preprocess_tf(img)
+            t_tf = best_of(lambda: [neuroscan.preprocess_tf(img) for _ in range(20)], args.repeat) / 20 * 1000
+            t_np = best_of(lambda: [neuroscan.preprocess(img) for _ in range(20)], args.repeat) / 20 * 1000
+            print(f"{f'{size}x{size} {mode}':<16}{t_tf:>10.2f}{t_np:>10.2f}{t_tf - t_np:>10.2f}")
+
+
+def legacy_is_likely_mri_details(img: Image.Image) -> dict:
+    """The original full-resolution float32 statistics of is_likely_mri(), for comparison."""
+    arr_rgb  = np.array(img.convert("RGB"), dtype=np.float32)
+    arr_gray = np.array(img.convert("L"), dtype=np.float32)
+    total_pixels = arr_gray.size
+    r, g, b = arr_rgb[:, :, 0], arr_rgb[:, :, 1], arr_rgb[:, :, 2]
+    return {
+        "dark_ratio":      np.sum(arr_gray < 25) / total_pixels,
+        "color_score":     np.std(r.astype(float) - g.astype(float)) + np.std(g.astype(float) - b.astype(float)),
+        "channel_diff":    np.mean(np.abs(r - g)) + np.mean(np.abs(g - b)),
+        "mean_brightness": np.mean(arr_gray),
+        "std_brightness":  np.std(arr_gray),
+        "bright_ratio":    np.sum(arr_gray > 100) / total_pixels,
+    }
+
+
+def bench_validate(args):
+    rng = np.random.default_rng(0)
+
+    # Parity: grayscale scans, tinted scans and random colour noise
+    samples = [synthetic_mri(300, seed=i) for i in range(4)]
+    samples += [Image.merge("RGB", [synthetic_mri(300, seed=i).point(lambda v, k=k: v * k) for k in (1.0, 0.8, 0.6)])
+                for i in range(4)]
+    samples += [Image.fromarray(rng.integers(0, 256, (200, 260, 3), dtype=np.uint8)) for _ in range(4)]
+    worst = 0.0
+    for img in samples:
+        new, old = neuroscan.is_likely_mri(img)[2], legacy_is_likely_mri_details(img)
+        worst = max(worst, max(abs(float(new[k]) - float(old[k])) for k in old))
+    print(f"parity: {len(samples)} images, max |details delta| = {worst:.2e}")
+    assert worst <= 1e-3, "is_likely_mri() statistics diverge from the original implementation"
+
+    # Inputs above VALIDATION_MAX_SIDE are point-sampled, so report their drift too
+    print(f"{'input':<16}{'legacy ms':>11}{'hist ms':>10}{'speedup':>10}{'max delta':>12}")
+    for size in (512, 2048, 4096):
+        for mode in ("L", "RGB"):
+            img   = synthetic_mri(size).convert(mode)
+            new   = neuroscan.is_likely_mri(img)[2]
+            old   = legacy_is_likely_mri_details(img)
+            delta = max(abs(float(new[k]) - float(old[k])) for k in old)
+            t_old = best_of(lambda: legacy_is_likely_mri_details(img), args.repeat) * 1000
+            t_new = best_of(lambda: neuroscan.is_likely_mri(img), args.repeat) * 1000
+            print(f"{f'{size}x{size} {mode}':<16}{t_old:>11.1f}{t_new:>10.1f}{t_old / t_new:>9.1f}x{delta:>12.2e}")
+
+
+def _backend_worker(backend: str, n: int, repeat: int, queue):
+    """Runs in a fresh process so each backend's RSS is measured in isolation."""
+    before = rss_mb()
+    t0     = time.perf_counter()
+    model  = neuroscan.load_backend(backend)
+    load_s = time.perf_counter() - t0
+    # Vary brightness so the scans do not all land on the same prediction
+    batch  = np.concatenate([neuroscan.preprocess(synthetic_mri(256, seed=i).point(lambda v, k=1 - (i % 8) * 0.08: v * k))
+                             for i in range(n)])
+
+    model.predict(batch[:1], batch_size=1, verbose=0)    # warm-up
+    single = best_of(lambda: [model.predict(batch[i:i + 1], batch_size=1, verbose=0) for i in range(n)], repeat)
+    model.predict(batch[:16], batch_size=16, verbose=0)
+    batched = best_of(lambda: [model.predict(batch[i:i + 16], batch_size=16, verbose=0) for i in range(0, n, 16)], repeat)
+    probs = np.concatenate([model.predict(batch[i:i + 16], batch_size=16, verbose=0) for i in range(0, n, 16)])
+    queue.put({
+        "load_s": load_s, "ms_1": single / n * 1000, "ms_16": batched / n * 1000,
+        "rss_model": rss_mb() - before, "rss_total": rss_mb(), "probs": probs,
+    })
+
+
+def bench_backends(args):
+    ctx     = mp.get_context("spawn")
+    results = {}
+    for backend in ("keras", "tflite-fp32", "tflite-fp16", "tflite-int8"):
+        queue = ctx.Queue()
+        proc  = ctx.Process(target=_backend_worker, args=(backend, args.n, args.repeat, queue))
+        proc.start()
+        results[backend] = queue.get()
+        proc.join()
+
+    ref = results["keras"]["probs"]
+    print(f"{'backend':<14}{'load s':>8}{'ms/img b1':>11}{'ms/img b16':>12}{'+RSS MB':>9}{'RSS MB':>8}"
+          f"{'max dprob':>11}{'top-1 agree':>13}")
+    for backend, r in results.items():
+        dprob = np.abs(r["probs"] - ref).max() * 100
+        agree = np.mean(r["probs"].argmax(1) == ref.argmax(1)) * 100
+        print(f"{backend:<14}{r['load_s']:>8.1f}{r['ms_1']:>11.1f}{r['ms_16']:>12.1f}{r['rss_model']:>9.0f}"
+              f"{r['rss_total']:>8.0f}{dprob:>10.2f}%{agree:>12.0f}%")
+
+
+def _warmup_worker(mode: str, queue):
+    """Fresh process per mode, so the first call really is the first one."""
+    img = synthetic_mri(256)
+    t0  = time.perf_counter()
+    if mode == "keras predict()":
+        import tensorflow as tf
+        model   = tf.keras.models.load_model(neuroscan.model_path("keras"))
+        predict = lambda x: model.predict(x, verbose=0)
+    else:
+        model   = neuroscan.load_backend("keras")
+        predict = model.predict
+    load_s = time.perf_counter() - t0
+
+    def timed() -> float:
+        t = time.perf_counter()
+        predict(neuroscan.preprocess(img))
+        return (time.perf_counter() - t) * 1000
+
+    first  = timed()
+    steady = sorted(timed() for _ in range(20))[10]
+    queue.put((load_s, first, steady))
+
+
+def bench_warmup(args):
+    ctx = mp.get_context("spawn")
+    print(f"{'path':<28}{'load s':>8}{'1st scan ms':>13}{'steady ms':>11}")
+    for mode in ("keras predict()", "load_backend() + tf.function"):
+        queue = ctx.Queue()
+        proc  = ctx.Process(target=_warmup_worker, args=(mode, queue))
+        proc.start()
+        load_s, first, steady = queue.get()
+        proc.join()
+        print(f"{mode:<28}{load_s:>8.1f}{first:>13.1f}{steady:>11.1f}")
+
+
+def smtp_sink(port: int):
+    """Local SMTP server (aiosmtpd) that accepts any login and discards every message."""
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+
+    class Sink:
+        async def handle_DATA(self, server, session, envelope):
+            return "250 Message accepted"
+
+    controller = Controller(Sink(), hostname="127.0.0.1", port=port, auth_require_tls=False,
+                            authenticator=lambda *a: AuthResult(success=True))
+    controller.start()
+    return controller
+
+
+def legacy_build_email_html(STAGE_DATA, name, age, stage_key, conf, all_probs):
+    """build_email_html() before the precompiled templates — kept for parity checks."""
+    from datetime import datetime
+    data     = STAGE_DATA[stage_key]
+    c        = data["color"]
+    date_str = datetime.now().strftime("%d %B %Y")
+
+    rows = ""
+    for item in data["supplements"]:
+        tc   = c if item["type"] == "medication" else "#a78bfa"
+        icon = ""
+        sched = "<br>".join([f"{t}" for t in item["times"]])
+        rows += f"""<tr>
+          <td style="padding:10px 14px;border-bottom:1px solid #1e293b;">
+            <strong style="color:{tc};font-size:13px;">{icon} {item['name']}</strong>
+            <div style="font-size:11px;color:#cbd5e1;margin-top:2px;">{item['purpose']}</div>
+          </td>
+          <td style="padding:10px 14px;border-bottom:1px solid #1e293b;color:#e2e8f0;font-weight:600;">{item['dose']}</td>
+          <td style="padding:10px 14px;border-bottom:1px solid #1e293b;color:{c};font-size:12px;line-height:1.8;">{sched}</td>
+        </tr>"""
+
+    bars = ""
+    for cls, prob in sorted(all_probs.items(), key=lambda x: -x[1]):
+        bc = STAGE_DATA[cls]["color"]
+        bars += f"""<div style="margin-bottom:8px;">
+          <div style="display:flex;justify-content:space-between;font-size:12px;">
+            <span style="color:#cbd5e1;">{STAGE_DATA[cls]['label']}</span>
+            <span style="color:{bc};font-weight:600;">{prob:.1f}%</span>
+          </div>
+          <div style="background:#1e293b;border-radius:4px;height:6px;">
+            <div style="width:{min(prob,100):.1f}%;background:{bc};height:6px;border-radius:4px;"></div>
+          </div>
+        </div>"""
+
+    patient_line = f"""<p style="margin:6px 0 0;color:{c};font-size:13px;">
+        <strong>Patient:</strong> {name}{f" &nbsp;·&nbsp; Age: {age}" if age else ""}
+    </p>""" if name else ""
+
+    return f"""<!DOCTYPE html><html>
+<body style="background:#08090f;font-family:'Segoe UI',Arial,sans-serif;margin:0;padding:0;">
+<div style="max-width:640px;margin:0 auto;padding:24px 16px;">
+  <div style="background:linear-gradient(135deg,#0f0f1f,#1a1a2e);border:1px solid #1e293b;
+              border-radius:14px;padding:20px;margin-bottom:18px;text-align:center;">
+    
+    <h1 style="margin:4px 0 0;color:#e0e7ff;font-size:20px;">NeuroScan AI</h1>
+    <p style="margin:3px 0 0;color:#6366f1;font-size:11px;letter-spacing:.15em;text-transform:uppercase;">
+      Alzheimer's Detection & Care Protocol
+    </p>
+  </div>
+  <div style="background:linear-gradient(135deg,{c}0a,{data['bg']});border:1.5px solid {c}55;
+              border-radius:14px;padding:18px;margin-bottom:16px;">
+    <div style="display:flex;align-items:center;gap:10px;margin-bottom:8px;">
+      <span style="font-size:24px;">{data['emoji']}</span>
+      <div>
+        <div style="color:{c};font-size:18px;font-weight:700;">{data['label']}</div>
+        <div style="color:#cbd5e1;font-size:12px;">
+          Confidence: <strong style="color:{c};">{conf:.1f}%</strong> &nbsp;·&nbsp; {data['urgency']}
+        </div>
+      </div>
+    </div>
+    <p style="color:#cbd5e1;font-size:13px;margin:0;">{data['description']}</p>
+    {patient_line}
+    <p style="color:#cbd5e1;font-size:11px;margin:6px 0 0;">Report Date: {date_str}</p>
+  </div>
+  <div style="background:#0f172a;border:1px solid #1e293b;border-radius:14px;padding:16px;margin-bottom:16px;">
+    <h3 style="margin:0 0 12px;color:#e2e8f0;font-size:12px;text-transform:uppercase;letter-spacing:.1em;">
+      Model Confidence Breakdown
+    </h3>{bars}
+  </div>
+  <div style="background:#0f172a;border:1px solid #1e293b;border-radius:14px;overflow:hidden;margin-bottom:16px;">
+    <div style="padding:10px 14px;background:#0a0f1e;color:{c};font-size:12px;font-weight:600;
+                text-transform:uppercase;letter-spacing:.12em;border-bottom:1px solid {c}33;">PRESCRIBED PROTOCOL</div>
+    <table style="width:100%;border-collapse:collapse;">
+      <thead><tr style="background:#080d16;">
+        <th style="padding:7px 12px;text-align:left;font-size:10px;color:#cbd5e1;
+                   text-transform:uppercase;border-bottom:1px solid #1e293b;">Name</th>
+        <th style="padding:7px 12px;text-align:left;font-size:10px;color:#cbd5e1;
+                   text-transform:uppercase;border-bottom:1px solid #1e293b;">Dose</th>
+        <th style="padding:7px 12px;text-align:left;font-size:10px;color:#cbd5e1;
+                   text-transform:uppercase;border-bottom:1px solid #1e293b;">Schedule</th>
+      </tr></thead>
+      <tbody>{rows}</tbody>
+    </table>
+  </div>
+  <div style="background:#0f172a;border:1px solid #1e3a5f;border-radius:12px;padding:14px;margin-bottom:14px;">
+    <h3 style="margin:0 0 8px;color:#38bdf8;font-size:12px;text-transform:uppercase;">Daily Reminder Tips</h3>
+    <ul style="margin:0;padding-left:16px;color:#cbd5e1;font-size:12px;line-height:2;">
+      <li>Set phone alarms for each medication time above.</li>
+      <li>Take supplements with food for better absorption.</li>
+      <li>Keep a daily medication log to track compliance.</li>
+      <li>Follow up with your neurologist every 3 months.</li>
+      <li>Combine medication with physical exercise and cognitive activities.</li>
+    </ul>
+  </div>
+  <div style="background:rgba(239,68,68,.06);border:1px solid #7f1d1d;border-radius:10px;padding:10px 14px;">
+    <p style="margin:0;color:#f87171;font-size:11px;line-height:1.7;">
+      <strong>Note:</strong> AI-generated guidance only.
+      Always consult a licensed neurologist before starting any medication or supplement.
+    </p>
+  </div>
+  <p style="text-align:center;color:#e2e8f0;font-size:10px;margin-top:16px;">
+    NeuroScan AI · EfficientNetB0 · 96.3% Accuracy · {date_str}
+  </p>
+</div></body></html>"""
+
+
+def bench_email(args):
+    app    = load_app()
+    n      = args.n * 160    # default -n 64 → ~10k renders
+    stages = list(app.LABEL_MAP.values())
+    rng    = np.random.default_rng(0)
+    cases  = []
+    for i in range(n):
+        p     = rng.dirichlet(np.ones(4)) * 100
+        probs = {k: float(v) for k, v in zip(stages, p)}
+        stage = max(probs, key=probs.get)
+        cases.append((f"Patient {i}" if i % 3 else "", str(60 + i % 30) if i % 2 else "", stage, probs[stage], probs))
+
+    for case in cases:
+        assert app.build_email_html(*case) == legacy_build_email_html(app.STAGE_DATA, *case), case
+    print(f"parity: byte-identical HTML on {n} cases ✓")
+
+    def render_all(fn):
+        for case in cases:
+            fn(*case)
+
+    t_old = best_of(lambda: render_all(functools.partial(legacy_build_email_html, app.STAGE_DATA)), args.repeat)
+    t_new = best_of(lambda: render_all(app.build_email_html), args.repeat)
+    print(f"{n} renders: f-string concatenation {t_old * 1e3:.0f} ms ({t_old / n * 1e6:.1f} µs/email), "
+          f"precompiled {t_new * 1e3:.0f} ms ({t_new / n * 1e6:.1f} µs/email) → {t_old / t_new:.1f}x")
+
+
+def mock_chat_server(port: int, certfile: str = None):
+    """
+    Local OpenAI-compatible /chat/completions stub (HTTP/1.1 keep-alive, TLS if certfile).
+    Replies with handler.reply, one piece per handler.token_delay seconds — all at once, or as
+    server-sent events when the request has "stream": true. Push status codes onto
+    handler.failures to make the next requests fail.
+    """
+    import ssl
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        wbufsize = 1 << 16    # one write per reply — unbuffered writes hit Nagle/delayed-ACK stalls
+        failures = []
+        received = []    # request body sizes, in bytes
+        reply = ["Mock", " reply."]
+        token_delay = 0.0
+        prefill_rate = 0.0    # prompt tokens/s (~4 bytes each) the stub "reads" before answering; 0 = instant
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body):
+            out = json.dumps(body).encode()
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0.2")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def send_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_POST(self):
+            body    = self.rfile.read(int(self.headers["Content-Length"]))
+            Handler.received.append(len(body))
+            request = json.loads(body)
+            if self.prefill_rate:
+                time.sleep(len(body) / 4 / self.prefill_rate)
+            status  = Handler.failures.pop(0) if Handler.failures else 200
+            if status != 200:
+                return self.send_json(status, {"error": {"message": f"mock {status}"}})
+            if not request.get("stream"):
+                time.sleep(self.token_delay * len(self.reply))    # generate the whole answer first
+                return self.send_json(200, {"choices": [{"message": {"role": "assistant", "content": "".join(self.reply)}}]})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for piece in self.reply:
+                time.sleep(self.token_delay)
+                event = {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self.send_chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+            self.send_chunk(b"data: [DONE]\n\n")
+            self.send_chunk(b"")
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    if certfile:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(certfile)
+        server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, Handler
+
+
+def self_signed_cert(folder: str) -> str:
+    """Write a localhost cert+key PEM with the openssl CLI; returns its path."""
+    path = os.path.join(folder, "localhost.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=localhost", "-addext", "subjectAltName=IP:127.0.0.1",
+                    "-keyout", path, "-out", path], check=True, capture_output=True)
+    return path
+
+
+def bench_groq(args):
+    app     = load_app()
+    tmp     = tempfile.mkdtemp()
+    cert    = self_signed_cert(tmp)
+    os.environ["REQUESTS_CA_BUNDLE"] = cert    # trust the mock's cert in both clients
+    port    = 8443
+    server, handler = mock_chat_server(port, cert)
+    url     = f"https://127.0.0.1:{port}/openai/v1/chat/completions"
+    payload = {"model": app.GROQ_MODEL, "messages": [{"role": "user", "content": "Hi"}], "max_tokens": 10}
+
+    def old_call():
+        # What ask_neuroscan_ai() did before: a fresh connection (and TLS handshake) per message
+        resp = requests.post(url, headers={"Authorization": "Bearer x"}, json=payload, timeout=30)
+        return resp.json()["choices"][0]["message"]["content"]
+
+    client = app.GroqClient(url=url)
+    new_call = lambda: client.chat("x", payload["messages"], max_tokens=10)
+
+    print(f"{'client':<32}{'p50 ms':>8}{'mean ms':>9}")
+    for label, fn in (("requests.post per message", old_call), ("GroqClient (pooled)", new_call)):
+        fn()    # first call pays the handshake either way
+        lat = []
+        for _ in range(args.n):
+            t0 = time.perf_counter()
+            assert fn() == "Mock reply."
+            lat.append(time.perf_counter() - t0)
+        print(f"{label:<32}{np.median(lat) * 1e3:>8.2f}{np.mean(lat) * 1e3:>9.2f}")
+
+    handler.failures[:] = [429, 503]
+    t0    = time.perf_counter()
+    reply = client.chat("x", payload["messages"])
+    print(f"429 (Retry-After 0.2s) then 503: {reply!r} after {time.perf_counter() - t0:.2f}s")
+    handler.failures[:] = [400]
+    print(f"400 is not retried: {client.chat('x', payload['messages'])!r}")
+    print("client.stats():", {k: round(v, 2) for k, v in client.stats().items()})
+    server.shutdown()
+
+
+def bench_stream(args):
+    app    = load_app()
+    port   = 8044
+    server, handler = mock_chat_server(port)
+    handler.reply       = [f" word{i}" for i in range(args.n * 3)]    # default -n 64 → 192-token answer
+    handler.token_delay = 0.01                                     # ~100 tokens/s generation
+    client   = app.GroqClient(url=f"http://127.0.0.1:{port}/openai/v1/chat/completions")
+    messages = [{"role": "user", "content": "How can I help as a caregiver?"}]
+
+    t0    = time.perf_counter()
+    whole = client.chat("x", messages)
+    t_full = time.perf_counter() - t0
+
+    t0, first, pieces = time.perf_counter(), None, []
+    for piece in client.stream_chat("x", messages):
+        if first is None:
+            first = time.perf_counter() - t0
+        pieces.append(piece)
+    t_stream = time.perf_counter() - t0
+    assert "".join(pieces) == whole, "streamed text differs from the non-streamed reply"
+
+    print(f"{len(handler.reply)}-token answer at {1 / handler.token_delay:.0f} tokens/s:")
+    print(f"  non-streaming: first text after {t_full * 1e3:.0f} ms (whole answer)")
+    print(f"  streaming:     first token after {first * 1e3:.0f} ms, done after {t_stream * 1e3:.0f} ms "
+          f"({len(pieces)} pieces, identical text)")
+
+    handler.failures[:] = [503]
+    print(f"  503 before streaming is retried: {''.join(client.stream_chat('x', messages))[:24]!r}…")
+    handler.failures[:] = [401]
+    print(f"  401 is reported: {''.join(client.stream_chat('x', messages))!r}")
+    server.shutdown()
+
+
+def bench_chat_cache(args):
+    path = os.path.join(tempfile.mkdtemp(), "chat_cache.sqlite3")
+    os.environ["NEUROSCAN_CHAT_CACHE"] = path
+    app    = load_app()
+    port   = 8046
+    server, handler = mock_chat_server(port)
+    handler.reply       = [f" word{i}" for i in range(100)]
+    handler.token_delay = 0.005
+    app.get_groq_client().url = f"http://127.0.0.1:{port}/openai/v1/chat/completions"
+
+    chips  = ["What do these nutrients do?", "What foods should the patient eat?",
+              "What does this stage mean day-to-day?", "How can I help as a caregiver?"]
+    # Same questions the way people actually type them
+    typed  = ["what do the nutrients do", "What foods should patients eat??",
+              "what does this stage mean day to day", "how can I help as a caregiver"]
+    stages = list(app.STAGE_DATA)
+
+    def ask_all(questions, stream=False):
+        lat = []
+        for stage in stages:
+            for q in questions:
+                t0    = time.perf_counter()
+                reply = app.ask_neuroscan_ai([{"role": "user", "content": q}], app.stage_context_line(stage, 91.2), "x",
+                                             stream=stream, stage=stage)
+                "".join(reply) if stream else reply
+                lat.append(time.perf_counter() - t0)
+        return np.array(lat) * 1e3
+
+    cold, warm, typed_lat = ask_all(chips), ask_all(chips), ask_all(typed, stream=True)
+    print(f"16 opening questions (4 chips × 4 stages), 100-token answers at {1 / handler.token_delay:.0f} tokens/s:")
+    print(f"  first ask (API):            mean {cold.mean():8.2f} ms")
+    print(f"  repeat (cache):             mean {warm.mean():8.2f} ms")
+    print(f"  reworded, streamed (cache): mean {typed_lat.mean():8.2f} ms")
+    print("  stats:", app.get_response_cache().stats())
+
+    reopened = app.ResponseCache(path)
+    print(f"  persisted: {reopened.stats()['entries']} entries after reopening {os.path.basename(path)}")
+    small = app.ResponseCache(os.path.join(os.path.dirname(path), "small.sqlite3"), max_entries=3, ttl=0.2)
+    for i in range(5):
+        small.put(small.key("Mild Demented", f"question {i}"), "Mild Demented", f"question {i}", "answer")
+    print(f"  max_entries=3 after 5 puts: {small.stats()['entries']} entries")
+    time.sleep(0.25)
+    print(f"  ttl=0.2s after 0.25s: hit = {small.get(small.key('Mild Demented', 'question 4')) is not None}")
+    server.shutdown()
+
+
+def bench_chat_window(args):
+    app    = load_app()
+    port   = 8047
+    server, handler = mock_chat_server(port)
+    answer = ("Vitamin E is an antioxidant that helps protect brain cells from oxidative stress. "
+              "At this stage it is usually combined with omega-3 and B vitamins for the best effect. "
+              "Try to take it with a meal that contains some fat, since that improves absorption. "
+              "Keep a simple log of doses and mention any bruising or stomach upset to the neurologist. "
+              "Regular walks, good sleep and social activities support the same goal as the supplements.")
+    handler.reply        = [w + " " for w in answer.split()]
+    handler.prefill_rate = 3000.0
+    client  = app.GroqClient(url=f"http://127.0.0.1:{port}/openai/v1/chat/completions")
+    context = "Patient stage: Mild Demented (Confidence: 91.2%). Urgency: Medical Attention Required."
+    turns   = 50
+
+    def converse(memory):
+        history, sizes, lat, window_ms = [], [], [], []
+        for turn in range(turns):
+            history.append({"role": "user", "content": f"Question {turn}: my mother forgets her evening dose "
+                                                       f"sometimes and gets anxious at night — what should we try?"})
+            t0       = time.perf_counter()
+            window   = memory.window(history) if memory else history
+            window_ms.append((time.perf_counter() - t0) * 1e3)
+            messages = [{"role": "system", "content": app.neuroscan_system_prompt(context)}] + window
+            sizes.append(len(json.dumps({"model": app.GROQ_MODEL, "messages": messages,
+                                         "max_tokens": 1000, "temperature": 0.7})))
+            t0    = time.perf_counter()
+            reply = client.chat("x", messages)
+            lat.append((time.perf_counter() - t0) * 1e3)
+            history.append({"role": "assistant", "content": reply})
+        return np.array(sizes) / 1e3, np.array(lat), np.array(window_ms)
+
+    print(f"{turns}-turn conversation, ~{len(answer)}-char answers, stub prefill {handler.prefill_rate:.0f} tokens/s")
+    print(f"{'history sent':<26}{'KB t10':>8}{'KB t25':>8}{'KB t50':>8}{'ms t50':>8}{'mean ms':>9}{'window ms':>11}")
+    for label, memory in (("full (before)", None),
+                          (f"ChatMemory({app.CHAT_TOKEN_BUDGET})", app.ChatMemory()),
+                          ("ChatMemory(1000)", app.ChatMemory(1000))):
+        kb, lat, win = converse(memory)
+        print(f"{label:<26}{kb[9]:>8.1f}{kb[24]:>8.1f}{kb[49]:>8.1f}{lat[49]:>8.0f}{lat.mean():>9.0f}{win.mean():>11.3f}")
+
+    memory = app.ChatMemory(1000)
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": answer} for i in range(100)]
+    window  = memory.window(history)
+    print(f"ChatMemory(1000) on 100 messages: {len(window) - 1} verbatim + summary of "
+          f"{len(memory.summary)} lines ({sum(app.estimate_tokens(m['content']) for m in window)} est. tokens)")
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        app.neuroscan_system_prompt(context)
+    print(f"system prompt (cached): {(time.perf_counter() - t0) * 1e3:.3f} µs/turn")
+    server.shutdown()
+
+
+def synthetic_symptom_logs(days: int, patient_id: str = "PT-001", seed: int = 0) -> list:
+    """Daily symptom logs for one patient with a slow decline plus noise."""
+    rng   = np.random.default_rng(seed)
+    start = date(2026, 1, 1)
+    logs  = []
+    for d in range(days):
+        drift = d / 60
+        score = lambda base, sign=1: int(np.clip(round(base + sign * drift + rng.normal(0, 1)), 0, 10))
+        logs.append({"date": str(start + timedelta(days=d)), "patient_id": patient_id, "patient_name": "A. Patient",
+                     "memory": score(3), "confusion": score(3), "mood": score(3), "tasks": score(3),
+                     "sleep": score(6, -1), "overall": score(6, -1), "notes": "Walked in the morning, ate well."})
+    return logs
+
+
+def bench_trends(args):
+    app    = load_app()
+    port   = 8048
+    server, handler = mock_chat_server(port)
+    handler.reply        = [w + " " for w in ("TREND SUMMARY: stable with a slight decline in memory. " * 12).split()]
+    handler.prefill_rate = 3000.0
+    app.get_groq_client().url = f"http://127.0.0.1:{port}/openai/v1/chat/completions"
+    days = max(args.n, 2)
+    logs = synthetic_symptom_logs(days)
+
+    print(f"Analyse clicked once a day for {days} days (stub prefill {handler.prefill_rate:.0f} tokens/s):")
+    print(f"{'mode':<14}{'KB day 7':>10}{'KB day 30':>11}{f'KB day {days}':>11}{'total KB':>10}{'total s':>9}")
+    for label, state in (("full (before)", None), ("incremental", {})):
+        handler.received.clear()
+        t0 = time.perf_counter()
+        for day in range(2, days + 1):
+            app.analyze_symptom_trends(logs[:day], "x", state=state)
+        total = time.perf_counter() - t0
+        kb = np.array(handler.received) / 1e3
+        print(f"{label:<14}{kb[5]:>10.1f}{kb[min(28, len(kb) - 1)]:>11.1f}{kb[-1]:>11.1f}{kb.sum():>10.0f}{total:>9.1f}")
+
+    handler.received.clear()
+    t0 = time.perf_counter()
+    app.analyze_symptom_trends(logs, "x", state=state)
+    print(f"re-click with no new logs: {len(handler.received)} API calls, {(time.perf_counter() - t0) * 1e3:.2f} ms "
+          f"(mode {state['PT-001']['mode']!r})")
+    edited = [dict(log) for log in logs]
+    edited[3]["memory"] = 9
+    app.analyze_symptom_trends(edited, "x", state=state)
+    print(f"after editing an old entry: mode {state['PT-001']['mode']!r}")
+
+    # The app's path: daily saves to the store, the report fed the patient's whole record
+    # (a "Last 90 days" window slides forward every day, which would force a full report)
+    store = app.SymptomStore(os.path.join(tempfile.mkdtemp(), "symptom_logs.sqlite3"))
+    store.upsert(logs[:-2])
+    state = {}
+    app.analyze_symptom_trends(store.window("PT-001").records(), "x", state=state)
+    modes = []
+    for log in logs[-2:]:
+        store.upsert([log])
+        app.analyze_symptom_trends(store.window("PT-001").records(), "x", state=state)
+        modes.append(state["PT-001"]["mode"])
+    assert modes == ["incremental", "incremental"], modes
+    print(f"two daily saves through SymptomStore: {' → '.join(modes)} ✓")
+    print()
+    print(app.trend_summary(logs))
+    server.shutdown()
+
+
+def bench_trend_engine(args):
+    fields = list(symptoms.TREND_FIELDS)
+
+    # Parity with pandas rolling means and np.polyfit slopes
+    logs   = synthetic_symptom_logs(200, seed=1)
+    trends = symptoms.symptom_trends(logs)
+    df     = pd.DataFrame(logs)
+    days   = pd.to_datetime(df["date"]).map(pd.Timestamp.toordinal).to_numpy(float)
+    for f in fields:
+        s = trends["symptoms"][f]
+        assert np.isclose(s["rolling"], df[f].rolling(7, min_periods=1).mean().iloc[-1])
+        assert np.isclose(s["slope"], np.polyfit(days, df[f], 1)[0] * 7)
+        assert np.isclose(s["recent_slope"], np.polyfit(days[-14:], df[f].iloc[-14:], 1)[0] * 7)
+    print("parity: rolling means match pandas, slopes match np.polyfit ✓")
+
+    # Change-point detection: memory jumps by 3 points on day 120 of 200
+    jumped = [dict(log, memory=min(log["memory"] + 3, 10)) if i >= 120 else log for i, log in enumerate(logs)]
+    cp = symptoms.symptom_trends(jumped)["symptoms"]["memory"]["change_point"]
+    print(f"memory +3 from {logs[120]['date']}: change point {cp['date']} ({cp['before']:.1f} → {cp['after']:.1f})")
+    calm = [dict(log, **{f: 3 if symptoms.TREND_WORSE_IF_HIGH[j] else 7 for j, f in enumerate(fields)}) for log in logs]
+    declining = synthetic_symptom_logs(200, seed=2)
+    for i, log in enumerate(declining[-30:]):
+        log.update(memory=min(10, 5 + i // 5), confusion=min(10, 5 + i // 6), tasks=min(10, 4 + i // 5),
+                   sleep=max(0, 5 - i // 6), overall=max(0, 5 - i // 5))
+    for label, case in (("flat, mild", calm), ("slow drift", logs), ("jump", jumped), ("sharp decline", declining)):
+        t = symptoms.symptom_trends(case)
+        print(f"  {label:<14} risk {t['risk_level']:<9}{t['risk_score']:>5.1f}/100")
+
+    print(f"{'entries':>8}{'symptom_trends ms':>20}")
+    for n in (100, 1000, 5000, 20000):
+        case = synthetic_symptom_logs(n, seed=3)
+        print(f"{n:>8}{best_of(lambda: symptoms.symptom_trends(case), args.repeat) * 1e3:>20.2f}")
+
+
+def bench_store(args):
+    app      = load_app()
+    patients = args.n * 16    # default -n 64 → 1024 patients
+    days     = 365
+    path     = os.path.join(tempfile.mkdtemp(), "symptom_logs.sqlite3")
+    store    = app.SymptomStore(path)
+    cohort   = [synthetic_symptom_logs(days, patient_id=f"PT-{p:05d}", seed=p) for p in range(patients)]
+    rows     = [log for logs in cohort for log in logs]
+    print(f"{patients} patients × {days} days = {len(rows):,} logs")
+
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), 10_000):
+        store.upsert(rows[i:i + 10_000])
+    t = time.perf_counter() - t0
+    print(f"batched upsert (10k/tx):    {t:6.2f} s  {len(rows) / t:,.0f} rows/s  ({os.path.getsize(path) / 1e6:.0f} MB)")
+    t0 = time.perf_counter()
+    existed = store.upsert(rows[:10_000])
+    print(f"re-upsert 10k existing:     {(time.perf_counter() - t0) * 1e3:6.0f} ms  ({existed} updated)")
+
+    # The old session-state list: linear scan per save, full sort per rerun
+    session = list(rows)
+    new_log = dict(rows[len(rows) // 2], memory=9)
+    def list_upsert():
+        existing = [i for i, l in enumerate(session)
+                    if l["date"] == new_log["date"] and l.get("patient_id", "") == new_log["patient_id"]]
+        session[existing[0]] = new_log
+    target = new_log["patient_id"]
+    def list_window():
+        logs = sorted(session, key=lambda x: x["date"])
+        last = max(l["date"] for l in logs if l["patient_id"] == target)
+        start = str(datetime.fromisoformat(last).date() - timedelta(days=89))
+        return [l for l in logs if l["patient_id"] == target and l["date"] >= start]
+    def store_window():
+        start = str(datetime.fromisoformat(store.last_date(target)).date() - timedelta(days=89))
+        return store.query(target, start=start)
+    assert [l["date"] for l in list_window()] == [l["date"] for l in store_window()]
+
+    print(f"{'per rerun':<28}{'list (before)':>14}{'SQLite store':>14}")
+    print(f"{'save one log':<28}{best_of(list_upsert, args.repeat) * 1e3:>11.2f} ms"
+          f"{best_of(lambda: store.upsert([new_log]), args.repeat) * 1e3:>11.2f} ms")
+    print(f"{'load one patient, 90 days':<28}{best_of(list_window, args.repeat) * 1e3:>11.2f} ms"
+          f"{best_of(store_window, args.repeat) * 1e3:>11.2f} ms")
+    print(f"{'list patients':<28}{'—':>14}{best_of(store.patients, args.repeat) * 1e3:>11.2f} ms")
+
+
+def bench_columns(args):
+    def traced(build):
+        tracemalloc.start()
+        obj = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return obj, size / 1e6
+
+    def old_render(logs):
+        # What tab 2 did on every rerun
+        df = pd.DataFrame(logs)
+        df_display = df[["date","patient_id","patient_name","memory","confusion","mood","tasks","sleep","overall","notes"]].copy()
+        df_display.columns = ["Date","Patient ID","Patient Name","Memory","Confusion","Mood","Tasks","Sleep","Overall","Notes"]
+        chart_df = df[["date","memory","confusion","mood","tasks","overall"]].set_index("date")
+        chart_df.columns = ["Memory Loss","Confusion","Mood Changes","Task Difficulty","Overall"]
+        return df_display, chart_df
+
+    def cold_render(cols):
+        cols._views.clear()
+        return cols.table(), cols.chart()
+
+    for total in (10_000, 100_000):
+        patients = max(1, total // 1000)
+        logs = sorted((log for p in range(patients)
+                       for log in synthetic_symptom_logs(total // patients, patient_id=f"PT-{p:03d}", seed=p)),
+                      key=lambda l: (l["date"], l["patient_id"]))
+        rows = [tuple(log[c] for c in symptoms.SYMPTOM_COLUMNS) for log in logs]
+        logs, dicts_mb = traced(lambda: [dict(zip(symptoms.SYMPTOM_COLUMNS, row)) for row in rows])
+        cols, cols_mb  = traced(lambda: symptoms.SymptomColumns(rows))
+        _, frame_mb    = traced(lambda: pd.DataFrame(logs))
+
+        # Parity: same table, same chart, same records, same trend facts
+        old_table, old_chart = old_render(logs)
+        assert (cols.table().astype({"Patient ID": object}).astype(str).values == old_table.astype(str).values).all()
+        assert (cols.chart().values == old_chart.values).all() and (cols.chart().index == old_chart.index).all()
+        assert cols.records() == logs
+        assert symptoms.symptom_trends(cols) == symptoms.symptom_trends(logs)
+
+        print(f"\n{total:,} logs, {patients} patients")
+        print(f"{'memory':<32}{'list of dicts':>14}{'DataFrame':>12}{'columns':>10}")
+        print(f"{'':<32}{dicts_mb:>11.1f} MB{frame_mb:>9.1f} MB{cols_mb:>7.1f} MB  ({cols.nbytes() / 1e6:.1f} MB arrays)")
+        print(f"{'per rerun':<32}{'before':>14}{'cold':>12}{'memoized':>10}")
+        print(f"{'table + chart frames':<32}{best_of(lambda: old_render(logs), args.repeat) * 1e3:>11.2f} ms"
+              f"{best_of(lambda: cold_render(cols), args.repeat) * 1e3:>9.2f} ms"
+              f"{best_of(lambda: (cols.table(), cols.chart()), args.repeat) * 1e3:>7.3f} ms")
+        print(f"{'symptom_trends()':<32}{best_of(lambda: symptoms.symptom_trends(logs), args.repeat) * 1e3:>11.2f} ms"
+              f"{best_of(lambda: symptoms.symptom_trends(cols), args.repeat) * 1e3:>9.2f} ms")
+        # Saving a log: rebuild everything vs append in place (mean over 100 saves, growth included)
+        rebuild = best_of(lambda: symptoms.SymptomColumns(rows), args.repeat)
+        last    = datetime.fromisoformat(logs[-1]["date"]).date()
+        t0 = time.perf_counter()
+        for i in range(100):
+            cols.append([("PT-000", str(last + timedelta(days=1 + i)), "", 3, 3, 3, 3, 6, 4, "")])
+        append = (time.perf_counter() - t0) / 100
+        print(f"{'save one log (rebuild / append)':<32}{rebuild * 1e3:>11.2f} ms{append * 1e3:>9.3f} ms")
+
+
+def synthetic_symptom_diary(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A clinic spreadsheet: rows spread over rows // 320 patients, ~1% of rows out of range."""
+    rng      = np.random.default_rng(seed)
+    patients = max(1, rows // 320)
+    idx      = np.arange(rows)
+    df = pd.DataFrame({
+        "patient_id":   np.char.add("PT-", (idx % patients).astype(str)),
+        "date":         (np.datetime64("2026-01-01") + idx // patients).astype(str),
+        "patient_name": "A. Patient",
+        **{f: rng.integers(0, 11, rows) for f in ("memory", "confusion", "mood", "tasks", "sleep", "overall")},
+        "notes":        "Walked in the morning, ate well.",
+    })
+    df.loc[rng.random(rows) < 0.01, "memory"] = 12
+    return df
+
+
+def _import_worker(mode: str, path: str, db: str, queue):
+    """Fresh process per mode, so peak RSS belongs to that import (or export) alone."""
+    import pyarrow.parquet as pq    # pandas pulls it in anyway; imported first to keep it out of the peak
+    app    = load_app()
+    store  = app.SymptomStore(db)
+    before = rss_mb()
+    reset_peak_rss()
+    t0     = time.perf_counter()
+    fmt    = app.symptom_file_format(path)
+    if mode == "whole file":
+        # Read everything, check ranges, then one upsert
+        df = pd.read_parquet(path) if fmt == "parquet" else pd.read_csv(path, keep_default_na=False)
+        ok = df[list(symptoms.SYMPTOM_SCORES)].apply(lambda c: c.between(0, 10)).all(axis=1)
+        logs = df[ok].to_dict("records")
+        store.upsert(logs)
+        rows = len(logs)
+    elif mode == "streamed":
+        rows = app.import_symptom_logs(store, path, fmt)["added"]
+    else:    # chunked export of a store filled by an earlier run
+        rows = app.export_symptom_logs(store, path + ".out", mode)
+    seconds = time.perf_counter() - t0
+    if mode == "parquet":    # round-trip: the chunked export reads back with every row
+        assert pq.read_metadata(path + ".out").num_rows == rows
+    queue.put((rows, seconds, peak_rss_mb() - before))
+
+
+def bench_import(args):
+    ctx    = mp.get_context("spawn")
+    folder = tempfile.mkdtemp()
+    diary  = synthetic_symptom_diary(args.n * 5000)
+    paths  = {"csv": os.path.join(folder, "diary.csv"), "parquet": os.path.join(folder, "diary.parquet")}
+    diary.to_csv(paths["csv"], index=False)
+    diary.to_parquet(paths["parquet"], index=False)
+    print(f"{len(diary):,} rows ({os.path.getsize(paths['csv']) / 1e6:.0f} MB CSV, "
+          f"{os.path.getsize(paths['parquet']) / 1e6:.1f} MB Parquet), "
+          f"chunks of {load_app().SYMPTOM_CHUNK_ROWS:,}")
+
+    def run(mode, path, db):
+        queue = ctx.Queue()
+        proc  = ctx.Process(target=_import_worker, args=(mode, path, db, queue))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        return result
+
+    print(f"{'':<28}{'rows':>9}{'s':>7}{'rows/s':>10}{'peak +MB':>10}")
+    for fmt, path in paths.items():
+        for mode in ("whole file", "streamed"):
+            db = os.path.join(folder, f"{fmt}-{mode}.sqlite3")
+            rows, seconds, peak = run(mode, path, db)
+            print(f"{f'import {fmt}, {mode}':<28}{rows:>9,}{seconds:>7.2f}{rows / seconds:>10,.0f}{peak:>10.0f}")
+    for fmt in ("csv", "parquet"):
+        rows, seconds, peak = run(fmt, os.path.join(folder, f"export.{fmt}"), db)
+        print(f"{f'export {fmt}, chunked':<28}{rows:>9,}{seconds:>7.2f}{rows / seconds:>10,.0f}{peak:>10.0f}")
+
+
+def bench_partition(args):
+    app = load_app()
+    print(f"{'patients':>9}{'logs':>10}{'mixed view':>12}{'patient cold':>14}{'patient warm':>14}{'save + view':>13}")
+    for patients in (10, 100, 1000):
+        store = app.SymptomStore(os.path.join(tempfile.mkdtemp(), "symptom_logs.sqlite3"))
+        rows, _ = app.validate_symptom_chunk(synthetic_symptom_diary(patients * 320, seed=patients))
+        for i in range(0, len(rows), 50_000):
+            store.upsert_rows(rows[i:i + 50_000])
+        pid   = "PT-0"
+        start = str(datetime.fromisoformat(store.last_date(pid)).date() - timedelta(days=89))
+
+        def mixed():
+            # Before: every patient's logs in the window fed the chart and the trend engine
+            logs = store.query(None, start=start)
+            df   = pd.DataFrame(logs)
+            return df[["date","memory","confusion","mood","tasks","overall"]].set_index("date"), symptoms.symptom_trends(logs)
+
+        def patient(cold):
+            if cold:
+                store._windows.clear()
+            cols = store.window(pid, start=start)
+            return cols.table(), cols.chart(), cols.trends()
+
+        day = [datetime.fromisoformat(store.last_date(pid)).date()]
+        def save_and_view():
+            day[0] += timedelta(days=1)
+            store.upsert([{"patient_id": pid, "date": str(day[0]), "patient_name": "", "notes": "",
+                           "memory": 3, "confusion": 3, "mood": 3, "tasks": 3, "sleep": 6, "overall": 6}])
+            return patient(cold=False)
+
+        patient(cold=False)
+        print(f"{patients:>9}{len(rows):>10,}"
+              f"{best_of(mixed, args.repeat) * 1e3:>9.2f} ms"
+              f"{best_of(lambda: patient(cold=True), args.repeat) * 1e3:>11.2f} ms"
+              f"{best_of(lambda: patient(cold=False), args.repeat) * 1e3:>11.3f} ms"
+              f"{best_of(save_and_view, args.repeat) * 1e3:>10.2f} ms")
+
+
+class NoModel:
+    """Zero-cost stand-in model, to time reading + validation + letterboxing on their own."""
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        return np.full((len(batch), 4), 0.25, dtype=np.float32)
+
+
+def _score_worker(mode: str, batch_size: int, paths: list, queue):
+    """Fresh process per pipeline, so its peak RSS isn't hidden by memory an earlier run left behind."""
+    model = NoModel() if mode == "no model" else neuroscan.load_backend(neuroscan.MODEL_BACKEND)
+    list(neuroscan.score_scans(paths[:batch_size], model, batch_size))    # warm-up: graph shapes
+
+    def load_everything():
+        # What a loop around the MRI tab's code does: open every image, then predict_batch()
+        images = [Image.open(p) for p in paths]
+        for img in images:
+            img.load()
+        valid = [img for img in images if neuroscan.is_likely_mri(img)[0]]
+        return neuroscan.predict_batch(model, valid, batch_size)
+
+    before = rss_mb()
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    if mode == "load all":
+        load_everything()
+    else:
+        list(neuroscan.score_scans(paths, model, batch_size))
+    queue.put((time.perf_counter() - t0, peak_rss_mb() - before))
+
+
+def bench_score(args):
+    ctx    = mp.get_context("spawn")
+    folder = tempfile.mkdtemp()
+    paths  = []
+    for i in range(args.n * 16):    # enough decoded pixels (~270 MB) to stand out from RSS noise
+        paths.append(os.path.join(folder, f"scan{i:04d}.png"))
+        synthetic_mri(512, seed=i).save(paths[-1])
+    print(f"{len(paths)} scans (512×512 PNG), {os.environ.get('NEUROSCAN_BACKEND', 'keras')} backend")
+
+    print(f"{'pipeline':<34}{'s':>7}{'img/s':>8}{'peak +MB':>10}")
+    for name, mode, batch_size in (("load all + predict_batch(16)", "load all", 16),
+                                   ("score_scans, batch 1", "stream", 1),
+                                   ("score_scans, batch 16", "stream", 16),
+                                   ("score_scans, batch 32", "stream", 32),
+                                   ("score_scans, batch 16, no model", "no model", 16)):
+        queue = ctx.Queue()
+        proc  = ctx.Process(target=_score_worker, args=(mode, batch_size, paths, queue))
+        proc.start()
+        seconds, peak = queue.get()
+        proc.join()
+        print(f"{name:<34}{seconds:>7.2f}{len(paths) / seconds:>8.1f}{peak:>10.0f}")
+
+
+def _decode_pool_worker(workers: int, with_model: bool, paths: list, queue):
+    """Fresh process per row: its own pool start-up, and a model that isn't sharing the CPU with the last row."""
+    model = neuroscan.load_backend(neuroscan.MODEL_BACKEND) if with_model else NoModel()
+    model.predict(np.zeros((16, neuroscan.IMG_SIZE, neuroscan.IMG_SIZE, 3), np.float32), batch_size=16, verbose=0)
+    blobs = []
+    for p in paths:    # uploads arrive as bytes, so time from bytes like the MRI tab does
+        with open(p, "rb") as f:
+            blobs.append(f.read())
+    pool = neuroscan.DecodePool(workers) if workers else None
+    if pool:
+        list(pool.imap(blobs[:workers]))    # start the workers outside the timing
+    before = rss_mb()
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    results = list(neuroscan.score_images(blobs, model, 16, pool=pool))
+    seconds = time.perf_counter() - t0
+    assert all(probs for _, probs, _ in results)
+    if pool:
+        pool.close()
+    queue.put((seconds, peak_rss_mb() - before))
+
+
+def bench_decode_pool(args):
+    ctx    = mp.get_context("spawn")
+    folder = tempfile.mkdtemp()
+    paths  = []
+    for i in range(args.n):
+        paths.append(os.path.join(folder, f"scan{i:04d}.png"))
+        synthetic_mri(1536, seed=i).save(paths[-1])    # full-resolution exports: decode dominates
+    print(f"{len(paths)} scans (1536×1536 PNG), {os.environ.get('NEUROSCAN_BACKEND', 'keras')} backend, "
+          f"{os.cpu_count()} CPUs")
+
+    print(f"{'pipeline':<30}{'workers':>8}{'s':>7}{'img/s':>8}{'speed-up':>9}{'peak +MB':>10}")
+    for with_model in (False, True):
+        base = None
+        for workers in (0, 1, 2, 4, 8):
+            queue = ctx.Queue()
+            proc  = ctx.Process(target=_decode_pool_worker, args=(workers, with_model, paths, queue))
+            proc.start()
+            seconds, peak = queue.get()
+            proc.join()
+            base = base or seconds
+            name = "decode + model" if with_model else "decode + validate only"
+            print(f"{name:<30}{workers or 'inline':>8}{seconds:>7.2f}{len(paths) / seconds:>8.1f}"
+                  f"{base / seconds:>8.2f}×{peak:>10.0f}")
+
+
+def serve_subprocess(port: int, *flags) -> subprocess.Popen:
+    """Start serve.py on `port` and wait until /healthz answers."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, os.path.join(here, "serve.py"), "--port", str(port), *flags],
+                            stderr=subprocess.DEVNULL)
+    for _ in range(1200):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/healthz", timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("serve.py did not start")
+
+
+def load_test(url: str, bodies: list, concurrency: int, total: int) -> tuple:
+    """`total` POSTs from `concurrency` keep-alive clients; returns (latencies in s, wall-clock s)."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        t0   = time.perf_counter()
+        resp = local.session.post(url, data=bodies[i % len(bodies)], timeout=120)
+        assert resp.status_code == 200, resp.text
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(concurrency) as clients:
+        list(clients.map(one, range(concurrency)))    # connect every client first
+        t0        = time.perf_counter()
+        latencies = list(clients.map(one, range(total)))
+        return latencies, time.perf_counter() - t0
+
+
+def bench_serve(args):
+    bodies = []
+    for seed in range(16):
+        buf = io.BytesIO()
+        synthetic_mri(256, seed=seed).save(buf, "PNG")
+        bodies.append(buf.getvalue())
+    backend = os.environ.get("NEUROSCAN_BACKEND", "keras")
+    print(f"{args.n * 4} requests per row, 256×256 PNG, {backend} backend, {os.cpu_count()} CPUs")
+
+    print(f"{'server':<26}{'clients':>8}{'p50 ms':>8}{'p99 ms':>8}{'req/s':>7}{'scans/batch':>12}")
+    for name, flags in (("no batching", ("--max-batch", "1")),
+                        ("batch ≤16, wait ≤5 ms", ("--max-batch", "16", "--max-wait-ms", "5")),
+                        ("batch ≤16, wait ≤20 ms", ("--max-batch", "16", "--max-wait-ms", "20"))):
+        port = 8500
+        proc = serve_subprocess(port, *flags)
+        url  = f"http://127.0.0.1:{port}"
+        try:
+            for concurrency in (1, 4, 16, 32):
+                before = requests.get(url + "/healthz").json()
+                latencies, seconds = load_test(url + "/v1/classify", bodies, concurrency, args.n * 4)
+                after  = requests.get(url + "/healthz").json()
+                per_batch = (after["scans"] - before["scans"]) / max(1, after["batches"] - before["batches"])
+                p50, p99  = np.percentile(latencies, [50, 99]) * 1e3
+                print(f"{name:<26}{concurrency:>8}{p50:>8.0f}{p99:>8.0f}{len(latencies) / seconds:>7.1f}{per_batch:>12.1f}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def bench_shm(args):
+    blobs = []
+    for seed in range(args.n * 8):
+        buf = io.BytesIO()
+        synthetic_mri(256, seed=seed).save(buf, "PNG")    # small scans: transport, not decoding, dominates
+        blobs.append(buf.getvalue())
+    row = neuroscan.IMG_SIZE * neuroscan.IMG_SIZE * 3 * 4
+
+    # Bytes a scan's pixels are copied through on the way into the model's batch:
+    # pickling = pickle.dumps in the worker, pipe write + read, pickle.loads, batch row;
+    # shared memory = the verdict's (tiny) pickle the same way, then ring slot -> batch row.
+    validation, pixels, error = neuroscan.prepare_scan(blobs[0])
+    with_pixels = len(pickle.dumps((validation, pixels, error)))
+    verdict     = len(pickle.dumps((validation, True, error)))
+    print(f"{len(blobs)} scans (256×256 PNG), no model, {os.cpu_count()} CPUs · pixels {row / 1e3:.0f} KB/scan")
+    print(f"{'transport':<30}{'workers':>8}{'pickled KB/img':>15}{'copied KB/img':>14}{'img/s':>8}")
+    print(f"{'inline (no pool)':<30}{'—':>8}{0:>15.1f}{0:>14.1f}"
+          f"{len(blobs) / best_of(lambda: list(neuroscan.score_images(blobs, NoModel())), args.repeat):>8.0f}")
+    for name, shared, pickled, copied in (("pickling queue", False, with_pixels, 4 * with_pixels + row),
+                                          ("shared-memory ring", True, verdict, 4 * verdict + row)):
+        for workers in (1, 2, 4):
+            with neuroscan.DecodePool(workers, shared_memory=shared) as pool:
+                list(pool.imap(blobs[:workers]))    # start the workers outside the timing
+                t = best_of(lambda: list(neuroscan.score_images(blobs, NoModel(), pool=pool)), args.repeat)
+            print(f"{name:<30}{workers:>8}{pickled / 1e3:>15.1f}{copied / 1e3:>14.1f}{len(blobs) / t:>8.0f}")
+
+
+def _replica_worker(blobs: list, ready, done):
+    """One app.py replica: the module (Streamlit bare mode), its model, and a few scans through it."""
+    app = load_app()
+    list(neuroscan.score_images(blobs, app.load_model))
+    ready.put(os.getpid())
+    done.wait()    # stay alive until every replica of the row has been measured
+
+
+def bench_replicas(args):
+    ctx     = mp.get_context("spawn")
+    backend = os.environ.get("NEUROSCAN_BACKEND", "keras")
+    blobs   = []
+    for seed in range(8):
+        buf = io.BytesIO()
+        synthetic_mri(256, seed=seed).save(buf, "PNG")
+        blobs.append(buf.getvalue())
+    sock = os.path.join(tempfile.mkdtemp(), "model.sock")
+    print(f"{backend} backend · {os.cpu_count()} CPUs")
+
+    print(f"{'mode':<22}{'replicas':>9}{'RSS/replica':>12}{'server RSS':>11}{'total RSS':>10}{'total PSS':>10}")
+    per_replica = None
+    for mode in ("own model", "model_server.py"):
+        server = None
+        if mode == "model_server.py":
+            here   = os.path.dirname(os.path.abspath(__file__))
+            server = subprocess.Popen([sys.executable, os.path.join(here, "model_server.py"), "--socket", sock],
+                                      stderr=subprocess.DEVNULL)
+            while not os.path.exists(sock):
+                time.sleep(0.2)
+            time.sleep(0.5)
+            os.environ["NEUROSCAN_MODEL_SOCKET"] = sock    # inherited by the spawned replicas
+        for replicas in (1, 2, 4, 8):
+            with open("/proc/meminfo") as f:
+                available = next(int(line.split()[1]) for line in f if line.startswith("MemAvailable")) / 1e3
+            if per_replica and per_replica * replicas > available:
+                print(f"{mode:<22}{replicas:>9}   skipped — needs ~{per_replica * replicas:,.0f} MB, "
+                      f"{available:,.0f} MB available")
+                continue
+            ready, done = ctx.Queue(), ctx.Event()
+            procs = [ctx.Process(target=_replica_worker, args=(blobs, ready, done)) for _ in range(replicas)]
+            for proc in procs:
+                proc.start()
+            for _ in procs:
+                ready.get()
+            usage  = [memory_mb(proc.pid) for proc in procs]
+            served = memory_mb(server.pid) if server else (0.0, 0.0)
+            done.set()
+            for proc in procs:
+                proc.join()
+            rss = sum(u[0] for u in usage)
+            pss = sum(u[1] for u in usage) + served[1]
+            if mode == "own model":
+                per_replica = pss / replicas
+            print(f"{mode:<22}{replicas:>9}{rss / replicas:>12.0f}{served[0]:>11.0f}"
+                  f"{rss + served[0]:>10.0f}{pss:>10.0f}")
+        if server:
+            del os.environ["NEUROSCAN_MODEL_SOCKET"]
+            server.terminate()
+            server.wait()
+
+
+def bench_bulk(args):
+    app  = load_app()
+    port = 8025
+    sink = smtp_sink(port)
+    stages  = list(app.LABEL_MAP.values())
+    records = [{"name": f"Patient {i}", "age": "70", "recipient": f"patient{i}@example.org",
+                "stage": stages[i % 4], "probs": {k: (70.0 if k == stages[i % 4] else 10.0) for k in stages}}
+               for i in range(args.n)]
+
+    def one_connection_per_email():
+        # What the original send_email() did for every click
+        for rec in records:
+            html = app.build_email_html(rec["name"], rec["age"], rec["stage"], 70.0, rec["probs"])
+            with smtplib.SMTP("127.0.0.1", port) as s:
+                s.login("clinic@example.org", "secret")
+                s.sendmail("clinic@example.org", rec["recipient"],
+                           app.build_message("clinic@example.org", rec["recipient"], "NeuroScan AI", html))
+
+    print(f"{'mode':<34}{'total s':>9}{'emails/s':>10}")
+    t = best_of(one_connection_per_email, 1)
+    print(f"{'new connection per email':<34}{t:>9.2f}{args.n / t:>10.1f}")
+    for workers, rate in ((1, 0), (2, 0), (4, 0), (4, 50)):
+        email_queue = app.EmailQueue(workers=workers, host="127.0.0.1", port=port, use_ssl=False, rate=rate)
+        t0     = time.perf_counter()
+        report = app.send_bulk_emails("clinic@example.org", "secret", records, email_queue)
+        t      = time.perf_counter() - t0
+        assert all(r["Status"] == "sent" for r in report), report[:3]
+        label  = f"send_bulk_emails, {workers} conn" + (f", {rate:g}/s cap" if rate else "")
+        print(f"{label:<34}{t:>9.2f}{args.n / t:>10.1f}")
+    sink.stop()
+
+
+BENCHMARKS = {
+    "batch":      bench_batch,
+    "preprocess": bench_preprocess,
+    "validate":   bench_validate,
+    "backends":   bench_backends,
+    "warmup":     bench_warmup,
+    "email":      bench_email,
+    "groq":       bench_groq,
+    "stream":     bench_stream,
+    "chatcache":  bench_chat_cache,
+    "chatwindow": bench_chat_window,
+    "trends":     bench_trends,
+    "trendengine": bench_trend_engine,
+    "store":      bench_store,
+    "columns":    bench_columns,
+    "import":     bench_import,
+    "partition":  bench_partition,
+    "score":      bench_score,
+    "decodepool": bench_decode_pool,
+    "serve":      bench_serve,
+    "replicas":   bench_replicas,
+    "shm":        bench_shm,
+    "bulk":       bench_bulk,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NeuroScan AI benchmarks")
+    parser.add_argument("name", choices=BENCHMARKS)
+    parser.add_argument("-n", type=int, default=64, help="number of synthetic scans")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
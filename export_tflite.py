@@ -0,0 +1,49 @@
+"""
+Export alzheimer_model.keras to TensorFlow Lite for the lightweight CPU backend.
+
+    python export_tflite.py                    # fp32, fp16 and int8 variants
+    python export_tflite.py --variants fp16
+
+Writes alzheimer_model.<variant>.tflite next to app.py. Select one at
+startup with NEUROSCAN_BACKEND=tflite-fp16 (or tflite-fp32 / tflite-int8).
+"""
+import argparse
+import os
+import time
+
+HERE     = os.path.dirname(os.path.abspath(__file__))
+VARIANTS = ("fp32", "fp16", "int8")
+
+
+def convert(model, variant: str) -> bytes:
+    """
+    fp32 — plain conversion
+    fp16 — weights stored as float16, computed in float32
+    int8 — dynamic-range quantization: int8 weights, float activations
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if variant == "fp16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    return converter.convert()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Keras model to TFLite")
+    parser.add_argument("--model", default=os.path.join(HERE, "alzheimer_model.keras"))
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    model = tf.keras.models.load_model(args.model)
+    for variant in args.variants:
+        t0   = time.perf_counter()
+        blob = convert(model, variant)
+        path = os.path.join(HERE, f"alzheimer_model.{variant}.tflite")
+        with open(path, "wb") as f:
+            f.write(blob)
+        print(f"✅ {variant}: {path} ({len(blob) / 1e6:.1f} MB, {time.perf_counter() - t0:.0f}s)")
@@ -0,0 +1,93 @@
+"""
+NeuroScan AI — shared model process for several app.py replicas on one host.
+
+    python model_server.py                                   # /tmp/neuroscan-model.sock
+    NEUROSCAN_MODEL_SOCKET=/tmp/neuroscan-model.sock streamlit run app.py --server.port 8501
+    NEUROSCAN_MODEL_SOCKET=/tmp/neuroscan-model.sock streamlit run app.py --server.port 8502
+
+Loads the model once. Replicas started with NEUROSCAN_MODEL_SOCKET skip TensorFlow
+entirely, validate and letterbox scans themselves, and send the float32 batches here
+(framing: see "Shared model process" in neuroscan.py). Scans from all connections go
+through one neuroscan.MicroBatcher, so sessions in different replicas share forward passes.
+"""
+import argparse
+import json
+import os
+import socketserver
+import struct
+import sys
+import time
+from concurrent.futures import wait
+
+import numpy as np
+
+import neuroscan
+
+
+class Handler(socketserver.BaseRequestHandler):
+    batcher = None    # set in __main__
+    hello   = b""
+
+    def handle(self):
+        sock = self.request
+        sock.sendall(self.hello)
+        pixels = np.empty((0, neuroscan.IMG_SIZE, neuroscan.IMG_SIZE, 3), dtype=np.float32)
+        header = bytearray(4)
+        while True:
+            try:
+                neuroscan.recv_into(sock, header)
+                n = struct.unpack("<I", header)[0]
+                if n > neuroscan.REMOTE_MAX_SCANS:
+                    return self.send_error(f"{n} scans in one request (max {neuroscan.REMOTE_MAX_SCANS})")
+                if len(pixels) < n:    # one receive buffer per connection, grown to the largest batch seen
+                    pixels = np.empty((n, neuroscan.IMG_SIZE, neuroscan.IMG_SIZE, 3), dtype=np.float32)
+                neuroscan.recv_into(sock, pixels[:n])
+            except ConnectionError:
+                return    # replica went away
+            futures = []
+            try:
+                futures.extend(self.batcher.submit(row) for row in pixels[:n])
+                probs = np.stack([f.result() for f in futures]) if n else np.empty((0, len(neuroscan.LABEL_MAP)))
+            except Exception as e:
+                wait(futures)    # the rest still read rows of `pixels` — let them finish before it's reused
+                self.send_error(f"{type(e).__name__}: {e}", close=False)
+                continue
+            sock.sendall(struct.pack("<i", n) + probs.astype("<f4").tobytes())    # 16 bytes a scan
+
+    def send_error(self, message: str, close: bool = True):
+        body = message.encode()
+        self.request.sendall(struct.pack("<iI", -1, len(body)) + body)
+        if close:
+            self.request.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the NeuroScan AI model to app.py replicas over a Unix socket")
+    parser.add_argument("--socket", default=neuroscan.MODEL_SOCKET or "/tmp/neuroscan-model.sock")
+    parser.add_argument("--backend", default=neuroscan.MODEL_BACKEND,
+                        help="keras, tflite-fp32, tflite-fp16 or tflite-int8 (default: NEUROSCAN_BACKEND)")
+    parser.add_argument("--max-batch", type=int, default=neuroscan.PREDICT_BATCH_SIZE,
+                        help="scans per forward pass across all replicas (default: NEUROSCAN_BATCH_SIZE)")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0,
+                        help="how long a forward pass waits for scans from other replicas")
+    args = parser.parse_args()
+
+    t0    = time.perf_counter()
+    model = neuroscan.load_backend(args.backend)
+    info  = json.dumps({"backend": args.backend, "fingerprint": neuroscan.model_fingerprint(args.backend)}).encode()
+    Handler.hello   = struct.pack("<I", len(info)) + info
+    Handler.batcher = neuroscan.MicroBatcher(model, args.max_batch, args.max_wait_ms)
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)    # left behind by a previous run
+    server = socketserver.ThreadingUnixStreamServer(args.socket, Handler)
+    server.daemon_threads = True
+    print(f"Loaded {args.backend} model in {time.perf_counter() - t0:.1f}s — serving on {args.socket}",
+          file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
@@ -0,0 +1,682 @@
+"""
+NeuroScan AI — scan scoring library (no Streamlit).
+
+MRI validation, letterbox preprocessing, the Keras / TFLite backends and batched
+prediction, shared by app.py and the headless scorer:
+
+    import neuroscan
+    model = neuroscan.load_backend(neuroscan.MODEL_BACKEND)
+    for result in neuroscan.score_scans(neuroscan.iter_scan_paths(["scans/"]), model):
+        print(result["file"], result["label"], result["confidence"])
+
+or from the shell: python score_scans.py scans/ -o results.csv
+"""
+import functools
+import glob
+import io
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image, ImageChops
+
+
+# ── Constants ──────────────────────────────────────────────────
+LABEL_MAP = {
+    0: "NonDemented",
+    1: "VeryMildDemented",
+    2: "MildDemented",
+    3: "ModerateDemented",
+}
+
+# Display text, urgency and supplement protocol per stage (the app's reports, emails and the HTTP API)
+STAGE_DATA = {
+    "NonDemented": {
+        "label": "Non-Demented", "emoji": "🟢", "color": "#4ade80", "bg": "#052e16",
+        "description": "No signs of Alzheimer's detected. Brain function appears normal. Preventive supplementation is recommended to maintain cognitive health.",
+        "urgency": "Preventive Care",
+        "supplements": [
+            {"name": "Omega-3 (Fish Oil)",  "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Supports brain cell membrane integrity and cognitive longevity",            "type": "nutrient"},
+            {"name": "Beta-Carotene",       "dose": "2 mg",    "times": ["8:00 AM"],  "purpose": "Antioxidant precursor to Vitamin A; protects neurons",          "type": "nutrient"},
+            {"name": "Vitamin E",           "dose": "100 IU",  "times": ["1:00 PM"],  "purpose": "Neuroprotective antioxidant; protects cell membranes",     "type": "nutrient"},
+            {"name": "Choline",             "dose": "200 mg",  "times": ["8:00 AM"],  "purpose": "Precursor to acetylcholine; supports memory and learning",          "type": "nutrient"},
+            {"name": "Vitamin B12",         "dose": "250 mcg", "times": ["8:00 AM"],  "purpose": "Reduces homocysteine; supports myelin sheath and nerve conduction",            "type": "nutrient"},
+            {"name": "Curcumin (Turmeric)", "dose": "250 mg",  "times": ["8:00 PM"],  "purpose": "Mild anti-inflammatory; early amyloid plaque prevention", "type": "nutrient"},
+        ],
+    },
+    "VeryMildDemented": {
+        "label": "Very Mild Demented", "emoji": "🟡", "color": "#facc15", "bg": "#1c1400",
+        "description": "Very early-stage cognitive changes detected. Lifestyle modifications and increased nutritional support can significantly slow progression.",
+        "urgency": "Early Intervention Recommended",
+        "supplements": [
+            {"name": "Omega-3 (Fish Oil)",  "dose": "500 mg",  "times": ["8:00 AM"],  "purpose": "Reduces neuroinflammation; supports synaptic plasticity",           "type": "nutrient"},
+            {"name": "Vitamin E",           "dose": "200 IU",  "times": ["1:00 PM"],  "purpose": "Slows oxidative damage to neurons in early-stage decline",    "type": "nutrient"},
+            {"name": "Choline",             "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Boosts acetylcholine production for memory preservation",           "type": "nutrient"},
+            {"name": "Vitamin B12",         "dose": "500 mcg", "times": ["8:00 AM"],  "purpose": "Slows brain atrophy linked to B12 deficiency in early decline",          "type": "nutrient"},
+            {"name": "Curcumin (Turmeric)", "dose": "500 mg",  "times": ["8:00 PM"],  "purpose": "Anti-inflammatory; begins inhibiting amyloid-beta aggregation", "type": "nutrient"},
+        ],
+    },
+    "MildDemented": {
+        "label": "Mild Demented", "emoji": "🟠", "color": "#fb923c", "bg": "#1c0800",
+        "description": "Mild cognitive decline detected. Intensified nutritional protocol recommended alongside neurologist consultation.",
+        "urgency": "Medical Attention Required",
+        "supplements": [
+            {"name": "Omega-3 (Fish Oil)",  "dose": "500 mg",  "times": ["8:00 AM"],  "purpose": "DHA and EPA support for slowing grey matter loss and inflammation",      "type": "nutrient"},
+            {"name": "Vitamin E",           "dose": "200 IU",  "times": ["1:00 PM"],  "purpose": "Neuroprotection against free radical damage", "type": "nutrient"},
+            {"name": "Choline",             "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Supports declining cholinergic neurons; aids recall",       "type": "nutrient"},
+            {"name": "Vitamin B12",         "dose": "500 mcg", "times": ["8:00 AM"],  "purpose": "Repairs myelin damage; counters neurodegeneration",          "type": "nutrient"},
+            {"name": "Curcumin (Turmeric)", "dose": "500 mg",  "times": ["8:00 PM"],  "purpose": "Actively reduces amyloid plaques and tau tangles",           "type": "nutrient"},
+        ],
+    },
+    "ModerateDemented": {
+        "label": "Moderate Demented", "emoji": "🔴", "color": "#f87171", "bg": "#1c0000",
+        "description": "Significant cognitive impairment detected. Maximum nutritional support protocol initiated. Immediate specialist consultation required.",
+        "urgency": "URGENT — See Neurologist Immediately",
+        "supplements": [
+            {"name": "Omega-3 (Fish Oil)",  "dose": "500 mg",  "times": ["8:00 AM"],  "purpose": "DHA and EPA to slow advanced neuronal loss and inflammation",             "type": "nutrient"},
+            {"name": "Beta-Carotene",       "dose": "3 mg",    "times": ["8:00 AM"],  "purpose": "Antioxidant coverage for severe oxidative brain damage",            "type": "nutrient"},
+            {"name": "Vitamin E",           "dose": "200 IU",  "times": ["1:00 PM"],  "purpose": "Neuroprotective dose; slows advanced neurodegeneration",    "type": "nutrient"},
+            {"name": "Choline",             "dose": "250 mg",  "times": ["8:00 AM"],  "purpose": "Critical support for severely depleted cholinergic pathways",               "type": "nutrient"},
+            {"name": "Vitamin B12",         "dose": "500 mcg", "times": ["8:00 AM"],  "purpose": "B12 support for severely depleted neurological pathways",            "type": "nutrient"},
+            {"name": "Curcumin (Turmeric)", "dose": "500 mg",  "times": ["8:00 PM"],  "purpose": "Plaque and tangle inhibition in advanced Alzheimer's", "type": "nutrient"},
+        ],
+    },
+}
+
+IMG_SIZE = 224    # model input is 224×224 RGB
+
+# Inference backend: "keras" or a TFLite export — "tflite-fp32", "tflite-fp16", "tflite-int8"
+# (create the .tflite files with export_tflite.py)
+MODEL_BACKEND  = os.environ.get("NEUROSCAN_BACKEND", "keras")
+TFLITE_THREADS = int(os.environ.get("NEUROSCAN_TFLITE_THREADS", str(os.cpu_count() or 1)))
+BACKENDS       = ("keras", "tflite-fp32", "tflite-fp16", "tflite-int8")
+
+def model_path(backend: str = MODEL_BACKEND) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown model backend {backend!r} (NEUROSCAN_BACKEND / --backend): "
+                         f"use one of {', '.join(BACKENDS)}")
+    name = "alzheimer_model.keras" if backend == "keras" else f"alzheimer_model.{backend.split('-', 1)[1]}.tflite"
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+MODEL_PATH = model_path()
+
+# Scans per forward pass when several files are classified together
+PREDICT_BATCH_SIZE = int(os.environ.get("NEUROSCAN_BATCH_SIZE", "16"))
+
+# Longest side is_likely_mri() inspects; bigger images are point-sampled down to it
+VALIDATION_MAX_SIDE = 1024
+
+# Processes that decode + validate scans while the model runs (0 = all on the calling thread)
+DECODE_WORKERS = int(os.environ.get("NEUROSCAN_DECODE_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+
+
+# ── MRI Validation ─────────────────────────────────────────────
+def is_likely_mri(img: Image.Image) -> tuple:
+    """
+    Multi-heuristic check to determine if an image is likely a brain MRI scan.
+    Returns (is_valid: bool, reason: str, details: dict)
+    """
+    issues = []
+    details = {}
+
+    # Very large exports are point-sampled (nearest neighbour, no smoothing) to a bounded
+    # size; every check below is a pixel fraction or moment, which a uniform sample preserves.
+    step = -(-max(img.size) // VALIDATION_MAX_SIDE)
+    if step > 1:
+        img = img.resize((-(-img.width // step), -(-img.height // step)), Image.NEAREST)
+
+    # All statistics come from 256-bin histograms computed by Pillow in C —
+    # no float copies of the image are made.
+    gray_hist    = np.array((img if img.mode == "L" else img.convert("L")).histogram(), dtype=np.float64)
+    total_pixels = gray_hist.sum()
+    levels       = np.arange(256, dtype=np.float64)
+
+    # ── Check 1: Dark background ratio ──────────────────────────
+    # Brain MRIs have a large black/near-black background
+    dark_ratio  = gray_hist[:25].sum() / total_pixels
+    details["dark_ratio"] = dark_ratio
+    if dark_ratio < 0.20:
+        issues.append(f"insufficient dark background ({dark_ratio:.1%} < 20% expected for MRI)")
+
+    # ── Check 2: Colorfulness ────────────────────────────────────
+    # MRIs are grayscale; very colorful images are not MRIs
+    # std(r - g) = sqrt(E[(r-g)²] - (E[r] - E[g])²), from |r - g| and per-band histograms
+    if img.mode in ("L", "1"):
+        rg_diff = gb_diff = rg_abs = gb_abs = 0.0
+    else:
+        img_rgb  = img if img.mode == "RGB" else img.convert("RGB")
+        band     = np.array(img_rgb.histogram(), dtype=np.float64).reshape(3, 256) @ levels / total_pixels
+        r, g, b  = img_rgb.split()
+        rg_hist  = np.array(ImageChops.difference(r, g).histogram(), dtype=np.float64) / total_pixels
+        gb_hist  = np.array(ImageChops.difference(g, b).histogram(), dtype=np.float64) / total_pixels
+        rg_abs, gb_abs = rg_hist @ levels, gb_hist @ levels
+        rg_diff  = np.sqrt(max(rg_hist @ levels ** 2 - (band[0] - band[1]) ** 2, 0.0))
+        gb_diff  = np.sqrt(max(gb_hist @ levels ** 2 - (band[1] - band[2]) ** 2, 0.0))
+    color_score = rg_diff + gb_diff
+    details["color_score"] = color_score
+    if color_score > 25:
+        issues.append(f"image appears too colorful (score {color_score:.1f} > 25 expected for grayscale MRI)")
+
+    # ── Check 3: Grayscale channel similarity ────────────────────
+    # In a true grayscale image R ≈ G ≈ B
+    channel_diff = rg_abs + gb_abs
+    details["channel_diff"] = channel_diff
+    if channel_diff > 15:
+        issues.append(f"channels differ too much ({channel_diff:.1f} > 15) — likely a color photo, not an MRI")
+
+    # ── Check 4: Brightness variance (texture check) ─────────────
+    # MRIs have a distinct bright oval (brain) on a dark field
+    # A paper/document would be mostly uniform bright
+    gray_p          = gray_hist / total_pixels
+    mean_brightness = gray_p @ levels
+    std_brightness  = np.sqrt(max(gray_p @ (levels - mean_brightness) ** 2, 0.0))
+    details["mean_brightness"] = mean_brightness
+    details["std_brightness"]  = std_brightness
+
+    if mean_brightness > 200:
+        issues.append(f"image is too bright (mean {mean_brightness:.0f} > 200) — looks like a document or photo, not an MRI")
+
+    if std_brightness < 20:
+        issues.append(f"image has too little contrast (std {std_brightness:.1f} < 20) — MRIs have strong contrast between brain and background")
+
+    # ── Check 5: Bright region (brain) must exist ────────────────
+    # At least some pixels should be bright (the brain tissue)
+    bright_ratio  = gray_hist[101:].sum() / total_pixels
+    details["bright_ratio"] = bright_ratio
+    if bright_ratio < 0.05:
+        issues.append(f"too few bright pixels ({bright_ratio:.1%} < 5%) — no visible brain structure detected")
+    if bright_ratio > 0.80:
+        issues.append(f"too many bright pixels ({bright_ratio:.1%} > 80%) — likely a document or overexposed photo")
+
+    is_valid = len(issues) == 0
+    reason   = "; ".join(issues) if issues else "Image passed all MRI validation checks."
+    return is_valid, reason, details
+
+
+# ── Model loader ───────────────────────────────────────────────
+# TensorFlow is imported inside these loaders, not at the top of the file: the
+# import costs seconds and only scans need it, so the app's Symptom Tracker and
+# Pricing tabs render without it.
+class TFLiteModel:
+    """
+    TensorFlow Lite interpreter behind the same predict() call as a Keras model.
+    Uses the standalone LiteRT runtime when installed (no TensorFlow import at all),
+    otherwise the interpreter bundled with TensorFlow.
+    """
+
+    def __init__(self, path: str, num_threads: int = TFLITE_THREADS):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self._input  = self._interpreter.get_input_details()[0]["index"]
+        self._output = self._interpreter.get_output_details()[0]["index"]
+        self._batch  = None
+        self._lock   = threading.Lock()    # one interpreter is shared by all sessions
+
+    def predict(self, batch: np.ndarray, batch_size: int = None, verbose: int = 0) -> np.ndarray:
+        with self._lock:
+            if self._batch != len(batch):
+                self._interpreter.resize_tensor_input(self._input, list(batch.shape))
+                self._interpreter.allocate_tensors()
+                self._batch = len(batch)
+            self._interpreter.set_tensor(self._input, np.ascontiguousarray(batch, dtype=np.float32))
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output).copy()
+
+class KerasModel:
+    """
+    Keras model behind a tf.function with a fixed input signature. Keras predict()
+    rebuilds its data pipeline on every call; this graph is traced once and reused
+    for every batch size.
+    """
+
+    def __init__(self, model):
+        import tensorflow as tf
+        self.model    = model
+        self._predict = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec([None, IMG_SIZE, IMG_SIZE, 3], tf.float32)],
+        )
+
+    def predict(self, batch: np.ndarray, batch_size: int = None, verbose: int = 0) -> np.ndarray:
+        return self._predict(np.asarray(batch, dtype=np.float32)).numpy()
+
+def load_backend(backend: str):
+    """
+    Load the model for `backend` ("keras" or "tflite-<variant>") without caching,
+    then run a dummy scan through it so graph tracing and buffer allocation happen
+    here rather than on the first patient's scan.
+    """
+    if backend == "keras":
+        import tensorflow as tf
+        model = KerasModel(tf.keras.models.load_model(model_path(backend)))
+    else:
+        model = TFLiteModel(model_path(backend))
+    model.predict(np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32))
+    return model
+
+
+# ── Preprocessing ──────────────────────────────────────────────
+def _bilinear_taps(in_size: int, out_size: int):
+    """Source indices + weights for half-pixel-centre bilinear sampling (TF's resize kernel)."""
+    scale = np.float32(in_size) / np.float32(out_size)
+    src   = (np.arange(out_size, dtype=np.float32) + np.float32(0.5)) * scale - np.float32(0.5)
+    lo    = np.floor(src)
+    lerp  = (src - lo).astype(np.float32)
+    lo_i  = np.clip(lo, 0, in_size - 1).astype(np.intp)
+    hi_i  = np.clip(np.ceil(src), 0, in_size - 1).astype(np.intp)
+    return lo_i, hi_i, lerp
+
+@functools.lru_cache(maxsize=16)
+def _letterbox_plan(height: int, width: int):
+    """
+    Geometry of tf.image.resize_with_pad(img, 224, 224) for one input size,
+    computed in float32 exactly like TF so the resized box lands on the same pixels.
+    Returns (top, left, flat indices of the 4 bilinear taps, row weights, column weights).
+    """
+    f_h, f_w, f_t = np.float32(height), np.float32(width), np.float32(IMG_SIZE)
+    ratio = max(f_w / f_t, f_h / f_t)
+    rh_f, rw_f = f_h / ratio, f_w / ratio
+    top  = max(0, int(np.floor((f_t - rh_f) / np.float32(2))))
+    left = max(0, int(np.floor((f_t - rw_f) / np.float32(2))))
+
+    y0, y1, fy = _bilinear_taps(height, int(np.floor(rh_f)))
+    x0, x1, fx = _bilinear_taps(width,  int(np.floor(rw_f)))
+    taps = tuple((ys[:, None] * width + xs[None, :]).ravel() for ys in (y0, y1) for xs in (x0, x1))
+    return top, left, taps, fy[:, None, None], fx[None, :, None]
+
+def preprocess(img: Image.Image, out: np.ndarray = None) -> np.ndarray:
+    """
+    Letterbox-resize a scan to a (1, 224, 224, 3) float32 batch without TensorFlow.
+    Matches preprocess_tf() (bilinear, half-pixel centres, zero padding). Pass `out`
+    to write into a preallocated (1, 224, 224, 3) buffer, e.g. a slot of a batch.
+    """
+    # Grayscale scans are interpolated once and broadcast to the 3 RGB channels
+    arr = np.asarray(img) if img.mode == "L" else np.asarray(img.convert("RGB"))
+    top, left, taps, fy, fx = _letterbox_plan(arr.shape[0], arr.shape[1])
+    rh, rw = fy.shape[0], fx.shape[1]
+
+    flat = arr.reshape(arr.shape[0] * arr.shape[1], -1)
+    tl, tr, bl, br = (flat.take(t, axis=0).reshape(rh, rw, -1).astype(np.float32) for t in taps)
+    tr -= tl; tr *= fx; tr += tl    # upper row:  tl + (tr - tl) * fx
+    br -= bl; br *= fx; br += bl    # lower row:  bl + (br - bl) * fx
+    br -= tr; br *= fy; br += tr    # blend rows: upper + (lower - upper) * fy
+
+    if out is None:
+        out = np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+    else:
+        out.fill(0.0)
+    out[0, top:top + rh, left:left + rw] = br
+    return out
+
+def preprocess_tf(img: Image.Image) -> np.ndarray:
+    """Reference TensorFlow implementation of preprocess() — kept for parity checks."""
+    import tensorflow as tf
+    img    = img.convert("RGB")
+    tensor = tf.convert_to_tensor(np.array(img), dtype=tf.float32)
+    tensor = tf.image.resize_with_pad(tensor, 224, 224)
+    return np.expand_dims(tensor.numpy(), axis=0)
+
+def predict_batch(model, images: list, batch_size: int = PREDICT_BATCH_SIZE) -> list:
+    """
+    Classify many scans with one forward pass per micro-batch.
+    Returns one all_probs dict ({label: percent}) per image, in input order.
+    """
+    results = []
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        batch = np.empty((len(chunk), IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        for j, img in enumerate(chunk):
+            preprocess(img, out=batch[j:j + 1])
+        probs = model.predict(batch, batch_size=len(chunk), verbose=0)
+        results.extend(as_percentages(p) for p in probs)
+    return results
+
+def as_percentages(p: np.ndarray) -> dict:
+    """One row of model output as {label: percent}."""
+    return {LABEL_MAP[i]: float(p[i]) * 100 for i in range(4)}
+
+
+# ── Batch scoring ──────────────────────────────────────────────
+SCAN_EXTENSIONS = (".jpg", ".jpeg", ".png")    # what the MRI tab accepts
+
+def iter_scan_paths(sources):
+    """
+    Yield scan paths from directories (walked recursively, sorted), glob patterns
+    ("scans/**/*.png") and plain file paths, in the order given.
+    """
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(SCAN_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif glob.has_magic(source):
+            yield from sorted(path for path in glob.iglob(source, recursive=True) if os.path.isfile(path))
+        else:
+            yield source
+
+def prepare_scan(source, out: np.ndarray = None) -> tuple:
+    """
+    Read one scan (a path or the raw file bytes), validate it and letterbox it if valid.
+    Returns (validation, pixels, error): validation is is_likely_mri()'s tuple, pixels a
+    (224, 224, 3) float32 array or None, and error a message when the file can't be read.
+    With `out`, a (1, 224, 224, 3) buffer, valid pixels are written there and pixels is
+    a view of it. Module-level so DecodePool workers can run it.
+    """
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            validation = is_likely_mri(img)
+            pixels     = preprocess(img, out=out)[0] if validation[0] else None
+        return validation, pixels, None
+    except Exception as e:    # per-file boundary: Pillow also raises SyntaxError, EOFError, ... on corrupt files
+        return None, None, f"{type(e).__name__}: {e}"
+
+def _prepare_into_slot(source, ring: str, slots: int, slot: int) -> tuple:
+    """prepare_scan() in a DecodePool worker, letterboxing into a slot of the caller's shared-memory ring."""
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=ring)
+    try:
+        pixels = np.ndarray((slots, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32, buffer=shm.buf)
+        validation, written, error = prepare_scan(source, out=pixels[slot:slot + 1])
+        del pixels, written    # views must go before the mapping can close
+    finally:
+        shm.close()
+    return validation, validation is not None and validation[0], error
+
+class DecodePool:
+    """
+    Worker processes running prepare_scan() — decoding, validation, letterboxing — so
+    they overlap with the model running on the calling thread. imap() keeps at most
+    `max_pending` scans submitted but not yet consumed: when the model falls behind,
+    the workers wait instead of decoding the whole upload into memory.
+
+    Pixels come back through a ring of `max_pending` preallocated 224×224×3 float32
+    slots in shared memory, one ring per imap() call: a worker letterboxes straight into
+    its scan's slot and only the validation verdict is pickled. shared_memory=False
+    pickles each ~600 KB array back instead (kept for benchmarks.py).
+    """
+
+    def __init__(self, workers: int = DECODE_WORKERS, shared_memory: bool = True):
+        import concurrent.futures
+        import multiprocessing
+        self.workers       = workers
+        self.shared_memory = shared_memory
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn"))    # no fork() of a threaded server
+
+    def imap(self, sources, max_pending: int = None):
+        """
+        prepare_scan() over sources, in parallel, yielding results in input order. With
+        shared memory, pixels is a view of a ring slot that is reused once the next
+        result is requested — copy it out (e.g. into a batch) before then.
+        """
+        max_pending = max_pending or 4 * self.workers
+        if not self.shared_memory:
+            yield from self._imap(sources, max_pending, lambda i, source: (prepare_scan, source))
+            return
+
+        from multiprocessing import shared_memory
+        shm  = shared_memory.SharedMemory(create=True, size=max_pending * IMG_SIZE * IMG_SIZE * 3 * 4)
+        ring = np.ndarray((max_pending, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32, buffer=shm.buf)
+        try:
+            # Scan i goes to slot i % max_pending: by the time it's submitted, the scan
+            # that last used the slot has been yielded and copied out.
+            task = lambda i, source: (_prepare_into_slot, source, shm.name, max_pending, i % max_pending)
+            for i, (validation, written, error) in enumerate(self._imap(sources, max_pending, task)):
+                yield validation, ring[i % max_pending] if written else None, error
+        finally:
+            del ring
+            shm.close()
+            shm.unlink()
+
+    def _imap(self, sources, max_pending: int, task):
+        pending = deque()
+        try:
+            for i, source in enumerate(sources):
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+                pending.append(self._executor.submit(*task(i, source)))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:    # consumer stopped early
+                future.cancel()
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def score_images(sources, model, batch_size: int = PREDICT_BATCH_SIZE, pool: DecodePool = None):
+    """
+    Validate, letterbox and classify scans (paths or raw bytes), one forward pass per
+    micro-batch. Yields (validation, probs, error) per source in input order; probs is
+    None unless the scan passed validation. `model` is anything with predict(), or a
+    zero-argument function returning one, called at the first valid scan. With a pool,
+    reading and validation run in its workers while the model works on the last batch.
+    """
+    batch   = np.empty((batch_size, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+    pending = []    # [validation, probs, error] not yet yielded, in input order
+    slots   = []    # the pending items waiting on the model, one per batch row (emptied in place, never rebound)
+    if pool:
+        prepared = pool.imap(sources, max_pending=batch_size + 2 * pool.workers)
+    else:    # letterboxed straight into the next free batch row (read when the generator advances)
+        prepared = (prepare_scan(source, out=batch[len(slots):len(slots) + 1]) for source in sources)
+
+    def classify():
+        nonlocal model
+        if not slots:
+            return
+        if not hasattr(model, "predict"):
+            model = model()
+        for item, p in zip(slots, model.predict(batch[:len(slots)], batch_size=len(slots), verbose=0)):
+            item[1] = as_percentages(p)
+
+    for validation, pixels, error in prepared:
+        item = [validation, None, error]
+        if pixels is not None:
+            if not np.may_share_memory(pixels, batch):
+                batch[len(slots)] = pixels
+            slots.append(item)
+        pending.append(item)
+        if len(slots) == batch_size or not slots:
+            classify()
+            yield from map(tuple, pending)
+            pending.clear()
+            slots.clear()
+    classify()
+    yield from map(tuple, pending)
+
+def score_scans(paths, model, batch_size: int = PREDICT_BATCH_SIZE, pool: DecodePool = None):
+    """
+    score_images() over paths, as one flat result dict per path, in input order:
+        {"file", "valid", "label", "confidence", "probs", "reason", "details", "error"}
+    Only about a batch of pixels is held at a time, so any folder size fits in memory.
+    Unreadable files get "error" instead of raising.
+    """
+    paths = list(paths)
+    for path, (validation, probs, error) in zip(paths, score_images(paths, model, batch_size, pool)):
+        valid, reason, details = validation or (False, "", {})
+        label = max(probs, key=probs.get) if probs else None
+        yield {"file": str(path), "valid": valid, "label": label, "confidence": probs[label] if probs else None,
+               "probs": probs, "reason": reason, "details": {k: float(v) for k, v in details.items()},
+               "error": error}
+
+
+# ── Dynamic batching ───────────────────────────────────────────
+class MicroBatcher:
+    """
+    Collects single scans from many threads into one forward pass. The first scan to
+    arrive opens a batch; it runs once `max_batch` scans are waiting or `max_wait_ms`
+    has passed, whichever comes first, and each caller gets its own row of probabilities.
+    One thread owns the model, so backends that aren't thread-safe are fine too.
+    """
+
+    def __init__(self, model, max_batch: int = PREDICT_BATCH_SIZE, max_wait_ms: float = 5.0):
+        self.model, self.max_batch, self.max_wait = model, max_batch, max_wait_ms / 1000
+        self.batches = self.images = 0
+        self._queue  = queue.Queue()
+        self._batch  = np.empty((max_batch, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        threading.Thread(target=self._run, name="neuroscan-batcher", daemon=True).start()
+
+    def submit(self, pixels: np.ndarray):
+        """Queue one letterboxed (224, 224, 3) scan; returns a Future of its (4,) probability row."""
+        future = Future()
+        self._queue.put((pixels, future))
+        return future
+
+    def _collect(self) -> list:
+        items    = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            try:
+                items.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            futures = []    # one per filled batch row
+            for pixels, future in self._collect():
+                if not future.set_running_or_notify_cancel():
+                    continue    # caller gave up on it
+                try:
+                    self._batch[len(futures)] = pixels
+                except Exception as e:    # wrong shape / dtype: fail that caller alone
+                    future.set_exception(e)
+                    continue
+                futures.append(future)
+            if not futures:
+                continue
+            try:
+                probs = self.model.predict(self._batch[:len(futures)], batch_size=len(futures), verbose=0)
+                if len(probs) != len(futures):
+                    raise ValueError(f"model returned {len(probs)} rows for {len(futures)} scans")
+            except Exception as e:    # fail this batch's callers, keep serving
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images  += len(futures)
+            for future, p in zip(futures, probs):
+                future.set_result(p)
+
+
+# ── Shared model process ───────────────────────────────────────
+# With NEUROSCAN_MODEL_SOCKET set, app.py never imports TensorFlow: its sessions send
+# letterboxed batches to one model_server.py over a Unix socket, so replicas on a host
+# share a single copy of the model. Framing (little-endian):
+#   on connect  server → client   uint32 length + JSON {"backend", "fingerprint"}
+#   request     client → server   uint32 n + n×224×224×3 float32 pixels
+#   reply       server → client   int32 n + n×4 float32 probabilities,
+#                                 or int32 -1 + uint32 length + UTF-8 error message
+MODEL_SOCKET = os.environ.get("NEUROSCAN_MODEL_SOCKET", "")
+REMOTE_MAX_SCANS = 256    # per request (~150 MB of pixels); RemoteModel splits bigger batches
+
+def model_fingerprint(backend: str = MODEL_BACKEND) -> str:
+    """Cheap model version id (backend + size + mtime) — changes whenever the weights file is replaced."""
+    try:
+        info = os.stat(model_path(backend))
+    except OSError:
+        return "missing"
+    return f"{backend}-{info.st_size}-{info.st_mtime_ns}"
+
+def recv_into(sock: socket.socket, buf) -> None:
+    """Fill `buf` (bytearray or contiguous array) from the socket, without intermediate bytes objects."""
+    view = memoryview(buf)
+    view = view.cast("B") if view.nbytes else b""
+    while view:
+        n = sock.recv_into(view)
+        if not n:
+            raise ConnectionError("model server closed the connection")
+        view = view[n:]
+
+class RemoteModel:
+    """
+    predict() answered by model_server.py. Pixels are sent straight from the batch
+    array and probabilities received straight into the result array. Sessions run
+    on their own threads, so idle connections are pooled rather than shared: several
+    sessions can be waiting at once and the server batches them together.
+    """
+
+    def __init__(self, path: str = MODEL_SOCKET):
+        self.path  = path
+        self._idle = []
+        self._lock = threading.Lock()
+        self._release(self._connect())    # fail now if the server isn't running
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            size = bytearray(4)
+            recv_into(sock, size)
+            info = bytearray(struct.unpack("<I", size)[0])
+            recv_into(sock, info)
+        except OSError:
+            sock.close()
+            raise
+        self.info = json.loads(info)
+        return sock
+
+    def _release(self, sock: socket.socket):
+        with self._lock:
+            self._idle.append(sock)
+
+    @property
+    def fingerprint(self) -> str:
+        return "remote-" + self.info["fingerprint"]
+
+    def predict(self, batch: np.ndarray, batch_size: int = None, verbose: int = 0) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if not len(batch):
+            return np.empty((0, len(LABEL_MAP)), dtype=np.float32)
+        if len(batch) > REMOTE_MAX_SCANS:
+            return np.concatenate([self.predict(batch[i:i + REMOTE_MAX_SCANS])
+                                   for i in range(0, len(batch), REMOTE_MAX_SCANS)])
+        with self._lock:
+            sock = self._idle.pop() if self._idle else None
+        if sock is not None:
+            try:
+                return self._request(sock, batch)
+            except ConnectionError:    # pooled connection went stale (server restarted) — retry once
+                sock.close()
+        return self._request(self._connect(), batch)
+
+    def _request(self, sock: socket.socket, batch: np.ndarray) -> np.ndarray:
+        try:
+            sock.sendall(struct.pack("<I", len(batch)))
+            sock.sendall(memoryview(batch).cast("B"))
+            header = bytearray(4)
+            recv_into(sock, header)
+            n = struct.unpack("<i", header)[0]
+            if n < 0:
+                recv_into(sock, header)
+                message = bytearray(struct.unpack("<I", header)[0])
+                recv_into(sock, message)
+                self._release(sock)
+                raise RuntimeError(f"model server: {message.decode()}")
+            probs = np.empty((n, len(LABEL_MAP)), dtype=np.float32)
+            recv_into(sock, probs)
+        except OSError:
+            sock.close()
+            raise
+        self._release(sock)
+        return probs
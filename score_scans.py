@@ -0,0 +1,102 @@
+"""
+Score a folder of MRI scans without the Streamlit app.
+
+    python score_scans.py scans/                          # CSV on stdout
+    python score_scans.py scans/ "archive/**/*.png" -o results.csv
+    python score_scans.py scans/ -o results.jsonl --backend tflite-int8 --batch-size 32
+    python score_scans.py scans/ -o results.csv --workers 4       # decode in 4 processes
+
+Every scan goes through the same steps as the MRI tab — is_likely_mri(), letterboxing
+and batched prediction — and gets one output row: label, confidence, per-stage
+probabilities, validation verdict, reason and statistics. Progress and images/sec
+are printed to stderr.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+import neuroscan
+
+DETAIL_FIELDS = ("dark_ratio", "color_score", "channel_diff", "mean_brightness", "std_brightness", "bright_ratio")
+CSV_FIELDS    = (("file", "valid", "label", "confidence")
+                 + tuple(f"prob_{label}" for label in neuroscan.LABEL_MAP.values())
+                 + ("reason",) + DETAIL_FIELDS + ("error",))
+
+
+def csv_row(result: dict) -> dict:
+    """Flatten a score_scans() result into CSV_FIELDS (probabilities and statistics as columns)."""
+    row = {k: result[k] for k in ("file", "valid", "label", "confidence", "reason", "error")}
+    row.update({f"prob_{label}": p for label, p in (result["probs"] or {}).items()})
+    row.update({k: result["details"].get(k) for k in DETAIL_FIELDS})
+    return row
+
+
+class Progress:
+    """Running count and images/sec on one stderr line, redrawn at most every `every` seconds."""
+
+    def __init__(self, total: int, every: float = 1.0):
+        self.total, self.every = total, every
+        self.done = self.valid = self.errors = 0
+        self.t0   = self._drawn = time.perf_counter()
+
+    def update(self, result: dict):
+        self.done   += 1
+        self.valid  += result["label"] is not None
+        self.errors += result["error"] is not None
+        now = time.perf_counter()
+        if now - self._drawn >= self.every:
+            self._drawn = now
+            print(f"\r{self.done:,}/{self.total:,} scans · {self.done / (now - self.t0):.1f} img/s",
+                  end="", file=sys.stderr, flush=True)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.t0
+        print(f"\r✅ {self.done:,} scans in {elapsed:.1f}s — {self.done / elapsed if elapsed else 0:.1f} img/s · "
+              f"{self.valid:,} classified · {self.done - self.valid - self.errors:,} failed validation · "
+              f"{self.errors:,} unreadable", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score MRI scans headlessly with the NeuroScan AI model")
+    parser.add_argument("sources", nargs="+", help="scan files, directories (searched recursively) or glob patterns")
+    parser.add_argument("-o", "--out", default="-", help="output .csv or .jsonl file (default: CSV on stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="output format (default: from --out)")
+    parser.add_argument("--backend", default=neuroscan.MODEL_BACKEND,
+                        help="keras, tflite-fp32, tflite-fp16 or tflite-int8 (default: NEUROSCAN_BACKEND)")
+    parser.add_argument("--batch-size", type=int, default=neuroscan.PREDICT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=neuroscan.DECODE_WORKERS,
+                        help="decode/validation processes running alongside the model (0 = none; "
+                             "default: NEUROSCAN_DECODE_WORKERS)")
+    args = parser.parse_args()
+
+    paths = list(neuroscan.iter_scan_paths(args.sources))    # just the names — images are read one by one
+    if not paths:
+        parser.error("no scans found (looked for " + ", ".join(neuroscan.SCAN_EXTENSIONS) + ")")
+    fmt = args.format or ("jsonl" if args.out.endswith((".jsonl", ".ndjson")) else "csv")
+
+    t0    = time.perf_counter()
+    model = neuroscan.load_backend(args.backend)
+    print(f"Loaded {args.backend} model in {time.perf_counter() - t0:.1f}s — scoring {len(paths):,} scans",
+          file=sys.stderr)
+
+    pool = neuroscan.DecodePool(args.workers) if args.workers > 0 else None
+    out  = sys.stdout if args.out == "-" else open(args.out, "w", newline="", encoding="utf-8")
+    try:
+        writer = csv.DictWriter(out, CSV_FIELDS) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        progress = Progress(len(paths))
+        for result in neuroscan.score_scans(paths, model, batch_size=args.batch_size, pool=pool):
+            if writer:
+                writer.writerow(csv_row(result))
+            else:
+                out.write(json.dumps(result) + "\n")
+            progress.update(result)
+        progress.finish()
+    finally:
+        if pool:
+            pool.close()
+        if out is not sys.stdout:
+            out.close()
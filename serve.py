@@ -0,0 +1,128 @@
+"""
+NeuroScan AI — HTTP inference API (the Hospital plan's "API Access").
+
+    python serve.py                                   # http://127.0.0.1:8500
+    python serve.py --host 0.0.0.0 --port 8080 --backend tflite-fp16
+    curl --data-binary @scan.png http://127.0.0.1:8500/v1/classify
+
+POST /v1/classify takes one scan as the raw request body (PNG, JPEG, ...) and runs
+the MRI tab's steps — is_likely_mri(), letterboxing, the model — returning JSON:
+
+    {"valid": true, "reason": "...", "details": {...}, "label": "MildDemented",
+     "stage": "Mild Demented", "confidence": 71.3, "urgency": "Medical Attention Required",
+     "all_probs": {"NonDemented": 9.1, ...}}
+
+Scans that fail validation get 422 with the same fields (label etc. null); unreadable
+files 400. Nothing is stored between requests. Concurrent requests are batched: decoding
+runs on each request's thread, and neuroscan.MicroBatcher groups the scans into one
+forward pass per --max-batch scans or --max-wait-ms, whichever comes first.
+GET /healthz reports the backend and how many batches / scans it has run.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import neuroscan
+
+# Scans per forward pass, and how long the first scan of a batch waits for company
+SERVE_MAX_BATCH   = int(os.environ.get("NEUROSCAN_SERVE_BATCH", str(neuroscan.PREDICT_BATCH_SIZE)))
+SERVE_MAX_WAIT_MS = float(os.environ.get("NEUROSCAN_SERVE_WAIT_MS", "5"))
+
+MAX_UPLOAD_BYTES = 32 << 20    # larger bodies get 413 before being read
+REQUEST_TIMEOUT  = 60          # seconds a request waits for the model before 503
+
+
+def classify(body: bytes, batcher: neuroscan.MicroBatcher) -> tuple:
+    """Validate + classify one scan's bytes. Returns (HTTP status, JSON-able response)."""
+    validation, pixels, error = neuroscan.prepare_scan(body)
+    if error:
+        return 400, {"error": f"could not read image ({error.split(':')[0]})"}    # the rest names a BytesIO
+    valid, reason, details = validation
+    result = {"valid": valid, "reason": reason, "details": {k: float(v) for k, v in details.items()},
+              "label": None, "stage": None, "confidence": None, "urgency": None, "all_probs": None}
+    if not valid:
+        return 422, result
+    probs = neuroscan.as_percentages(batcher.submit(pixels).result(timeout=REQUEST_TIMEOUT))
+    label = max(probs, key=probs.get)
+    stage = neuroscan.STAGE_DATA[label]
+    result.update(label=label, stage=stage["label"], confidence=probs[label],
+                  urgency=stage["urgency"], all_probs=probs)
+    return 200, result
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"    # keep-alive: clients reuse one connection per worker
+    wbufsize = 1 << 16               # one write per reply — unbuffered writes hit Nagle/delayed-ACK stalls
+    batcher  = None                  # set in __main__
+    backend  = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        out = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_GET(self):
+        if self.path != "/healthz":
+            return self.send_json(404, {"error": f"no such endpoint: GET {self.path}"})
+        self.send_json(200, {"status": "ok", "backend": self.backend, "max_batch": self.batcher.max_batch,
+                             "max_wait_ms": self.batcher.max_wait * 1000,
+                             "batches": self.batcher.batches, "scans": self.batcher.images})
+
+    def do_POST(self):
+        if self.path != "/v1/classify":
+            return self.send_json(404, {"error": f"no such endpoint: POST {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True    # can't tell where the body ends
+            return self.send_json(400, {"error": "invalid Content-Length"})
+        if not length:
+            return self.send_json(400, {"error": "send the scan as the request body"})
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True    # body left unread
+            return self.send_json(413, {"error": f"scan larger than {MAX_UPLOAD_BYTES >> 20} MB"})
+        try:
+            self.send_json(*classify(self.rfile.read(length), self.batcher))
+        except TimeoutError:
+            self.send_json(503, {"error": "model busy, try again"})
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve NeuroScan AI classification over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument("--backend", default=neuroscan.MODEL_BACKEND,
+                        help="keras, tflite-fp32, tflite-fp16 or tflite-int8 (default: NEUROSCAN_BACKEND)")
+    parser.add_argument("--max-batch", type=int, default=SERVE_MAX_BATCH,
+                        help="scans per forward pass (default: NEUROSCAN_SERVE_BATCH)")
+    parser.add_argument("--max-wait-ms", type=float, default=SERVE_MAX_WAIT_MS,
+                        help="how long a batch waits to fill up (default: NEUROSCAN_SERVE_WAIT_MS)")
+    args = parser.parse_args()
+
+    t0    = time.perf_counter()
+    model = neuroscan.load_backend(args.backend)
+    Handler.backend = args.backend
+    Handler.batcher = neuroscan.MicroBatcher(model, args.max_batch, args.max_wait_ms)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Loaded {args.backend} model in {time.perf_counter() - t0:.1f}s — serving on "
+          f"http://{args.host}:{args.port}/v1/classify (batches of ≤{args.max_batch}, ≤{args.max_wait_ms:g} ms wait)",
+          file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
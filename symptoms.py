@@ -0,0 +1,224 @@
+"""
+NeuroScan AI — symptom log columns and trend facts (no Streamlit).
+
+SymptomColumns, the compact columnar window app.py's SymptomStore caches per
+(patient, start), and symptom_trends(), the deterministic numbers behind the
+Trend Analysis tab. Kept out of app.py so the class is defined once per process
+rather than once per Streamlit rerun — cached windows from an earlier run are
+still instances of it.
+"""
+import operator
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# ── Symptom log columns ────────────────────────────────────────
+SYMPTOM_COLUMNS      = ("patient_id", "date", "patient_name", "memory", "confusion", "mood", "tasks", "sleep", "overall", "notes")
+SYMPTOM_TEXT_COLUMNS = {"patient_id", "patient_name", "notes"}
+SYMPTOM_SCORES       = ("memory", "confusion", "mood", "tasks", "sleep", "overall")
+
+
+class SymptomColumns:
+    """
+    Compact columnar copy of symptom logs, sorted by (date, patient_id): int32 day
+    ordinals, an int8 score matrix, int32 codes into a patient-ID category list, and
+    object arrays for names and notes. New logs are appended in place with amortized
+    growth; the frame/table/chart/records views are built once per change.
+    """
+
+    def __init__(self, rows=()):
+        self.n        = 0
+        self._code    = {}    # patient_id → code, in first-seen order
+        self._day     = np.empty(0, np.int32)
+        self._scores  = np.empty((0, len(SYMPTOM_SCORES)), np.int8)
+        self._patient = np.empty(0, np.int32)
+        self._name    = np.empty(0, object)
+        self._notes   = np.empty(0, object)
+        self._views   = {}
+        self._lock    = threading.RLock()
+        self.append(rows)
+
+    @property
+    def day(self) -> np.ndarray:
+        return self._day[:self.n]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self._scores[:self.n]
+
+    @property
+    def categories(self) -> list:
+        return list(self._code)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def nbytes(self) -> int:
+        return sum(a[:self.n].nbytes for a in (self._day, self._scores, self._patient, self._name, self._notes))
+
+    def _reserve(self, size: int):
+        if size <= len(self._day):
+            return
+        size = max(size, 2 * len(self._day))
+        grow = lambda a: np.concatenate([a[:self.n], np.empty((size - self.n,) + a.shape[1:], a.dtype)])
+        self._day, self._scores, self._patient, self._name, self._notes = map(
+            grow, (self._day, self._scores, self._patient, self._name, self._notes))
+
+    def append(self, rows):
+        """Add rows (tuples in SYMPTOM_COLUMNS order). Keys must not already be present."""
+        rows = list(rows)
+        if not rows:
+            return
+        patient_id, date, name, *scores, notes = zip(*rows)
+        day = np.array(date, dtype="datetime64[D]").astype(np.int32)
+        with self._lock:
+            new = slice(self.n, self.n + len(rows))
+            self._reserve(new.stop)
+            self._day[new]     = day
+            self._scores[new]  = np.array(scores, dtype=np.int8).T
+            self._patient[new] = [self._code.setdefault(p, len(self._code)) for p in patient_id]
+            self._name[new]    = name
+            self._notes[new]   = notes
+            in_order = (self.n == 0 or day.min() >= self._day[self.n - 1]) and (np.diff(day) >= 0).all()
+            self.n   = new.stop
+            if not in_order:
+                ids   = np.array(self.categories, dtype=object)[self._patient[:self.n]]
+                order = np.lexsort((ids, self._day[:self.n]))
+                for a in (self._day, self._scores, self._patient, self._name, self._notes):
+                    a[:self.n] = a[:self.n][order]
+            self._views.clear()
+
+    def _view(self, name: str, build):
+        with self._lock:
+            if name not in self._views:
+                self._views[name] = build()
+            return self._views[name]
+
+    def frame(self) -> pd.DataFrame:
+        """Every column; "YYYY-MM-DD" dates, categorical patient IDs, int8 scores."""
+        return self._view("frame", lambda: pd.DataFrame({
+            "date":         self.day.astype("datetime64[D]").astype(str),
+            "patient_id":   pd.Categorical.from_codes(self._patient[:self.n], self.categories),
+            "patient_name": self._name[:self.n],
+            **{f: self.scores[:, j] for j, f in enumerate(SYMPTOM_SCORES)},
+            "notes":        self._notes[:self.n],
+        }))
+
+    def table(self) -> pd.DataFrame:
+        return self._view("table", lambda: self.frame().set_axis(
+            ["Date","Patient ID","Patient Name","Memory","Confusion","Mood","Tasks","Sleep","Overall","Notes"], axis=1))
+
+    def chart(self) -> pd.DataFrame:
+        return self._view("chart", lambda: self.frame()[["date","memory","confusion","mood","tasks","overall"]]
+                          .set_index("date").set_axis(["Memory Loss","Confusion","Mood Changes","Task Difficulty","Overall"], axis=1))
+
+    def trends(self) -> dict:
+        """symptom_trends() of these logs, computed once per change."""
+        return self._view("trends", lambda: symptom_trends(self))
+
+    def records(self) -> list:
+        """Plain dicts (Python ints and strs), as store.query() returns them."""
+        def build():
+            ids   = np.array(self.categories, dtype=object)[self._patient[:self.n]].tolist()
+            dates = self.day.astype("datetime64[D]").astype(str).tolist()
+            return [{"patient_id": p, "date": d, "patient_name": nm, **dict(zip(SYMPTOM_SCORES, sc)), "notes": nt}
+                    for p, d, nm, sc, nt in zip(ids, dates, self._name[:self.n].tolist(), self.scores.tolist(),
+                                                self._notes[:self.n].tolist())]
+        return self._view("records", build)
+
+
+# ── Symptom trends ─────────────────────────────────────────────
+TREND_FIELDS = {
+    "memory":    "Memory Loss",
+    "confusion": "Confusion",
+    "mood":      "Mood Changes",
+    "tasks":     "Daily Tasks Difficulty",
+    "sleep":     "Sleep Quality",
+    "overall":   "Overall Score",
+}
+TREND_WORSE_IF_HIGH = np.array([f not in ("sleep", "overall") for f in TREND_FIELDS])    # sleep/overall: 10 is best
+TREND_RECENT = 14    # entries behind "recent" slopes, and sent verbatim when there's no earlier report
+RISK_LEVELS  = ((75, "Critical"), (50, "High"), (25, "Moderate"), (0, "Low"))
+
+
+def symptom_trends(logs, window: int = 7, recent: int = TREND_RECENT) -> dict:
+    """
+    Deterministic trend facts for symptom logs (a list of dicts or SymptomColumns), all in vectorized NumPy:
+    per symptom the latest value, `window`-entry rolling mean, overall and recent
+    (last `recent` entries) least-squares slope per week, direction, and the single
+    strongest mean shift (change point) if it's significant; plus a 0–100 risk score.
+    """
+    fields = list(TREND_FIELDS)
+    if isinstance(logs, SymptomColumns):    # already typed and sorted
+        days = logs.day.astype(np.float64)
+        vals = logs.scores.astype(np.float64)
+    else:
+        days  = np.array([log["date"] for log in logs], dtype="datetime64[D]").astype(np.float64)
+        order = np.argsort(days, kind="stable")
+        days  = days[order]
+        vals  = np.array(list(map(operator.itemgetter(*fields), logs)), dtype=np.float64)[order]
+    bad    = np.where(TREND_WORSE_IF_HIGH, vals, 10 - vals)    # 0 = best, 10 = worst for every symptom
+    n      = len(vals)
+
+    csum    = np.vstack([np.zeros((1, len(fields))), np.cumsum(vals, axis=0)])
+    lo      = np.maximum(np.arange(1, n + 1) - window, 0)
+    rolling = (csum[1:] - csum[lo]) / (np.arange(1, n + 1) - lo)[:, None]
+
+    def weekly_slope(x, y):
+        x = x - x.mean()
+        return (x @ (y - y.mean(axis=0))) / (x @ x) * 7 if x @ x > 0 else np.zeros(y.shape[1])
+
+    slope        = weekly_slope(days, vals)
+    recent_slope = weekly_slope(days[-recent:], vals[-recent:])
+    recent_worse = np.where(TREND_WORSE_IF_HIGH, recent_slope, -recent_slope)
+
+    # Best single split per symptom: maximise the between-segment sum of squares (≥ 3 entries a side)
+    shift = [None] * len(fields)
+    if n >= 6:
+        k      = np.arange(3, n - 2)[:, None]
+        left   = csum[3:n - 2] / k
+        right  = (csum[n] - csum[3:n - 2]) / (n - k)
+        between = k * (n - k) / n * (left - right) ** 2
+        within  = ((vals - vals.mean(axis=0)) ** 2).sum(axis=0) - between
+        f_stat  = between / np.maximum(within / (n - 2), 1e-9)
+        best    = f_stat.argmax(axis=0)
+        for j in range(len(fields)):
+            b = best[j]
+            if f_stat[b, j] > 12 and abs(right[b, j] - left[b, j]) >= 1.0:
+                shift[j] = {"index": int(k[b, 0]), "date": str(np.datetime64(int(days[k[b, 0]]), "D")),
+                            "before": float(left[b, j]), "after": float(right[b, j])}
+
+    # Risk: current level 50%, recent worsening 30%, recent shifts for the worse 20%
+    level     = bad[-window:].mean(axis=0).mean() / 10
+    worsening = np.clip(recent_worse, 0, 2).mean() / 2
+    shifts    = np.mean([
+        s is not None and s["index"] >= n - recent
+        and (s["after"] - s["before"]) * (1 if TREND_WORSE_IF_HIGH[j] else -1) > 0
+        for j, s in enumerate(shift)
+    ])
+    score     = float(round(100 * (0.5 * level + 0.3 * worsening + 0.2 * shifts), 1))
+    risk      = next(name for floor, name in RISK_LEVELS if score >= floor)
+
+    symptoms = {}
+    for j, field in enumerate(fields):
+        direction = "worsening" if recent_worse[j] > 0.25 else "improving" if recent_worse[j] < -0.25 else "stable"
+        symptoms[field] = {
+            "name":         TREND_FIELDS[field],
+            "latest":       float(vals[-1, j]),
+            "rolling":      float(rolling[-1, j]),
+            "mean":         float(vals[:, j].mean()),
+            "slope":        float(slope[j]),
+            "recent_slope": float(recent_slope[j]),
+            "direction":    direction,
+            "change_point": shift[j],
+        }
+    return {
+        "entries":    n,
+        "first":      str(np.datetime64(int(days[0]), "D")),
+        "last":       str(np.datetime64(int(days[-1]), "D")),
+        "risk_score": score,
+        "risk_level": risk,
+        "symptoms":   symptoms,
+    }